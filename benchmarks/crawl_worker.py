@@ -0,0 +1,207 @@
+import json
+import os
+import resource
+import statistics
+import sys
+import time
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROJECT_DIR = os.path.join(ROOT_DIR, 'jobs_project')
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, PROJECT_DIR)
+os.environ.setdefault('SCRAPY_SETTINGS_MODULE', 'jobs_project.settings')
+
+# runs first in ITEM_PIPELINES so its timestamps cover every pipeline after it
+LATENCY_PROBE_PRIORITY = 1
+
+'''
+One benchmark run in a fresh interpreter, started by run_benchmark.py with the path of a json config:
+crawls the feed directory with JobProjectSpider and the configured pipelines, exports the collection
+with query.export_jobs and writes the measurements to config['result_file']
+A separate process per run keeps the peak RSS and the connector globals of the runs apart
+'''
+
+"""
+    Item pipeline timing every item from the first pipeline until the item_scraped / item_dropped /
+    item_error signal, i.e. the time it spent in the dedup and MongoDB pipelines including the waits
+    for their batches.
+"""
+class LatencyProbePipeline:
+    def __init__(self):
+        self.started_at = {}
+        self.latencies = []
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        from scrapy import signals
+        probe = cls()
+        crawler.signals.connect(probe.item_finished, signal=signals.item_scraped)
+        crawler.signals.connect(probe.item_finished, signal=signals.item_dropped)
+        crawler.signals.connect(probe.item_finished, signal=signals.item_error)
+        crawler.benchmark_probe = probe
+        return probe
+
+    def process_item(self, item):
+        self.started_at[id(item)] = time.perf_counter()
+        return item
+
+    def item_finished(self, item, **kwargs):
+        started_at = self.started_at.pop(id(item), None)
+        if started_at is not None:
+            self.latencies.append(time.perf_counter() - started_at)
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+def latency_summary(latencies):
+    latencies = sorted(latencies)
+    if not latencies:
+        return {'count': 0, 'p50_ms': None, 'p99_ms': None, 'mean_ms': None, 'max_ms': None}
+    return {
+        'count': len(latencies),
+        'p50_ms': round(statistics.median(latencies) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 3),
+        'max_ms': round(latencies[-1] * 1000, 3),
+    }
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+'''
+Replaces the MongoDB and Redis clients of the sync connectors with mongomock and fakeredis,
+so a run needs no servers. Only the sync pipelines work with these stand-ins.
+No index is created: mongomock checks a unique index by scanning the collection on every insert,
+which made the runs quadratic and measured mongomock instead of the pipelines. The duplicates
+are dropped by the Redis dedup before they reach MongoDB anyway.
+'''
+def use_memory_backend():
+    try:
+        import fakeredis
+        import mongomock
+    except ImportError as e:
+        raise SystemExit(f"The memory backend needs mongomock and fakeredis (pip install mongomock fakeredis): {e}")
+    import mongomock.collection
+    from infra import mongodb_connector, redis_connector
+
+    # pymongo >= 4.11 passes sort to UpdateOne, which mongomock does not know about yet
+    add_update = mongomock.collection.BulkOperationBuilder.add_update
+    def add_update_without_sort(self, *args, sort=None, **kwargs):
+        return add_update(self, *args, **kwargs)
+    mongomock.collection.BulkOperationBuilder.add_update = add_update_without_sort
+
+    def create_index_skipped(self, keys, **kwargs):
+        return kwargs.get('name') or str(keys)
+    def create_indexes_skipped(self, indexes, *args, **kwargs):
+        return [index.document['name'] for index in indexes]
+    mongomock.collection.Collection.create_index = create_index_skipped
+    mongomock.collection.Collection.create_indexes = create_indexes_skipped
+
+    class AdminDatabase:
+        def command(self, *args, **kwargs):
+            return {'ok': 1.0}
+
+    class MemoryMongoClient(mongomock.MongoClient):
+        @property
+        def admin(self):
+            return AdminDatabase()
+
+        def close(self):
+            pass
+
+    mongo_client = MemoryMongoClient()
+    mongodb_connector.MongoClient = lambda *args, **kwargs: mongo_client
+    redis_server = fakeredis.FakeServer()
+    def connection_pool_from_url(url, **kwargs):
+        return fakeredis.FakeRedis(server=redis_server, decode_responses=kwargs.get('decode_responses', False)).connection_pool
+    redis_connector.redis.ConnectionPool.from_url = staticmethod(connection_pool_from_url)
+
+'''
+Drops what a previous run left in the benchmark database and Redis db, so every run starts empty
+'''
+def clean_backend(collection_name, spider_name):
+    from infra import mongodb_connector, redis_connector
+    db = mongodb_connector.get_db()
+    if db is not None:
+        db[collection_name].drop()
+    r = redis_connector.get_redis_connection()
+    if r is not None:
+        # seen ids of the insert mode and the content hashes of the upsert mode (jobs_project.pipelines)
+        for pattern in (f"{spider_name}:seen_ids*", f"{spider_name}:seen_content*"):
+            keys = list(r.scan_iter(match=pattern, count=1000))
+            for start in range(0, len(keys), 1000):
+                r.delete(*keys[start:start + 1000])
+
+def crawl(config):
+    from scrapy import signals
+    from scrapy.crawler import CrawlerProcess
+    from scrapy.utils.project import get_project_settings
+
+    settings = get_project_settings()
+    for name, value in config.get('settings', {}).items():
+        settings.set(name, value, priority='cmdline')
+    settings.set('INPUT_PATHS', [config['feed_dir']], priority='cmdline')
+    settings.set('INGEST_MANIFEST_ENABLED', False, priority='cmdline')
+    settings.set('LOG_LEVEL', config.get('log_level', 'WARNING'), priority='cmdline')
+    pipelines = settings.getdict('ITEM_PIPELINES')
+    pipelines[LatencyProbePipeline] = LATENCY_PROBE_PRIORITY
+    settings.set('ITEM_PIPELINES', pipelines, priority='cmdline')
+
+    # installs Scrapy's log handler before the infra modules are imported, as `scrapy crawl` does
+    process = CrawlerProcess(settings)
+    if config.get('backend', 'memory') == 'memory':
+        use_memory_backend()
+    if config.get('clean', True):
+        clean_backend(settings.get('MONGO_COLLECTION', 'testing_jobs'), 'JobProjectSpider')
+    crawler = process.create_crawler('JobProjectSpider')
+    timings = {}
+    crawler.signals.connect(lambda spider: timings.setdefault('opened', time.perf_counter()), signal=signals.spider_opened)
+    crawler.signals.connect(lambda spider, reason: timings.setdefault('closed', time.perf_counter()), signal=signals.spider_closed)
+    process.crawl(crawler)
+    started_at = time.perf_counter()
+    process.start()
+    crawl_seconds = timings.get('closed', time.perf_counter()) - timings.get('opened', started_at)
+
+    stats = crawler.stats.get_stats()
+    scraped = stats.get('item_scraped_count', 0)
+    dropped = stats.get('item_dropped_count', 0)
+    return {
+        'crawl_seconds': round(crawl_seconds, 3),
+        'items_scraped': scraped,
+        'items_dropped': dropped,
+        'items_per_sec': round((scraped + dropped) / crawl_seconds, 1) if crawl_seconds > 0 else None,
+        'pipeline_latency': latency_summary(crawler.benchmark_probe.latencies),
+        'crawl_peak_rss_mb': peak_rss_mb(),
+        'stats': {name: value for name, value in stats.items() if name.startswith(('mongodb/', 'bloom/', 'redis/', 'item_', 'parse/'))},
+    }
+
+def export(config):
+    import query
+    output_file = config['export_file']
+    started_at = time.perf_counter()
+    query.export_jobs(output_file=output_file, output_format=config.get('export_format', 'csv'))
+    export_seconds = time.perf_counter() - started_at
+    return {
+        'export_format': config.get('export_format', 'csv'),
+        'export_seconds': round(export_seconds, 3),
+        'export_bytes': os.path.getsize(output_file) if os.path.exists(output_file) else None,
+    }
+
+def main():
+    with open(sys.argv[1], 'r', encoding='utf-8') as f:
+        config = json.load(f)
+    # the spider resolves relative paths and writes its state from the project directory
+    os.chdir(PROJECT_DIR)
+    result = crawl(config)
+    if config.get('export', True):
+        result.update(export(config))
+    result['peak_rss_mb'] = peak_rss_mb()
+    with open(config['result_file'], 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2)
+
+if __name__ == "__main__":
+    main()
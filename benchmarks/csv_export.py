@@ -0,0 +1,103 @@
+import argparse
+import csv
+import filecmp
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, os.path.join(ROOT_DIR, 'jobs_project'))
+
+from feeds import generate_records
+
+'''
+Compares the rows/s of the query.py CSV encoder (CsvJobWriter) with the DictWriter encoder it replaced
+on synthetic documents shaped like the stored ones (feed records mapped onto JobsProjectItem), and checks
+that both write the same bytes. The documents are held in memory, so only the encoding and the file
+writes are measured, not MongoDB
+'''
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the CSV row encoder of query.py.")
+    parser.add_argument('-n', '--jobs', type=int, default=200000, help="number of documents (default: %(default)s)")
+    parser.add_argument('--seed', type=int, default=0, help="feed random seed (default: %(default)s)")
+    parser.add_argument('--runs', type=int, default=3, help="runs per encoder, the best one is reported (default: %(default)s)")
+    parser.add_argument('--output', help="also write the results as json to this file")
+    return parser.parse_args(argv)
+
+'''
+The stored documents: the feed records mapped like the spider does (floats, datetimes, lists)
+'''
+def make_documents(count, seed):
+    from jobs_project.item_mapper import JobFieldMapper
+    from jobs_project.items import JobsProjectItem
+    mapper = JobFieldMapper(JobsProjectItem)
+    return [mapper.map(record) for record in generate_records(count, seed=seed)]
+
+'''
+The encoder query.py used before CsvJobWriter: a dict per row, format_value_for_csv per field, DictWriter
+'''
+def write_legacy(documents, path, fieldnames, format_value_for_csv):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=fieldnames)
+        writer.writeheader()
+        for job_doc in documents:
+            row_data = {}
+            for field in fieldnames:
+                row_data[field] = format_value_for_csv(job_doc.get(field, None))
+            writer.writerow(row_data)
+
+def write_current(documents, path, writer_class):
+    writer = writer_class(path)
+    try:
+        for job_doc in documents:
+            writer.write(job_doc)
+    finally:
+        writer.close()
+
+def best_rate(encode, documents, path, runs):
+    best = None
+    for _ in range(runs):
+        started_at = time.perf_counter()
+        encode(path)
+        elapsed = time.perf_counter() - started_at
+        best = elapsed if best is None else min(best, elapsed)
+    return round(len(documents) / best, 1)
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    args = parse_args(argv)
+    import query
+
+    started_at = time.perf_counter()
+    documents = make_documents(args.jobs, args.seed)
+    logging.info(f"Built {len(documents)} documents in {time.perf_counter() - started_at:.1f}s")
+
+    with tempfile.TemporaryDirectory(prefix='jobs_csv_benchmark_') as work_dir:
+        legacy_path = os.path.join(work_dir, 'legacy.csv')
+        current_path = os.path.join(work_dir, 'current.csv')
+        legacy = best_rate(lambda path: write_legacy(documents, path, query.CSV_FIELDNAMES, query.format_value_for_csv), documents, legacy_path, args.runs)
+        current = best_rate(lambda path: write_current(documents, path, query.CsvJobWriter), documents, current_path, args.runs)
+        identical = filecmp.cmp(legacy_path, current_path, shallow=False)
+
+    results = {
+        'jobs': len(documents),
+        'legacy_rows_per_sec': legacy,
+        'current_rows_per_sec': current,
+        'speedup': round(current / legacy, 2),
+        'identical_output': identical,
+    }
+    if not identical:
+        logging.error("The encoders wrote different files")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
+    return 0 if identical else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+import argparse
+import copy
+import glob
+import gzip
+import json
+import logging
+import os
+import random
+from datetime import datetime, timedelta, timezone
+
+# the bundled feeds the synthetic records are shaped after
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'jobs_project', 'jobs_project', 'data')
+DATE_FORMAT = '%Y-%m-%dT%H:%M:%S+0000'
+
+'''
+Loads the data dicts of the bundled feeds, used as templates for the synthetic records
+'''
+def load_templates(template_dir=TEMPLATE_DIR):
+    templates = []
+    for file_path in sorted(glob.glob(os.path.join(template_dir, '*.json'))):
+        with open(file_path, 'r', encoding='utf-8') as f:
+            try:
+                jobs = json.load(f).get('jobs', [])
+            except ValueError as e:
+                logging.warning(f"Skipping template file {file_path}: {e}")
+                continue
+        templates.extend(job['data'] for job in jobs if isinstance(job, dict) and isinstance(job.get('data'), dict))
+    if not templates:
+        raise ValueError(f"No job templates found in {template_dir}")
+    return templates
+
+'''
+Yields jobs[*].data records: new postings built from a random template with a unique slug,
+exact copies of an earlier posting (duplicate_ratio) and changed versions of an earlier posting,
+same slug with a new title and update_date (update_ratio)
+The same seed always produces the same feed
+'''
+def generate_records(count, duplicate_ratio=0.0, update_ratio=0.0, seed=0, templates=None):
+    rng = random.Random(seed)
+    templates = templates or load_templates()
+    base_date = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    emitted = []
+    for index in range(count):
+        roll = rng.random()
+        if emitted and roll < duplicate_ratio:
+            yield rng.choice(emitted)
+            continue
+        if emitted and roll < duplicate_ratio + update_ratio:
+            record = dict(rng.choice(emitted))
+            record['title'] = f"{record.get('title', '')} (revised {index})"
+            record['update_date'] = (base_date + timedelta(minutes=index)).strftime(DATE_FORMAT)
+            yield record
+            continue
+        record = copy.deepcopy(rng.choice(templates))
+        record['slug'] = f"bench-{seed}-{index:09d}"
+        record['req_id'] = f"BENCH{index:09d}"
+        record['title'] = f"{record.get('title', 'Job')} #{index}"
+        created = base_date + timedelta(minutes=index)
+        record['create_date'] = created.strftime(DATE_FORMAT)
+        record['update_date'] = created.strftime(DATE_FORMAT)
+        if record.get('latitude') is not None:
+            record['latitude'] = round(float(record['latitude']) + rng.uniform(-0.5, 0.5), 6)
+        if record.get('longitude') is not None:
+            record['longitude'] = round(float(record['longitude']) + rng.uniform(-0.5, 0.5), 6)
+        emitted.append(record)
+        yield record
+
+'''
+Writes count records spread over files feed files in output_dir, {"jobs": [{"data": ...}, ...]} like
+the real feeds, one record per line so large feeds are never held in memory
+Returns the list of written paths
+'''
+def write_feeds(output_dir, count, files=1, duplicate_ratio=0.0, update_ratio=0.0, seed=0, compress=False):
+    os.makedirs(output_dir, exist_ok=True)
+    files = max(1, files)
+    per_file = -(-count // files)
+    records = generate_records(count, duplicate_ratio, update_ratio, seed)
+    paths = []
+    for file_index in range(files):
+        file_count = min(per_file, count - file_index * per_file)
+        if file_count <= 0:
+            break
+        path = os.path.join(output_dir, f"bench_{file_index:03d}.json" + ('.gz' if compress else ''))
+        opener = gzip.open if compress else open
+        with opener(path, 'wt', encoding='utf-8') as f:
+            f.write('{"jobs": [\n')
+            for record_index in range(file_count):
+                if record_index:
+                    f.write(',\n')
+                f.write(json.dumps({'data': next(records)}, ensure_ascii=False))
+            f.write('\n]}\n')
+        paths.append(path)
+    return paths
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic job feeds shaped like jobs[*].data of the bundled feeds.")
+    parser.add_argument('output_dir', help="directory the feed files are written to")
+    parser.add_argument('-n', '--jobs', type=int, default=10000, help="number of records (default: %(default)s)")
+    parser.add_argument('--files', type=int, default=1, help="number of feed files (default: %(default)s)")
+    parser.add_argument('--duplicate-ratio', type=float, default=0.1, help="share of exact copies of earlier records (default: %(default)s)")
+    parser.add_argument('--update-ratio', type=float, default=0.0, help="share of changed versions of earlier records (default: %(default)s)")
+    parser.add_argument('--seed', type=int, default=0, help="random seed (default: %(default)s)")
+    parser.add_argument('--gzip', action='store_true', help="write .json.gz files")
+    return parser.parse_args(argv)
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    args = parse_args()
+    paths = write_feeds(args.output_dir, args.jobs, args.files, args.duplicate_ratio, args.update_ratio, args.seed, args.gzip)
+    logging.info(f"Wrote {args.jobs} records to {len(paths)} files in {args.output_dir}")
@@ -0,0 +1,132 @@
+import argparse
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import redis
+
+from infra.redis_connector import REDIS_URL, REDIS_HASHED_SET_BUCKETS, hashed_member, hashed_set_keys
+
+# ids written per pipelined round trip while loading
+LOAD_BATCH_SIZE = 10000
+
+'''
+Compares the memory per seen id and the SISMEMBER latency of the plain dedup set
+against the hashed bucket sets (REDIS_DEDUP_STORAGE = 'hashed')
+Writes to scratch keys under --prefix on the given server and deletes them afterwards,
+point it at a disposable Redis, e.g. the docker compose one before a crawl
+'''
+def parse_args():
+    parser = argparse.ArgumentParser(description="Measure the Redis memory and lookup latency of the dedup id storages.")
+    parser.add_argument('--url', default=REDIS_URL, help="Redis url (default: REDIS_URI)")
+    parser.add_argument('--ids', type=int, default=1000000, help="number of ids to store (default: %(default)s)")
+    parser.add_argument('--lookups', type=int, default=20000, help="number of timed SISMEMBER calls, half hits half misses (default: %(default)s)")
+    parser.add_argument('--buckets', type=int, default=REDIS_HASHED_SET_BUCKETS, help="bucket sets of the hashed storage (default: %(default)s)")
+    parser.add_argument('--prefix', default='bench:dedup', help="scratch key prefix (default: %(default)s)")
+    parser.add_argument('--output', help="also write the results as json to this file")
+    return parser.parse_args()
+
+def make_id(index):
+    # shaped like the feed slugs, e.g. 25736-604612
+    return f"{25000 + index % 1000}-{index:09d}"
+
+def used_memory(r):
+    return r.info('memory')['used_memory']
+
+'''
+Deletes the scratch keys and waits until the server freed them, UNLINK frees large keys in a
+background thread and used_memory would still count them when the next storage is measured
+'''
+def delete_keys(r, pattern):
+    keys = list(r.scan_iter(match=pattern, count=1000))
+    for start in range(0, len(keys), 1000):
+        r.unlink(*keys[start:start + 1000])
+    while r.info('memory').get('lazyfree_pending_objects', 0):
+        time.sleep(0.05)
+
+def load(r, ids, key_and_member):
+    for start in range(0, len(ids), LOAD_BATCH_SIZE):
+        pipe = r.pipeline(transaction=False)
+        for item_id in ids[start:start + LOAD_BATCH_SIZE]:
+            key, member = key_and_member(item_id)
+            pipe.sadd(key, member)
+        pipe.execute()
+
+def time_lookups(r, lookups, key_and_member):
+    latencies = []
+    for item_id in lookups:
+        key, member = key_and_member(item_id)
+        started_at = time.perf_counter()
+        r.sismember(key, member)
+        latencies.append((time.perf_counter() - started_at) * 1e6)
+    latencies.sort()
+    return {
+        'p50_us': round(statistics.median(latencies), 1),
+        'p99_us': round(latencies[int(len(latencies) * 0.99) - 1], 1),
+        'mean_us': round(statistics.fmean(latencies), 1),
+    }
+
+def measure(r, name, ids, lookups, key_and_member, pattern):
+    delete_keys(r, pattern)
+    before = used_memory(r)
+    started_at = time.perf_counter()
+    load(r, ids, key_and_member)
+    load_seconds = time.perf_counter() - started_at
+    after = used_memory(r)
+    result = {
+        'storage': name,
+        'ids': len(ids),
+        'used_memory_bytes': after - before,
+        'bytes_per_id': round((after - before) / len(ids), 2),
+        'load_seconds': round(load_seconds, 2),
+        'sismember': time_lookups(r, lookups, key_and_member),
+    }
+    delete_keys(r, pattern)
+    logging.info(f"{name}: {result['bytes_per_id']} bytes per id, SISMEMBER p50 {result['sismember']['p50_us']}us p99 {result['sismember']['p99_us']}us")
+    return result
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    args = parse_args()
+    r = redis.Redis.from_url(args.url, decode_responses=True)
+    r.ping()
+
+    ids = [make_id(index) for index in range(args.ids)]
+    known = random.sample(ids, min(len(ids), args.lookups // 2))
+    lookups = known + [make_id(args.ids + index) for index in range(args.lookups - len(known))]
+    random.shuffle(lookups)
+
+    plain_key = f"{args.prefix}:seen_ids"
+    hashed_prefix = f"{args.prefix}:hashed"
+
+    def plain_key_and_member(item_id):
+        return plain_key, item_id
+
+    def hashed_key_and_member(item_id):
+        member = hashed_member(item_id)
+        return hashed_set_keys(hashed_prefix, member, args.buckets)[0], member
+
+    intset_entries = r.config_get('set-max-intset-entries').get('set-max-intset-entries')
+    logging.info(f"Storing {args.ids} ids, {args.ids / args.buckets:.0f} per bucket with set-max-intset-entries {intset_entries}")
+    results = {
+        'redis_version': r.info('server')['redis_version'],
+        'set_max_intset_entries': intset_entries,
+        'buckets': args.buckets,
+        'results': [
+            measure(r, 'set', ids, lookups, plain_key_and_member, plain_key),
+            measure(r, 'hashed', ids, lookups, hashed_key_and_member, f"{hashed_prefix}:h:*"),
+        ],
+    }
+    print(json.dumps(results, indent=2))
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+if __name__ == "__main__":
+    main()
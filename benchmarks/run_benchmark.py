@@ -0,0 +1,168 @@
+import argparse
+import json
+import logging
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from feeds import write_feeds
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCHMARK_DIR)
+RESULTS_DIR = os.path.join(BENCHMARK_DIR, 'results')
+# the containers backend never touches the databases of a real crawl
+BENCHMARK_MONGO_DB = 'jobs_benchmark'
+BENCHMARK_REDIS_URL = 'redis://localhost:6379/15'
+# metrics summarised over the runs, as the median
+SUMMARY_METRICS = ['items_per_sec', 'crawl_seconds', 'export_seconds', 'peak_rss_mb', 'crawl_peak_rss_mb']
+LATENCY_METRICS = ['p50_ms', 'p99_ms', 'mean_ms']
+
+'''
+Reproducible ingestion benchmark: generates a seeded synthetic feed, crawls it with JobProjectSpider
+and the configured pipelines --runs times (every run in a fresh process against emptied stores),
+exports the collection with query.py and saves items/s, per item pipeline latency, peak RSS and
+export time as json in benchmarks/results/
+'''
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the spider, both pipelines and the query.py export on a synthetic feed.")
+    parser.add_argument('-n', '--jobs', type=int, default=10000, help="number of feed records (default: %(default)s)")
+    parser.add_argument('--files', type=int, default=1, help="number of feed files (default: %(default)s)")
+    parser.add_argument('--duplicate-ratio', type=float, default=0.1, help="share of exact duplicate records (default: %(default)s)")
+    parser.add_argument('--update-ratio', type=float, default=0.0, help="share of changed versions of earlier records (default: %(default)s)")
+    parser.add_argument('--seed', type=int, default=0, help="feed random seed (default: %(default)s)")
+    parser.add_argument('--feed-dir', help="reuse the feed files in this directory instead of generating one")
+    parser.add_argument('--backend', choices=['memory', 'containers'], default='memory',
+                        help="memory: mongomock and fakeredis in process; containers: the MongoDB/Redis at --mongo-uri/--redis-url (default: %(default)s)")
+    parser.add_argument('--mongo-uri', default=os.getenv('MONGO_URI', 'mongodb://localhost:27017/'), help="MongoDB of the containers backend (default: MONGO_URI)")
+    parser.add_argument('--mongo-db', default=BENCHMARK_MONGO_DB, help="database used and emptied by the containers backend (default: %(default)s)")
+    parser.add_argument('--redis-url', default=BENCHMARK_REDIS_URL, help="Redis db used and emptied by the containers backend (default: %(default)s)")
+    parser.add_argument('-s', '--setting', action='append', default=[], metavar='NAME=VALUE',
+                        help="Scrapy setting override, repeatable, e.g. -s MONGO_WRITE_MODE=upsert -s PARSE_WORKERS=4")
+    parser.add_argument('--export-format', default='csv', help="query.py export format (default: %(default)s)")
+    parser.add_argument('--no-export', action='store_true', help="skip the query.py export")
+    parser.add_argument('--runs', type=int, default=3, help="number of runs (default: %(default)s)")
+    parser.add_argument('--label', default='baseline', help="name of the results file (default: %(default)s)")
+    parser.add_argument('--output', help="results file (default: benchmarks/results/<timestamp>-<label>.json)")
+    return parser.parse_args(argv)
+
+def parse_settings(pairs):
+    settings = {}
+    for pair in pairs:
+        name, sep, value = pair.partition('=')
+        if not sep:
+            raise SystemExit(f"Setting '{pair}' is not NAME=VALUE")
+        settings[name.strip()] = value
+    return settings
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT_DIR, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def package_versions():
+    versions = {'python': platform.python_version()}
+    for name in ('scrapy', 'pymongo', 'redis', 'mongomock', 'fakeredis'):
+        try:
+            versions[name] = __import__(name).__version__
+        except (ImportError, AttributeError):
+            versions[name] = None
+    return versions
+
+def worker_env(args):
+    env = dict(os.environ)
+    if args.backend == 'containers':
+        env['MONGO_URI'] = args.mongo_uri
+        env['MONGO_DB_NAME'] = args.mongo_db
+        env['REDIS_URI'] = args.redis_url
+    return env
+
+'''
+Runs one crawl + export in a crawl_worker.py process and returns its measurements
+'''
+def run_once(args, feed_dir, settings, work_dir, run_index):
+    config = {
+        'feed_dir': feed_dir,
+        'backend': args.backend,
+        'settings': settings,
+        'export': not args.no_export,
+        'export_format': args.export_format,
+        'export_file': os.path.join(work_dir, f"export_{run_index}.{args.export_format}"),
+        'result_file': os.path.join(work_dir, f"run_{run_index}.json"),
+    }
+    config_file = os.path.join(work_dir, f"config_{run_index}.json")
+    with open(config_file, 'w', encoding='utf-8') as f:
+        json.dump(config, f)
+    subprocess.run([sys.executable, os.path.join(BENCHMARK_DIR, 'crawl_worker.py'), config_file], env=worker_env(args), check=True)
+    with open(config['result_file'], 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+def median_of(values):
+    values = [value for value in values if value is not None]
+    return round(statistics.median(values), 3) if values else None
+
+def summarise(runs):
+    summary = {metric: median_of(run.get(metric) for run in runs) for metric in SUMMARY_METRICS}
+    summary['pipeline_latency'] = {metric: median_of(run['pipeline_latency'].get(metric) for run in runs) for metric in LATENCY_METRICS}
+    return summary
+
+def default_output_file(label):
+    timestamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+    return os.path.join(RESULTS_DIR, f"{timestamp}-{label}.json")
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    args = parse_args(argv)
+    settings = parse_settings(args.setting)
+    with tempfile.TemporaryDirectory(prefix='jobs_benchmark_') as work_dir:
+        feed_dir = args.feed_dir
+        if feed_dir is None:
+            feed_dir = os.path.join(work_dir, 'feed')
+            started_at = time.perf_counter()
+            write_feeds(feed_dir, args.jobs, args.files, args.duplicate_ratio, args.update_ratio, args.seed)
+            logging.info(f"Generated {args.jobs} records in {time.perf_counter() - started_at:.1f}s")
+        feed_dir = os.path.abspath(feed_dir)
+
+        runs = []
+        for run_index in range(args.runs):
+            result = run_once(args, feed_dir, settings, work_dir, run_index)
+            latency = result['pipeline_latency']
+            logging.info(f"Run {run_index + 1}/{args.runs}: {result['items_per_sec']} items/s, pipeline latency p50 {latency['p50_ms']}ms "
+                         f"p99 {latency['p99_ms']}ms, peak RSS {result['peak_rss_mb']}MB, export {result.get('export_seconds')}s")
+            runs.append(result)
+
+    results = {
+        'label': args.label,
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'git_commit': git_commit(),
+        'versions': package_versions(),
+        'backend': args.backend,
+        # the memory backend creates no index, see crawl_worker.use_memory_backend
+        'mongo_indexes': args.backend == 'containers',
+        'feed': {
+            'jobs': args.jobs if args.feed_dir is None else None,
+            'files': args.files,
+            'duplicate_ratio': args.duplicate_ratio,
+            'update_ratio': args.update_ratio,
+            'seed': args.seed,
+            'feed_dir': args.feed_dir,
+        },
+        'settings': settings,
+        'export_format': None if args.no_export else args.export_format,
+        'summary': summarise(runs),
+        'runs': runs,
+    }
+    output_file = args.output or default_output_file(args.label)
+    os.makedirs(os.path.dirname(os.path.abspath(output_file)), exist_ok=True)
+    with open(output_file, 'w', encoding='utf-8') as f:
+        json.dump(results, f, indent=2)
+    logging.info(f"Saved the results to {output_file}")
+    print(json.dumps(results['summary'], indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import time
+import zlib
+
+BENCHMARK_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(BENCHMARK_DIR)
+sys.path.insert(0, ROOT_DIR)
+
+from feeds import load_templates
+
+'''
+Measures the text codec of infra/text_codec.py on the descriptions of the bundled feeds: the dictionary
+is trained on one part of the distinct descriptions and measured on the others, so the ratio is the one
+of postings the dictionary has not seen. Reports the stored size against the plain text, per document
+zstd without a dictionary and zlib, and the encode/decode cost per document
+'''
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the dictionary text codec on the bundled job descriptions.")
+    parser.add_argument('--field', default='description', choices=['description', 'meta_data'], help="field to compress (default: %(default)s)")
+    parser.add_argument('--train-ratio', type=float, default=0.7, help="share of the distinct values the dictionary is trained on (default: %(default)s)")
+    parser.add_argument('--dict-size', type=int, default=32768, help="dictionary size in bytes (default: %(default)s)")
+    parser.add_argument('--level', type=int, default=3, help="zstd level (default: %(default)s)")
+    parser.add_argument('--rounds', type=int, default=50, help="encode/decode rounds over the measured values (default: %(default)s)")
+    parser.add_argument('--seed', type=int, default=0, help="split random seed (default: %(default)s)")
+    parser.add_argument('--output', help="also write the results as json to this file")
+    return parser.parse_args(argv)
+
+def distinct_values(field):
+    values = {}
+    for template in load_templates():
+        value = template.get(field)
+        if isinstance(value, (str, dict)) and value:
+            values[json.dumps(value, sort_keys=True)] = value
+    return list(values.values())
+
+def per_document_us(function, values, rounds):
+    started_at = time.perf_counter()
+    for _ in range(rounds):
+        for value in values:
+            function(value)
+    return round((time.perf_counter() - started_at) / (rounds * len(values)) * 1e6, 2)
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    args = parse_args(argv)
+    import zstandard
+    from infra import text_codec
+
+    values = distinct_values(args.field)
+    random.Random(args.seed).shuffle(values)
+    split = int(len(values) * args.train_ratio)
+    training, measured = values[:split], values[split:]
+    if not training or not measured:
+        logging.error(f"Not enough distinct {args.field} values to split ({len(values)})")
+        return 1
+
+    dictionary = zstandard.train_dictionary(args.dict_size, [text_codec.value_bytes(value)[1] for value in training], level=args.level)
+    codec = text_codec.TextCodec(dictionary.as_bytes(), 1, (args.field,), args.level)
+    plain = zstandard.ZstdCompressor(level=args.level)
+
+    raw = [text_codec.value_bytes(value)[1] for value in measured]
+    documents = [{args.field: value} for value in measured]
+    for document in documents:
+        codec.encode_document(document)
+    encoded = [document[args.field] for document in documents]
+    stored = sum(map(len, encoded))
+    raw_bytes = sum(map(len, raw))
+
+    results = {
+        'field': args.field,
+        'trained_on': len(training),
+        'measured': len(measured),
+        'dict_size': len(dictionary.as_bytes()),
+        'raw_bytes': raw_bytes,
+        'codec_bytes': stored,
+        'codec_ratio': round(stored / raw_bytes, 3),
+        'zstd_no_dictionary_ratio': round(sum(len(plain.compress(data)) for data in raw) / raw_bytes, 3),
+        'zlib_ratio': round(sum(len(zlib.compress(data)) for data in raw) / raw_bytes, 3),
+        'encode_us_per_doc': per_document_us(lambda value: codec.encode_document({args.field: value}), measured, args.rounds),
+        'decode_us_per_doc': per_document_us(lambda value: text_codec.decode_document({args.field: value}, None), encoded, args.rounds),
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    print(json.dumps(results, indent=2))
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
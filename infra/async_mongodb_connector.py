@@ -0,0 +1,164 @@
+import time
+import logging
+from pymongo import AsyncMongoClient
+from pymongo.errors import BulkWriteError, ConnectionFailure, ServerSelectionTimeoutError
+
+from infra.metrics import timed
+from infra.mongodb_connector import (
+    MONGO_URI, MONGO_DB_NAME, MONGO_MAX_POOL_SIZE, MONGO_MIN_POOL_SIZE, MONGO_SERVER_SELECTION_TIMEOUT_MS,
+    MONGO_CONNECT_TIMEOUT_MS, MONGO_SOCKET_TIMEOUT_MS, MONGO_HEALTH_CHECK_INTERVAL, upsert_operations,
+    inserted_log, upserted_log, write_errors_log,
+)
+
+logger = logging.getLogger(__name__)
+
+# asyncio counterpart of mongodb_connector, same configuration and return values,
+# every function is a coroutine running on the event loop of the asyncio reactor
+mongo_client = None
+last_health_check = 0.0
+
+'''
+Returns the long lived AsyncMongoClient, pinged again once MONGO_HEALTH_CHECK_INTERVAL seconds passed
+or after an operation failed with a connection error
+Returns None if the server could not be reached in MONGO_SERVER_SELECTION_TIMEOUT_MS
+'''
+async def get_mongo_client():
+    global mongo_client, last_health_check
+    if mongo_client is not None:
+        if time.monotonic() - last_health_check < MONGO_HEALTH_CHECK_INTERVAL:
+            return mongo_client
+        try:
+            await mongo_client.admin.command('ping')
+            last_health_check = time.monotonic()
+            return mongo_client
+        except (ConnectionFailure, ServerSelectionTimeoutError):
+            logger.warning("Exiting async MongoDB connection lost, trying to reconnect!")
+            await mongo_client.close()
+            mongo_client = None
+    try:
+        logger.info("Trying to connect to the MongoDB at %s (async)", MONGO_URI)
+        client = AsyncMongoClient(
+            MONGO_URI,
+            maxPoolSize=MONGO_MAX_POOL_SIZE,
+            minPoolSize=MONGO_MIN_POOL_SIZE,
+            serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+            connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+            socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+        )
+        await client.admin.command('ping')
+        mongo_client = client
+        last_health_check = time.monotonic()
+        logger.info("Successfully connected to MongoDB: %s (async)", MONGO_URI)
+        return mongo_client
+    except (ConnectionFailure, ServerSelectionTimeoutError) as e:
+        logger.error("Failed to connect to MongoServer %s: %s", MONGO_URI, e)
+        return None
+    except Exception as e:
+        logger.error("Failed to connect to the MongoServer %s: %s", MONGO_URI, e)
+        return None
+
+def mark_mongo_unhealthy():
+    global last_health_check
+    last_health_check = 0.0
+
+async def get_db():
+    client = await get_mongo_client()
+    if client is not None:
+        return client[MONGO_DB_NAME]
+    logger.error("Cannot get database as the async MongoDB client is not available")
+    return None
+
+'''
+Inserts the job dictionary, returns the InsertOneResult or None
+'''
+@timed('async_mongodb/insert_item')
+async def insert_item(item: dict, collection_name: str):
+    db = await get_db()
+    if db is not None:
+        try:
+            result = await db[collection_name].insert_one(item)
+            logger.debug("Inserted item with id %s into %s", result.inserted_id, collection_name)
+            return result
+        except ConnectionFailure as e:
+            mark_mongo_unhealthy()
+            logger.error("Lost MongoDB connection while inserting item into %s: %s", collection_name, e)
+        except Exception as e:
+            logger.error("Failed to insert item into %s: %s", collection_name, e)
+    return None
+
+'''
+Unordered insert_many, returns {'inserted', 'write_errors'} like mongodb_connector.insert_items or None
+'''
+@timed('async_mongodb/insert_items')
+async def insert_items(items: list, collection_name: str, ordered: bool = False):
+    if not items:
+        return {'inserted': 0, 'write_errors': []}
+    db = await get_db()
+    if db is not None:
+        try:
+            result = await db[collection_name].insert_many(items, ordered=ordered)
+            inserted_log.add(len(result.inserted_ids), collection_name)
+            return {'inserted': len(result.inserted_ids), 'write_errors': []}
+        except BulkWriteError as e:
+            details = e.details or {}
+            write_errors = details.get('writeErrors', [])
+            inserted_log.add(details.get('nInserted', 0), collection_name)
+            write_errors_log.add(len(write_errors), collection_name)
+            return {'inserted': details.get('nInserted', 0), 'write_errors': write_errors}
+        except ConnectionFailure as e:
+            mark_mongo_unhealthy()
+            logger.error("Lost MongoDB connection while inserting %s items into %s: %s", len(items), collection_name, e)
+        except Exception as e:
+            logger.error("Failed to insert %s items into %s: %s", len(items), collection_name, e)
+    return None
+
+'''
+Upserts matching on key_field, returns {'inserted', 'updated', 'matched', 'write_errors'} like
+mongodb_connector.upsert_items or None
+'''
+@timed('async_mongodb/upsert_items')
+async def upsert_items(items: list, collection_name: str, key_field: str, unset_fields=(), ordered: bool = False):
+    if not items:
+        return {'inserted': 0, 'updated': 0, 'matched': 0, 'write_errors': []}
+    db = await get_db()
+    if db is not None:
+        try:
+            result = await db[collection_name].bulk_write(upsert_operations(items, key_field, unset_fields), ordered=ordered)
+            upserted_log.add(result.upserted_count + result.modified_count, collection_name)
+            return {'inserted': result.upserted_count, 'updated': result.modified_count, 'matched': result.matched_count, 'write_errors': []}
+        except BulkWriteError as e:
+            details = e.details or {}
+            write_errors = details.get('writeErrors', [])
+            upserted_log.add(details.get('nUpserted', 0) + details.get('nModified', 0), collection_name)
+            write_errors_log.add(len(write_errors), collection_name)
+            return {'inserted': details.get('nUpserted', 0), 'updated': details.get('nModified', 0), 'matched': details.get('nMatched', 0), 'write_errors': write_errors}
+        except ConnectionFailure as e:
+            mark_mongo_unhealthy()
+            logger.error("Lost MongoDB connection while upserting %s items into %s: %s", len(items), collection_name, e)
+        except Exception as e:
+            logger.error("Failed to upsert %s items into %s: %s", len(items), collection_name, e)
+    return None
+
+'''
+Runs the query and returns the matching documents as a list, empty if it failed
+'''
+@timed('async_mongodb/find_item')
+async def find_item(query: dict, collection_name: str, projection: dict = None):
+    db = await get_db()
+    if db is not None:
+        try:
+            return await db[collection_name].find(query, projection).to_list(None)
+        except ConnectionFailure as e:
+            mark_mongo_unhealthy()
+            logger.error("Lost MongoDB connection while finding items in %s: %s", collection_name, e)
+        except Exception as e:
+            logger.error("Failed to find items in %s: %s", collection_name, e)
+    return []
+
+async def close_mongo_connection():
+    global mongo_client
+    for aggregated_log in (inserted_log, upserted_log, write_errors_log):
+        aggregated_log.flush()
+    if mongo_client:
+        await mongo_client.close()
+        mongo_client = None
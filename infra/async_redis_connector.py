@@ -0,0 +1,186 @@
+import logging
+import time
+import redis.asyncio as aioredis
+from redis.exceptions import ConnectionError, NoScriptError
+
+from infra.metrics import timed
+from infra.redis_connector import (
+    REDIS_URL, REDIS_MAX_CONNECTIONS, REDIS_SOCKET_TIMEOUT, REDIS_SOCKET_CONNECT_TIMEOUT, REDIS_HEALTH_CHECK_INTERVAL,
+    REDIS_HASHED_SET_BUCKETS, ADD_TO_WINDOWED_SET_SCRIPT, STORE_IF_CHANGED_SCRIPT, hashed_member, hashed_set_keys, hashed_set_pattern,
+    content_hash_entries, added_log,
+)
+
+logger = logging.getLogger(__name__)
+
+# asyncio counterpart of redis_connector for the dedup helpers, same configuration and return values,
+# every function is a coroutine running on the event loop of the asyncio reactor
+redis_client = None
+windowed_set_script_sha = None
+store_if_changed_script_sha = None
+
+'''
+Returns the long lived redis.asyncio client, None if the server could not be reached
+'''
+async def get_redis_connection():
+    global redis_client
+    if redis_client is not None:
+        return redis_client
+    client = None
+    try:
+        logger.info("Trying to create an async Redis Connection pool for the URL: %s", REDIS_URL)
+        client = aioredis.Redis(connection_pool=aioredis.ConnectionPool.from_url(
+            REDIS_URL,
+            decode_responses=True,
+            max_connections=REDIS_MAX_CONNECTIONS,
+            socket_timeout=REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=REDIS_SOCKET_CONNECT_TIMEOUT,
+            health_check_interval=REDIS_HEALTH_CHECK_INTERVAL,
+        ))
+        await client.ping()
+        redis_client = client
+        logger.info("Async Redis connection created")
+        return redis_client
+    except ConnectionError as e:
+        logger.error("Failed to create an async Redis connection: %s", e)
+    except Exception as e:
+        logger.error("Unexpected error while connecting to Redis: %s", e)
+    if client is not None:
+        await close_client(client)
+    return None
+
+'''
+Drops the client after a connection error, its pool is closed so the next call reconnects with a new one
+'''
+async def mark_redis_unhealthy():
+    global redis_client
+    client, redis_client = redis_client, None
+    if client is not None:
+        await close_client(client)
+
+async def close_client(client):
+    try:
+        # the pool was passed in explicitly, aclose() leaves it open unless asked to close it
+        await client.aclose(close_connection_pool=True)
+    except Exception as e:
+        logger.warning("Failed to close the async Redis connection pool: %s", e)
+
+'''
+SADD, returns True if the value was added, False if it was already present and None if Redis failed
+'''
+@timed('async_redis/add_to_set')
+async def add_to_set(set_name: str, value: str):
+    results = await add_many_to_set(set_name, [value])
+    return results[0] if results else None
+
+'''
+One pipelined SADD per value, returns a list of True/False per value or None if Redis failed
+'''
+@timed('async_redis/add_many_to_set')
+async def add_many_to_set(set_name: str, values: list):
+    if not values:
+        return []
+    r = await get_redis_connection()
+    if r:
+        try:
+            pipe = r.pipeline(transaction=False)
+            for value in values:
+                pipe.sadd(set_name, value)
+            results = [result == 1 for result in await pipe.execute()]
+            added_log.add(sum(results), set_name)
+            return results
+        except ConnectionError as e:
+            await mark_redis_unhealthy()
+            logger.error("Lost Redis connection while adding %s values to Redis set '%s': %s", len(values), set_name, e)
+        except Exception as e:
+            logger.error("Failed to add %s values to Redis set '%s': %s", len(values), set_name, e)
+    return None
+
+@timed('async_redis/add_to_hashed_set')
+async def add_to_hashed_set(set_name: str, value: str, **kwargs):
+    results = await add_many_to_hashed_set(set_name, [value], **kwargs)
+    return results[0] if results else None
+
+'''
+Hashed storage of redis_connector.add_many_to_hashed_set, the windowed script is loaded
+once and called with EVALSHA (loaded again if the server lost it)
+'''
+@timed('async_redis/add_many_to_hashed_set')
+async def add_many_to_hashed_set(set_name: str, values: list, buckets: int = REDIS_HASHED_SET_BUCKETS, expire_seconds: int = None, expire_windows: int = 4):
+    global windowed_set_script_sha
+    if not values:
+        return []
+    r = await get_redis_connection()
+    if r:
+        try:
+            for attempt in range(2):
+                now = time.time()
+                pipe = r.pipeline(transaction=False)
+                if expire_seconds:
+                    if windowed_set_script_sha is None:
+                        windowed_set_script_sha = await r.script_load(ADD_TO_WINDOWED_SET_SCRIPT)
+                    ttl = max(1, expire_seconds // expire_windows) * (expire_windows + 1)
+                    for value in values:
+                        member = hashed_member(value)
+                        keys = hashed_set_keys(set_name, member, buckets, expire_seconds, expire_windows, now)
+                        pipe.evalsha(windowed_set_script_sha, len(keys), *keys, member, ttl)
+                else:
+                    for value in values:
+                        member = hashed_member(value)
+                        pipe.sadd(hashed_set_keys(set_name, member, buckets)[0], member)
+                try:
+                    results = [result == 1 for result in await pipe.execute()]
+                except NoScriptError:
+                    windowed_set_script_sha = None
+                    if attempt:
+                        raise
+                    continue
+                added_log.add(sum(results), hashed_set_pattern(set_name))
+                return results
+        except ConnectionError as e:
+            await mark_redis_unhealthy()
+            logger.error("Lost Redis connection while adding %s hashed values to Redis sets '%s': %s", len(values), hashed_set_pattern(set_name), e)
+        except Exception as e:
+            logger.error("Failed to add %s hashed values to Redis sets '%s': %s", len(values), hashed_set_pattern(set_name), e)
+    return None
+
+'''
+Content keyed storage of redis_connector.store_many_if_changed, the script is loaded once
+and called with EVALSHA (loaded again if the server lost it)
+'''
+@timed('async_redis/store_many_if_changed')
+async def store_many_if_changed(hash_name: str, pairs: list, **kwargs):
+    global store_if_changed_script_sha
+    if not pairs:
+        return []
+    r = await get_redis_connection()
+    if r:
+        try:
+            entries, ttl = content_hash_entries(hash_name, pairs, **kwargs)
+            for attempt in range(2):
+                if store_if_changed_script_sha is None:
+                    store_if_changed_script_sha = await r.script_load(STORE_IF_CHANGED_SCRIPT)
+                pipe = r.pipeline(transaction=False)
+                for keys, field, value in entries:
+                    pipe.evalsha(store_if_changed_script_sha, len(keys), *keys, field, value, ttl)
+                try:
+                    results = [result == 1 for result in await pipe.execute()]
+                except NoScriptError:
+                    store_if_changed_script_sha = None
+                    if attempt:
+                        raise
+                    continue
+                added_log.add(sum(results), hash_name)
+                return results
+        except ConnectionError as e:
+            await mark_redis_unhealthy()
+            logger.error("Lost Redis connection while storing %s content hashes in '%s': %s", len(pairs), hash_name, e)
+        except Exception as e:
+            logger.error("Failed to store %s content hashes in '%s': %s", len(pairs), hash_name, e)
+    return None
+
+async def close_redis_connection():
+    global redis_client
+    added_log.flush()
+    if redis_client is not None:
+        await close_client(redis_client)
+        redis_client = None
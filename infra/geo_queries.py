@@ -0,0 +1,206 @@
+import logging
+import math
+from pymongo.errors import ConnectionFailure
+
+from infra.metrics import timed
+from infra.mongodb_connector import get_db, mark_mongo_unhealthy
+from infra.text_codec import decode_documents
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+logger = logging.getLogger(__name__)
+
+# GeoJSON point stored by the ingestion (JobsProjectItem.location), indexed with 2dsphere by job_queries.JOB_INDEXES
+LOCATION_FIELD = 'location'
+# equatorial earth radius, the sphere MongoDB uses for $centerSphere and the $geoNear distances
+# haversine_km uses it too so its distances match find_jobs_near, about 0.1% above the 6371.0km mean radius ones
+EARTH_RADIUS_KM = 6378.1
+# documents returned by the geo searches when no limit is given
+DEFAULT_GEO_LIMIT = 100
+
+def geo_point(longitude, latitude):
+    return {'type': 'Point', 'coordinates': [longitude, latitude]}
+
+'''
+Query matching the jobs within radius_km of the point, answered by the 2dsphere index
+$geoWithin $centerSphere does not sort by distance, use find_jobs_near for that
+'''
+def radius_query(longitude, latitude, radius_km):
+    return {LOCATION_FIELD: {'$geoWithin': {'$centerSphere': [[longitude, latitude], radius_km / EARTH_RADIUS_KM]}}}
+
+'''
+Query matching the jobs inside the longitude/latitude box, answered by the 2dsphere index
+The edges are great circle arcs, not parallels, which makes no visible difference for city
+or region sized boxes
+'''
+def bounding_box_query(min_longitude, min_latitude, max_longitude, max_latitude):
+    ring = [
+        [min_longitude, min_latitude],
+        [max_longitude, min_latitude],
+        [max_longitude, max_latitude],
+        [min_longitude, max_latitude],
+        [min_longitude, min_latitude],
+    ]
+    return {LOCATION_FIELD: {'$geoWithin': {'$geometry': {'type': 'Polygon', 'coordinates': [ring]}}}}
+
+'''
+Jobs within radius_km of the point, nearest first, with their distance in km in distance_field
+Runs a $geoNear aggregation on the 2dsphere index, query narrows the jobs further (e.g. job_filter(brand=...))
+Returns the list of documents, an empty list on errors
+'''
+@timed('mongodb/find_jobs_near')
+def find_jobs_near(longitude, latitude, radius_km, collection_name: str, query: dict = None, projection: dict = None, limit: int = DEFAULT_GEO_LIMIT, distance_field: str = 'distance_km'):
+    db = get_db()
+    if db is None:
+        return []
+    pipeline = [
+        {'$geoNear': {
+            'near': geo_point(longitude, latitude),
+            'key': LOCATION_FIELD,
+            'distanceField': distance_field,
+            # meters to km
+            'distanceMultiplier': 0.001,
+            'maxDistance': radius_km * 1000,
+            'spherical': True,
+            'query': query or {},
+        }},
+        {'$limit': limit},
+    ]
+    if projection:
+        projection = dict(projection)
+        if any(value for field, value in projection.items() if field != '_id'):
+            projection[distance_field] = 1
+        pipeline.append({'$project': projection})
+    try:
+        documents = decode_documents(list(db[collection_name].aggregate(pipeline)), db)
+        logger.debug("Found %s items within %skm in %s", len(documents), radius_km, collection_name)
+        return documents
+    except ConnectionFailure as e:
+        mark_mongo_unhealthy()
+        logger.error("Lost MongoDB connection while searching near a point in %s: %s", collection_name, e)
+    except Exception as e:
+        logger.error("Failed to search near a point in %s: %s", collection_name, e)
+    return []
+
+'''
+Jobs within radius_km of the point (unsorted), or inside a bounding box with find_jobs_in_box
+'''
+@timed('mongodb/find_jobs_within')
+def find_jobs_within(longitude, latitude, radius_km, collection_name: str, query: dict = None, projection: dict = None, limit: int = DEFAULT_GEO_LIMIT):
+    return find_geo(radius_query(longitude, latitude, radius_km), collection_name, query, projection, limit)
+
+@timed('mongodb/find_jobs_in_box')
+def find_jobs_in_box(min_longitude, min_latitude, max_longitude, max_latitude, collection_name: str, query: dict = None, projection: dict = None, limit: int = DEFAULT_GEO_LIMIT):
+    return find_geo(bounding_box_query(min_longitude, min_latitude, max_longitude, max_latitude), collection_name, query, projection, limit)
+
+def find_geo(geo_query, collection_name, query, projection, limit):
+    db = get_db()
+    if db is None:
+        return []
+    if query:
+        geo_query = {'$and': [geo_query, query]}
+    try:
+        cursor = db[collection_name].find(geo_query, projection)
+        if limit:
+            cursor = cursor.limit(limit)
+        return decode_documents(list(cursor), db)
+    except ConnectionFailure as e:
+        mark_mongo_unhealthy()
+        logger.error("Lost MongoDB connection while running a geo query on %s: %s", collection_name, e)
+    except Exception as e:
+        logger.error("Failed to run a geo query on %s: %s", collection_name, e)
+    return []
+
+'''
+Great circle distances in km from the point to every (latitude, longitude) pair of the candidates
+Vectorized with NumPy when it is installed, a plain math loop otherwise
+'''
+def haversine_km(latitude, longitude, latitudes, longitudes):
+    if np is not None:
+        lat1 = np.radians(latitude)
+        lat2 = np.radians(np.asarray(latitudes, dtype=np.float64))
+        dlat = lat2 - lat1
+        dlon = np.radians(np.asarray(longitudes, dtype=np.float64) - longitude)
+        a = np.sin(dlat / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin(dlon / 2) ** 2
+        return (2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))).tolist()
+    lat1 = math.radians(latitude)
+    distances = []
+    for other_latitude, other_longitude in zip(latitudes, longitudes):
+        lat2 = math.radians(other_latitude)
+        a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin(math.radians(other_longitude - longitude) / 2) ** 2
+        distances.append(2 * EARTH_RADIUS_KM * math.asin(math.sqrt(min(1.0, max(0.0, a)))))
+    return distances
+
+def document_coordinates(document):
+    location = document.get(LOCATION_FIELD)
+    if isinstance(location, dict) and len(location.get('coordinates') or ()) == 2:
+        longitude, latitude = location['coordinates']
+        return latitude, longitude
+    latitude, longitude = document.get('latitude'), document.get('longitude')
+    if isinstance(latitude, (int, float)) and isinstance(longitude, (int, float)):
+        return latitude, longitude
+    return None
+
+'''
+Scores a candidate set (e.g. the result of a text or filter query) by distance to the point in one
+vectorized pass: returns (distance_km, document) pairs nearest first, documents without coordinates
+and, with max_km, those further away are left out
+'''
+def score_by_distance(documents, latitude, longitude, max_km=None):
+    located = []
+    latitudes = []
+    longitudes = []
+    for document in documents:
+        coordinates = document_coordinates(document)
+        if coordinates is not None:
+            located.append(document)
+            latitudes.append(coordinates[0])
+            longitudes.append(coordinates[1])
+    if not located:
+        return []
+    scored = zip(haversine_km(latitude, longitude, latitudes, longitudes), located)
+    if max_km is not None:
+        scored = (pair for pair in scored if pair[0] <= max_km)
+    return sorted(scored, key=lambda pair: pair[0])
+
+'''
+Stores the GeoJSON location of documents ingested before it existed, from their numeric
+latitude/longitude (documents with out of range coordinates are skipped)
+Returns the number of updated documents, None on errors
+'''
+def backfill_locations(collection_name: str):
+    db = get_db()
+    if db is None:
+        return None
+    query = {
+        LOCATION_FIELD: {'$exists': False},
+        'latitude': {'$type': 'number', '$gte': -90, '$lte': 90},
+        'longitude': {'$type': 'number', '$gte': -180, '$lte': 180},
+    }
+    update = [{'$set': {LOCATION_FIELD: {'type': 'Point', 'coordinates': ['$longitude', '$latitude']}}}]
+    try:
+        result = db[collection_name].update_many(query, update)
+        logger.info("Stored the location of %s items in %s", result.modified_count, collection_name)
+        return result.modified_count
+    except ConnectionFailure as e:
+        mark_mongo_unhealthy()
+        logger.error("Lost MongoDB connection while backfilling the locations of %s: %s", collection_name, e)
+    except Exception as e:
+        logger.error("Failed to backfill the locations of %s: %s", collection_name, e)
+    return None
+
+'''
+Backfills the locations of the collection when the python file is directly ran
+'''
+if __name__ == "__main__":
+    import sys
+    from infra.job_queries import ensure_indexes
+    from infra.mongodb_connector import close_mongo_connection
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    collection = sys.argv[1] if len(sys.argv) > 1 else 'testing_jobs'
+    backfill_locations(collection)
+    ensure_indexes(collection)
+    close_mongo_connection()
@@ -0,0 +1,277 @@
+import logging
+from pymongo import ASCENDING, DESCENDING, GEOSPHERE, TEXT, IndexModel
+from pymongo.errors import ConnectionFailure, OperationFailure
+
+from infra.metrics import timed
+from infra.mongodb_connector import get_db, mark_mongo_unhealthy
+from infra.text_codec import decode_documents
+
+logger = logging.getLogger(__name__)
+
+# newest first, _id breaks the ties so every document has a unique position for keyset pagination
+DEFAULT_SORT = [('update_date', DESCENDING), ('_id', DESCENDING)]
+# documents per page of find_jobs_page / per round trip of iter_jobs
+DEFAULT_PAGE_SIZE = 50
+
+# compound indexes behind the common filters: the equality fields first, then the sort keys of
+# DEFAULT_SORT, so a filtered page is read in index order without an in memory sort
+# and an update_date range runs on the same index
+JOB_INDEXES = {
+    'location_update_date': [('country_code', ASCENDING), ('state', ASCENDING), ('city', ASCENDING), ('update_date', DESCENDING), ('_id', DESCENDING)],
+    'brand_update_date': [('brand', ASCENDING), ('update_date', DESCENDING), ('_id', DESCENDING)],
+    'employment_type_update_date': [('employment_type', ASCENDING), ('update_date', DESCENDING), ('_id', DESCENDING)],
+    'update_date': [('update_date', DESCENDING), ('_id', DESCENDING)],
+    # GeoJSON point of the job, radius and bounding box searches (infra/geo_queries.py)
+    'location_2dsphere': [('location', GEOSPHERE)],
+}
+
+# weighted text index of the keyword search (infra/job_search.py), a collection has at most one
+JOB_TEXT_INDEX_NAME = 'title_description_text'
+# a term in the title scores ten times a term in the description
+JOB_TEXT_INDEX_WEIGHTS = {'title': 10, 'description': 1}
+# the documents have a language field holding locales such as "en-us", which the text index would
+# take as their language and reject, so the language is read from a field the items do not have
+JOB_TEXT_LANGUAGE_OVERRIDE = 'text_language'
+
+'''
+IndexModels of JOB_INDEXES and of the text index, shared with the async pipeline
+'''
+def job_index_models():
+    models = [IndexModel(keys, name=name) for name, keys in JOB_INDEXES.items()]
+    models.append(IndexModel(
+        [(field, TEXT) for field in JOB_TEXT_INDEX_WEIGHTS],
+        name=JOB_TEXT_INDEX_NAME,
+        weights=JOB_TEXT_INDEX_WEIGHTS,
+        default_language='english',
+        language_override=JOB_TEXT_LANGUAGE_OVERRIDE,
+    ))
+    return models
+
+'''
+Creates the JOB_INDEXES on the collection, indexes that already exist are left alone
+Returns the index names, None if they could not be created (e.g. an index with the same
+keys exists under another name)
+'''
+def ensure_indexes(collection_name: str):
+    db = get_db()
+    if db is None:
+        return None
+    try:
+        names = db[collection_name].create_indexes(job_index_models())
+        logger.info("Ensured query indexes %s on %s", ', '.join(names), collection_name)
+        return names
+    except ConnectionFailure as e:
+        mark_mongo_unhealthy()
+        logger.error("Lost MongoDB connection while creating the query indexes on %s: %s", collection_name, e)
+    except OperationFailure as e:
+        logger.error("Failed to create the query indexes on %s: %s", collection_name, e)
+    return None
+
+'''
+Query matching the common filters, None values are left out
+country_code, state and city narrow the location from the country down, updated_since
+and updated_before bound update_date (inclusive / exclusive)
+'''
+def job_filter(country_code=None, state=None, city=None, brand=None, employment_type=None, updated_since=None, updated_before=None):
+    query = {}
+    for field, value in (('country_code', country_code), ('state', state), ('city', city), ('brand', brand), ('employment_type', employment_type)):
+        if value is not None:
+            query[field] = value
+    if updated_since is not None or updated_before is not None:
+        query['update_date'] = {}
+        if updated_since is not None:
+            query['update_date']['$gte'] = updated_since
+        if updated_before is not None:
+            query['update_date']['$lt'] = updated_before
+    return query
+
+'''
+Projection of a covered query: only fields of the index and no _id unless asked for,
+so the server answers from the index keys without reading a document
+'''
+def covered_projection(fields):
+    projection = {field: 1 for field in fields}
+    if '_id' not in projection:
+        projection['_id'] = 0
+    return projection
+
+'''
+Condition matching the documents that come strictly after the sort key values of the last
+document of a page: an $or over "same values on the first keys, after it on the next one",
+under a range on the first sort key so the server scans the index from the last position on
+Null sorts lowest, so in descending order the documents without a field come after every value
+'''
+def keyset_query(sort, after):
+    branches = []
+    for position, (field, direction) in enumerate(sort):
+        branch = {sort_field: value for (sort_field, _), value in zip(sort[:position], after)}
+        value = after[position]
+        if direction == DESCENDING:
+            if value is None:
+                continue
+            branch[field] = {'$not': {'$gte': value}}
+        else:
+            branch[field] = {'$gt': value} if value is not None else {'$ne': None}
+        branches.append(branch)
+    if not branches:
+        return {'_id': {'$exists': False}}
+    field, direction = sort[0]
+    value = after[0]
+    if direction == DESCENDING:
+        bound = {field: {'$not': {'$gt': value}}} if value is not None else {field: None}
+    else:
+        bound = {field: {'$gte': value}} if value is not None else {}
+    if not bound:
+        return {'$or': branches}
+    return {'$and': [bound, {'$or': branches}]}
+
+def combine_queries(query, extra):
+    if not query:
+        return extra
+    return {'$and': [query, extra]}
+
+def sort_key(document, sort):
+    return tuple(document.get(field) for field, _ in sort)
+
+def with_sort_fields(projection, sort):
+    if not projection:
+        return projection
+    if any(value == 0 for field, value in projection.items() if field != '_id'):
+        # an exclusion projection keeps the sort fields anyway
+        return projection
+    projection = dict(projection)
+    for field, _ in sort:
+        projection[field] = 1
+    return projection
+
+'''
+One page of the documents matching query in sort order, using keyset (seek) pagination:
+after is the sort key of the last document of the previous page (the next_after returned by the
+previous call), so every page is an index range scan and costs the same however deep it is,
+unlike skip/limit which walks over all the skipped entries
+The sort fields are added to an inclusion projection, they are needed for the next key
+Returns (documents, next_after), next_after is None on the last page. Returns ([], None) on errors
+'''
+@timed('mongodb/find_jobs_page')
+def find_jobs_page(query: dict, collection_name: str, projection: dict = None, sort=None, limit: int = DEFAULT_PAGE_SIZE, after=None, hint=None):
+    sort = sort or DEFAULT_SORT
+    db = get_db()
+    if db is None:
+        return [], None
+    if after is not None:
+        query = combine_queries(query, keyset_query(sort, after))
+    try:
+        cursor = db[collection_name].find(query, with_sort_fields(projection, sort)).sort(sort).limit(limit)
+        if hint:
+            cursor = cursor.hint(hint)
+        documents = decode_documents(list(cursor), db)
+    except ConnectionFailure as e:
+        mark_mongo_unhealthy()
+        logger.error("Lost MongoDB connection while paging through %s: %s", collection_name, e)
+        return [], None
+    except Exception as e:
+        logger.error("Failed to page through %s: %s", collection_name, e)
+        return [], None
+    logger.debug("Found %s items in %s for a page of %s", len(documents), collection_name, limit)
+    next_after = sort_key(documents[-1], sort) if len(documents) == limit else None
+    return documents, next_after
+
+'''
+Lazy iterator over every document matching query in sort order, fetched one keyset page of
+page_size at a time, so no cursor stays open between two pages and memory holds one page
+Stops after limit documents if given, or at the first page that failed
+'''
+def iter_jobs(query: dict, collection_name: str, projection: dict = None, sort=None, page_size: int = 1000, limit: int = None, after=None, hint=None):
+    returned = 0
+    while True:
+        page_limit = page_size if limit is None else min(page_size, limit - returned)
+        if page_limit <= 0:
+            return
+        documents, after = find_jobs_page(query, collection_name, projection, sort=sort, limit=page_limit, after=after, hint=hint)
+        yield from documents
+        returned += len(documents)
+        if after is None:
+            return
+
+'''
+Runs explain() for the page query and returns a summary of the winning plan:
+the index used (None for a collection scan), the plan stages, keys and documents examined,
+documents returned, execution time, whether the query was covered (no FETCH) and
+whether the sort ran in memory (a SORT stage)
+Returns None if the explain failed
+'''
+def explain_query(query: dict, collection_name: str, projection: dict = None, sort=None, limit: int = DEFAULT_PAGE_SIZE, hint=None):
+    sort = sort or DEFAULT_SORT
+    db = get_db()
+    if db is None:
+        return None
+    try:
+        cursor = db[collection_name].find(query, with_sort_fields(projection, sort)).sort(sort).limit(limit)
+        if hint:
+            cursor = cursor.hint(hint)
+        explain = cursor.explain()
+    except ConnectionFailure as e:
+        mark_mongo_unhealthy()
+        logger.error("Lost MongoDB connection while explaining a query on %s: %s", collection_name, e)
+        return None
+    except Exception as e:
+        logger.error("Failed to explain a query on %s: %s", collection_name, e)
+        return None
+    winning_plan = explain.get('queryPlanner', {}).get('winningPlan', {})
+    # the slot based engine (MongoDB 7+) nests the classic plan under queryPlan
+    stages = list(plan_stages(winning_plan.get('queryPlan', winning_plan)))
+    stats = explain.get('executionStats', {})
+    index_names = [stage.get('indexName') for stage in stages if stage.get('stage') == 'IXSCAN']
+    return {
+        'index': index_names[0] if index_names else None,
+        'stages': [stage.get('stage') for stage in stages],
+        'keys_examined': stats.get('totalKeysExamined'),
+        'docs_examined': stats.get('totalDocsExamined'),
+        'returned': stats.get('nReturned'),
+        'execution_ms': stats.get('executionTimeMillis'),
+        'covered': bool(index_names) and not any(stage.get('stage') == 'FETCH' for stage in stages),
+        'in_memory_sort': any(stage.get('stage') in ('SORT', 'SORT_KEY_GENERATOR') for stage in stages),
+    }
+
+def plan_stages(plan):
+    if not plan:
+        return
+    yield plan
+    if 'inputStage' in plan:
+        yield from plan_stages(plan['inputStage'])
+    for input_stage in plan.get('inputStages', []):
+        yield from plan_stages(input_stage)
+
+'''
+explain() based check that the query is answered from an index without an in memory sort
+(and from the index alone when covered=True), logs the plan when it is not
+Returns True if it is, False if not or if the query could not be explained
+'''
+def check_query_uses_index(query: dict, collection_name: str, projection: dict = None, sort=None, covered: bool = False):
+    summary = explain_query(query, collection_name, projection, sort=sort)
+    if summary is None:
+        return False
+    ok = summary['index'] is not None and not summary['in_memory_sort'] and (summary['covered'] or not covered)
+    if not ok:
+        logger.warning("Query %s on %s is not served by an index as expected: %s", query, collection_name, summary)
+    return ok
+
+'''
+Explains the common filters against the collection when the python file is directly ran
+'''
+if __name__ == "__main__":
+    import sys
+    from infra.mongodb_connector import close_mongo_connection
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    collection = sys.argv[1] if len(sys.argv) > 1 else 'testing_jobs'
+    ensure_indexes(collection)
+    checks = [
+        ('location', job_filter(country_code='US', state='TX', city='Dallas'), None),
+        ('brand', job_filter(brand='AutoZone'), None),
+        ('employment_type', job_filter(employment_type='FULL_TIME'), None),
+        ('update_date', {}, None),
+        ('covered slugs by country', job_filter(country_code='US'), covered_projection(['country_code', 'state', 'city', 'update_date'])),
+    ]
+    for label, query, projection in checks:
+        logger.info("%s: %s", label, explain_query(query, collection, projection))
+    close_mongo_connection()
@@ -0,0 +1,88 @@
+import logging
+from pymongo.errors import ConnectionFailure
+
+from infra.job_queries import JOB_TEXT_INDEX_NAME, combine_queries, job_filter
+from infra.metrics import timed
+from infra.mongodb_connector import get_db, mark_mongo_unhealthy
+from infra.text_codec import decode_documents
+
+logger = logging.getLogger(__name__)
+
+# field the relevance of a result is returned in
+SCORE_FIELD = 'score'
+# results returned by search_jobs when no limit is given
+DEFAULT_SEARCH_LIMIT = 20
+
+'''
+Ranked keyword search over the title and description of the jobs
+It runs on the weighted text index of infra.job_queries (title_description_text), an inverted index
+MongoDB keeps up to date as the pipelines insert and update items: a search reads the postings of its
+terms instead of scanning every description, so it costs in proportion to the matching jobs and not
+to the size of the collection
+Terms are stemmed (English), a job matches any of the keywords, every phrase, and none of the excluded terms
+'''
+
+'''
+$search string of the keywords, the exact phrases and the excluded terms
+'''
+def search_string(keywords=None, phrases=None, exclude=None):
+    parts = []
+    if keywords:
+        parts.append(keywords if isinstance(keywords, str) else ' '.join(keywords))
+    for phrase in phrases or ():
+        parts.append('"' + phrase.replace('"', ' ') + '"')
+    for term in exclude or ():
+        parts.append('-' + term)
+    return ' '.join(parts)
+
+def search_query(keywords=None, phrases=None, exclude=None, country_code=None, employment_type=None):
+    if isinstance(country_code, (list, tuple)):
+        country_code = {'$in': list(country_code)}
+    if isinstance(employment_type, (list, tuple)):
+        employment_type = {'$in': list(employment_type)}
+    query = {'$text': {'$search': search_string(keywords, phrases, exclude)}}
+    return combine_queries(job_filter(country_code=country_code, employment_type=employment_type), query)
+
+'''
+Jobs matching the keywords and phrases, most relevant first, with their text score in SCORE_FIELD
+country_code and employment_type filter the matches (a string or, for several values, a list)
+Returns the list of documents, an empty list when nothing was searched for or on errors
+'''
+@timed('mongodb/search_jobs')
+def search_jobs(keywords, collection_name: str, phrases=None, exclude=None, country_code=None, employment_type=None, projection: dict = None, limit: int = DEFAULT_SEARCH_LIMIT, skip: int = 0):
+    if not keywords and not phrases:
+        return []
+    db = get_db()
+    if db is None:
+        return []
+    query = search_query(keywords, phrases, exclude, country_code, employment_type)
+    projection = dict(projection or {})
+    projection[SCORE_FIELD] = {'$meta': 'textScore'}
+    try:
+        cursor = db[collection_name].find(query, projection).sort([(SCORE_FIELD, {'$meta': 'textScore'})])
+        if skip:
+            cursor = cursor.skip(skip)
+        documents = decode_documents(list(cursor.limit(limit)), db)
+        logger.debug("Found %s items in %s for the search %r", len(documents), collection_name, query)
+        return documents
+    except ConnectionFailure as e:
+        mark_mongo_unhealthy()
+        logger.error("Lost MongoDB connection while searching %s: %s", collection_name, e)
+    except Exception as e:
+        logger.error("Failed to search %s (is the %s index there?): %s", collection_name, JOB_TEXT_INDEX_NAME, e)
+    return []
+
+'''
+Searches the collection when the python file is directly ran:
+python -m infra.job_search testing_jobs "parts driver" [country_code]
+'''
+if __name__ == "__main__":
+    import sys
+    from infra.mongodb_connector import close_mongo_connection
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    collection = sys.argv[1] if len(sys.argv) > 1 else 'testing_jobs'
+    keywords = sys.argv[2] if len(sys.argv) > 2 else 'parts'
+    country = sys.argv[3] if len(sys.argv) > 3 else None
+    for job in search_jobs(keywords, collection, country_code=country, projection={'title': 1, 'city': 1, 'brand': 1}):
+        logger.info("%.2f %s (%s, %s)", job[SCORE_FIELD], job.get('title'), job.get('city'), job.get('brand'))
+    close_mongo_connection()
@@ -0,0 +1,124 @@
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+import time
+
+# seconds covered by one summary line of an AggregatedLog
+LOG_AGGREGATE_INTERVAL = float(os.getenv('LOG_AGGREGATE_INTERVAL', '10'))
+# a SampledLog logs the first LOG_SAMPLE_FIRST occurrences of a message, then every LOG_SAMPLE_EVERY-th
+LOG_SAMPLE_FIRST = int(os.getenv('LOG_SAMPLE_FIRST', '10'))
+LOG_SAMPLE_EVERY = int(os.getenv('LOG_SAMPLE_EVERY', '1000'))
+
+"""
+    Replaces one log line per call of a hot path helper by one line per interval, e.g.
+    "Inserted 120000 items into testing_jobs in the last 10.0s (240 calls)".
+    message is a %-style format whose first argument is the summed count, the other arguments
+    passed to add() tell the sums apart (e.g. the collection name).
+    Nothing is counted while the logger does not log at level.
+"""
+class AggregatedLog:
+    def __init__(self, logger, message, level=logging.INFO, interval=None):
+        self.logger = logger
+        self.message = message + " in the last %.1fs (%d calls)"
+        self.level = level
+        self.interval = LOG_AGGREGATE_INTERVAL if interval is None else interval
+        self.totals = {}
+        self.started_at = time.monotonic()
+        self.lock = threading.Lock()
+
+    def add(self, count, *args):
+        if not self.logger.isEnabledFor(self.level):
+            return
+        with self.lock:
+            total, calls = self.totals.get(args, (0, 0))
+            self.totals[args] = (total + count, calls + 1)
+            if time.monotonic() - self.started_at < self.interval:
+                return
+            totals, elapsed = self.take()
+        self.emit(totals, elapsed)
+
+    '''
+    Logs what was counted since the last summary, called when the connection is closed
+    '''
+    def flush(self):
+        with self.lock:
+            totals, elapsed = self.take()
+        self.emit(totals, elapsed)
+
+    def take(self):
+        totals, self.totals = self.totals, {}
+        now = time.monotonic()
+        elapsed, self.started_at = now - self.started_at, now
+        return totals, elapsed
+
+    def emit(self, totals, elapsed):
+        for args, (total, calls) in totals.items():
+            self.logger.log(self.level, self.message, total, *args, elapsed, calls)
+
+"""
+    Logs a per item message in full for its first LOG_SAMPLE_FIRST occurrences and then only
+    every LOG_SAMPLE_EVERY-th time with the running count, so a systematic failure on a large
+    crawl stays visible without a line per item. Occurrences are counted per message format.
+"""
+class SampledLog:
+    def __init__(self, logger, level=logging.WARNING, first=None, every=None):
+        self.logger = logger
+        self.level = level
+        self.first = LOG_SAMPLE_FIRST if first is None else first
+        self.every = max(1, LOG_SAMPLE_EVERY if every is None else every)
+        self.counts = {}
+
+    def log(self, message, *args, **kwargs):
+        count = self.counts.get(message, 0) + 1
+        self.counts[message] = count
+        if count <= self.first:
+            self.logger.log(self.level, message, *args, **kwargs)
+        elif count % self.every == 0:
+            self.logger.log(self.level, message + " (%d occurrences so far, logging every %d-th)", *args, count, self.every, **kwargs)
+
+queue_listener = None
+queued_handlers = []
+
+'''
+Moves the stream and file handlers of the root logger behind a QueueHandler, so the thread
+that logs only puts the record on a queue and a QueueListener thread does the writing
+Handlers that do no I/O (like Scrapy's log counter) stay on the root logger
+Returns the listener, None if there was nothing to move. Calling it again is a no-op
+'''
+def start_queue_logging():
+    global queue_listener, queued_handlers
+    if queue_listener is not None:
+        return queue_listener
+    root = logging.getLogger()
+    queued_handlers = [handler for handler in root.handlers if isinstance(handler, logging.StreamHandler)]
+    if not queued_handlers:
+        return None
+    log_queue = queue.SimpleQueue()
+    for handler in queued_handlers:
+        root.removeHandler(handler)
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    # the queue handler formats the message, records none of the handlers would write are dropped before that
+    queue_handler.setLevel(min(handler.level for handler in queued_handlers))
+    root.addHandler(queue_handler)
+    queue_listener = logging.handlers.QueueListener(log_queue, *queued_handlers, respect_handler_level=True)
+    queue_listener.start()
+    return queue_listener
+
+'''
+Writes out the queued records, stops the listener thread and puts the handlers back on the root logger
+'''
+def stop_queue_logging():
+    global queue_listener, queued_handlers
+    if queue_listener is None:
+        return
+    root = logging.getLogger()
+    for handler in queued_handlers:
+        root.addHandler(handler)
+    for handler in list(root.handlers):
+        if isinstance(handler, logging.handlers.QueueHandler) and handler.queue is queue_listener.queue:
+            root.removeHandler(handler)
+    queue_listener.stop()
+    queue_listener = None
+    queued_handlers = []
@@ -0,0 +1,230 @@
+import bisect
+import functools
+import inspect
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# latency histograms shared by the connectors, the spider and the pipelines of this process,
+# keyed by operation name ('mongodb/insert_items', 'pipeline/mongodb', 'spider/parse', ...)
+# set METRICS_ENABLED=0 to turn the timing into a no-op
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', '1') != '0'
+# prefix of the exported Prometheus metric names
+METRICS_NAMESPACE = os.getenv('METRICS_NAMESPACE', 'jobs_project')
+# histogram bucket upper bounds in seconds, from 50us to 10s
+LATENCY_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+histograms = {}
+histograms_lock = threading.Lock()
+
+"""
+    Fixed bucket latency histogram, cumulative like a Prometheus histogram.
+    Observations from the reactor thread and worker threads are serialised with a lock.
+"""
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+        self.lock = threading.Lock()
+
+    def observe(self, seconds):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self.lock:
+            self.counts[index] += 1
+            self.count += 1
+            self.sum += seconds
+            if self.min is None or seconds < self.min:
+                self.min = seconds
+            if self.max is None or seconds > self.max:
+                self.max = seconds
+
+    def snapshot(self):
+        with self.lock:
+            return list(self.counts), self.count, self.sum
+
+    '''
+    Estimates the q quantile by interpolating linearly inside the bucket holding it,
+    clamped to the smallest and largest observed value
+    '''
+    def quantile(self, q):
+        counts, count, _ = self.snapshot()
+        if not count:
+            return None
+        rank = q * count
+        seen = 0
+        for index, bucket_count in enumerate(counts):
+            if bucket_count and seen + bucket_count >= rank:
+                lower = max(self.buckets[index - 1] if index else 0.0, self.min)
+                upper = min(self.buckets[index] if index < len(self.buckets) else self.max, self.max)
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+        return self.max
+
+def histogram(name):
+    hist = histograms.get(name)
+    if hist is None:
+        with histograms_lock:
+            hist = histograms.setdefault(name, Histogram())
+    return hist
+
+def observe(name, seconds):
+    if METRICS_ENABLED:
+        histogram(name).observe(seconds)
+
+'''
+Decorator recording the duration of every call in the histogram of name
+Works for plain functions, coroutine functions and functions returning a Twisted Deferred,
+which are timed until the Deferred fires. Raised exceptions are timed as well.
+'''
+def timed(name):
+    def decorator(func):
+        if not METRICS_ENABLED:
+            return func
+        hist = histogram(name)
+
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                started_at = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    hist.observe(time.perf_counter() - started_at)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            started_at = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except BaseException:
+                hist.observe(time.perf_counter() - started_at)
+                raise
+            if hasattr(result, 'addBoth'):
+                def observe_fired(value):
+                    hist.observe(time.perf_counter() - started_at)
+                    return value
+                return result.addBoth(observe_fired)
+            hist.observe(time.perf_counter() - started_at)
+            return result
+        return wrapper
+    return decorator
+
+'''
+Yields the values of iterable and records how long producing each one took, the time
+the consumer spends between two values is not counted
+'''
+def timed_iter(iterable, name):
+    if not METRICS_ENABLED:
+        yield from iterable
+        return
+    hist = histogram(name)
+    iterator = iter(iterable)
+    while True:
+        started_at = time.perf_counter()
+        try:
+            value = next(iterator)
+        except StopIteration:
+            return
+        hist.observe(time.perf_counter() - started_at)
+        yield value
+
+'''
+Returns {name: {'count', 'mean_ms', 'p50_ms', 'p99_ms'}} for every histogram that saw a value
+'''
+def summary():
+    result = {}
+    for name, hist in sorted(histograms.items()):
+        _, count, total = hist.snapshot()
+        if not count:
+            continue
+        result[name] = {
+            'count': count,
+            'mean_ms': round(total / count * 1000, 3),
+            'p50_ms': round(hist.quantile(0.5) * 1000, 3),
+            'p99_ms': round(hist.quantile(0.99) * 1000, 3),
+        }
+    return result
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+'''
+Renders the histograms, and the numeric values of gauges (e.g. the Scrapy stats), in the
+Prometheus text exposition format
+'''
+def render_prometheus(gauges=None):
+    metric = f"{METRICS_NAMESPACE}_operation_duration_seconds"
+    lines = [
+        f"# HELP {metric} Time spent per call of a spider, pipeline or connector operation.",
+        f"# TYPE {metric} histogram",
+    ]
+    for name, hist in sorted(histograms.items()):
+        counts, count, total = hist.snapshot()
+        label = f'operation="{escape_label(name)}"'
+        cumulative = 0
+        for bound, bucket_count in zip(hist.buckets, counts):
+            cumulative += bucket_count
+            lines.append(f'{metric}_bucket{{{label},le="{bound}"}} {cumulative}')
+        lines.append(f'{metric}_bucket{{{label},le="+Inf"}} {count}')
+        lines.append(f"{metric}_sum{{{label}}} {total}")
+        lines.append(f"{metric}_count{{{label}}} {count}")
+    if gauges:
+        gauge = f"{METRICS_NAMESPACE}_stat"
+        lines.append(f"# HELP {gauge} Scrapy stats of the running crawl.")
+        lines.append(f"# TYPE {gauge} gauge")
+        for name, value in sorted(gauges.items()):
+            if isinstance(value, (int, float)) and not isinstance(value, bool):
+                lines.append(f'{gauge}{{name="{escape_label(name)}"}} {value}')
+    return '\n'.join(lines) + '\n'
+
+'''
+Writes text to path through a temporary file and a rename, so a node_exporter textfile
+collector never reads a half written file
+'''
+def write_textfile(path, text):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+        return True
+    except OSError as e:
+        logging.error(f"Failed to write the metrics textfile {path}: {e}")
+        return False
+
+'''
+Serves render() on http://host:port/metrics from a daemon thread, returns the server
+(stop it with server.shutdown()) or None if the port could not be bound
+'''
+def start_http_server(port, host='127.0.0.1', render=render_prometheus):
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?', 1)[0] not in ('/', '/metrics'):
+                self.send_error(404)
+                return
+            body = render().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    try:
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+    except OSError as e:
+        logging.error(f"Failed to start the metrics endpoint on {host}:{port}: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name='metrics-http', daemon=True).start()
+    logging.info(f"Serving metrics on http://{host}:{server.server_port}/metrics")
+    return server
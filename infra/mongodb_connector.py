@@ -1,47 +1,87 @@
 import os
+import time
 import logging
-from pymongo import MongoClient
-from pymongo.errors import ConnectionFailure, ServerSelectionTimeoutError
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import BulkWriteError, ConnectionFailure, ServerSelectionTimeoutError
 
-# adding logging formatting
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+from infra.logging_utils import AggregatedLog
+from infra.metrics import timed
+from infra.text_codec import DecodingCursor, decode_documents
+
+# the handlers are configured by the application (Scrapy, query.py), the hot path helpers
+# log a summary per LOG_AGGREGATE_INTERVAL instead of a line per call
+logger = logging.getLogger(__name__)
+inserted_log = AggregatedLog(logger, "Inserted %d items into %s")
+upserted_log = AggregatedLog(logger, "Upserted %d changed items into %s")
+write_errors_log = AggregatedLog(logger, "Got %d write errors from %s")
 
 MONGO_URI = os.getenv('MONGO_URI', 'mongodb://localhost:27017/')
 MONGO_DB_NAME = os.getenv('MONGO_DB_NAME', 'data_ingestion_db')
 
+# connection pool sizing and timeouts handed to the MongoClient
+MONGO_MAX_POOL_SIZE = int(os.getenv('MONGO_MAX_POOL_SIZE', '100'))
+MONGO_MIN_POOL_SIZE = int(os.getenv('MONGO_MIN_POOL_SIZE', '0'))
+MONGO_SERVER_SELECTION_TIMEOUT_MS = int(os.getenv('MONGO_SERVER_SELECTION_TIMEOUT_MS', '5000'))
+MONGO_CONNECT_TIMEOUT_MS = int(os.getenv('MONGO_CONNECT_TIMEOUT_MS', '20000'))
+MONGO_SOCKET_TIMEOUT_MS = int(os.getenv('MONGO_SOCKET_TIMEOUT_MS', '0')) or None
+# seconds between two pings of the cached client, 0 pings on every call like before
+MONGO_HEALTH_CHECK_INTERVAL = float(os.getenv('MONGO_HEALTH_CHECK_INTERVAL', '30'))
+
 mongo_client = None
+last_health_check = 0.0
 
 '''
 Function is used to connect the the MONGO_URI server running
 For the application it is the mongo server running in the docker container
-The function will check for an existing connection and will reuse if there is a connection
+The client is long lived and reused, it is only pinged again once MONGO_HEALTH_CHECK_INTERVAL
+seconds passed since the last successful check or after an operation failed with a connection error
 Otherwise, it will try to establish a new connection
-Function will return None if there is an exception or if the connection timed out in 5000ms
+Function will return None if there is an exception or if the connection timed out in MONGO_SERVER_SELECTION_TIMEOUT_MS
 '''
 def get_mongo_client():
-    global mongo_client
+    global mongo_client, last_health_check
     if mongo_client is not None:
+        if time.monotonic() - last_health_check < MONGO_HEALTH_CHECK_INTERVAL:
+            return mongo_client
         try:
             mongo_client.admin.command('ping')
-            logging.debug("Reusing existing connection")
+            last_health_check = time.monotonic()
+            logger.debug("Reusing existing connection")
             return mongo_client
         except (ConnectionFailure, ServerSelectionTimeoutError):
-            logging.warning("Exiting MongoDB connection lost, trying to reconnect!")
+            logger.warning("Exiting MongoDB connection lost, trying to reconnect!")
+            mongo_client.close()
             mongo_client = None
     try:
-        logging.info(f"Trying to connect to the MongoDB at {MONGO_URI}")
-        client = MongoClient(MONGO_URI, serverSelectionTimeoutMS=5000)
-        client.admin.command('ismaster')
+        logger.info("Trying to connect to the MongoDB at %s", MONGO_URI)
+        client = MongoClient(
+            MONGO_URI,
+            maxPoolSize=MONGO_MAX_POOL_SIZE,
+            minPoolSize=MONGO_MIN_POOL_SIZE,
+            serverSelectionTimeoutMS=MONGO_SERVER_SELECTION_TIMEOUT_MS,
+            connectTimeoutMS=MONGO_CONNECT_TIMEOUT_MS,
+            socketTimeoutMS=MONGO_SOCKET_TIMEOUT_MS,
+        )
+        client.admin.command('ping')
         mongo_client = client
-        logging.info(f"Successfully connected to MongoDd: {MONGO_URI}")
+        last_health_check = time.monotonic()
+        logger.info("Successfully connected to MongoDd: %s", MONGO_URI)
         return mongo_client
     except (ConnectionFailure, ServerSelectionTimeoutError) as e:
-        logging.error(f"Failed to connect to MongoServer {MONGO_URI}: {e}")
+        logger.error("Failed to connect to MongoServer %s: %s", MONGO_URI, e)
         return None
     except Exception as e:
-        logging.error(f"Failed to connect to the MongoServer {MONGO_URI}: {e}")
+        logger.error("Failed to connect to the MongoServer %s: %s", MONGO_URI, e)
         return None
 
+'''
+Forces a health check of the cached client on the next get_mongo_client call
+Called by the helpers when an operation fails with a connection error
+'''
+def mark_mongo_unhealthy():
+    global last_health_check
+    last_health_check = 0.0
+
 '''
 The function get the mention Mongo URI client and get the mentioned Mongo Db from the server
 If any error during the process logs the exception
@@ -53,34 +93,121 @@ def get_db():
             db = client[MONGO_DB_NAME]
             return db
         except Exception as e:
-            logging.error(f"Failed to get database '{MONGO_DB_NAME}': '{e}'")
+            logger.error("Failed to get database '%s': '%s'", MONGO_DB_NAME, e)
             return None
     else:
-        logging.error("Cannot get database as MongoDB client is not available")
+        logger.error("Cannot get database as MongoDB client is not available")
         return None
 
 '''
 Inserts the job dictionary into the specified collection
 If successful return the result from pymongo.result.InsertOneResult else None
 '''
+@timed('mongodb/insert_item')
 def insert_item(item: dict, collection_name: str):
     db = get_db()
     if db is not None:
         try:
             collection = db[collection_name]
             result = collection.insert_one(item)
-            logging.info(f"Inserted item with id {result.inserted_id} into {collection_name}")
+            logger.debug("Inserted item with id %s into %s", result.inserted_id, collection_name)
             return result
+        except ConnectionFailure as e:
+            mark_mongo_unhealthy()
+            logger.error("Lost MongoDB connection while inserting item into %s: %s", collection_name, e)
+            return None
+        except Exception as e:
+            logger.error("Failed to insert item into %s: %s", collection_name, e)
+            return None
+    return None
+
+'''
+Inserts a batch of job dictionaries into the specified collection with a single insert_many
+With ordered=False the server keeps inserting after a failed document, so one duplicate
+does not reject the rest of the batch
+Returns a dict with the inserted count and the per document write errors
+(each error carries the 'index' of the document in the batch and its 'code'), None if the batch failed
+'''
+@timed('mongodb/insert_items')
+def insert_items(items: list, collection_name: str, ordered: bool = False):
+    if not items:
+        return {'inserted': 0, 'write_errors': []}
+    db = get_db()
+    if db is not None:
+        try:
+            collection = db[collection_name]
+            result = collection.insert_many(items, ordered=ordered)
+            inserted_log.add(len(result.inserted_ids), collection_name)
+            return {'inserted': len(result.inserted_ids), 'write_errors': []}
+        except BulkWriteError as e:
+            details = e.details or {}
+            write_errors = details.get('writeErrors', [])
+            inserted_log.add(details.get('nInserted', 0), collection_name)
+            write_errors_log.add(len(write_errors), collection_name)
+            return {'inserted': details.get('nInserted', 0), 'write_errors': write_errors}
+        except ConnectionFailure as e:
+            mark_mongo_unhealthy()
+            logger.error("Lost MongoDB connection while inserting %s items into %s: %s", len(items), collection_name, e)
+            return None
+        except Exception as e:
+            logger.error("Failed to insert %s items into %s: %s", len(items), collection_name, e)
+            return None
+    return None
+
+'''
+Upserts a batch of job dictionaries with one unordered bulk_write of UpdateOne(..., upsert=True),
+matching the stored document on key_field
+The item fields are $set, the unset_fields missing from an item are $unset so a field dropped
+from the feed does not linger in the stored document
+Returns a dict with the inserted (upserted), updated (modified) and matched counts and the per
+document write errors (with the 'index' of the item in the batch), None if the batch failed
+'''
+@timed('mongodb/upsert_items')
+def upsert_items(items: list, collection_name: str, key_field: str, unset_fields=(), ordered: bool = False):
+    if not items:
+        return {'inserted': 0, 'updated': 0, 'matched': 0, 'write_errors': []}
+    db = get_db()
+    if db is not None:
+        operations = upsert_operations(items, key_field, unset_fields)
+        try:
+            result = db[collection_name].bulk_write(operations, ordered=ordered)
+            upserted_log.add(result.upserted_count + result.modified_count, collection_name)
+            return {'inserted': result.upserted_count, 'updated': result.modified_count, 'matched': result.matched_count, 'write_errors': []}
+        except BulkWriteError as e:
+            details = e.details or {}
+            write_errors = details.get('writeErrors', [])
+            upserted_log.add(details.get('nUpserted', 0) + details.get('nModified', 0), collection_name)
+            write_errors_log.add(len(write_errors), collection_name)
+            return {'inserted': details.get('nUpserted', 0), 'updated': details.get('nModified', 0), 'matched': details.get('nMatched', 0), 'write_errors': write_errors}
+        except ConnectionFailure as e:
+            mark_mongo_unhealthy()
+            logger.error("Lost MongoDB connection while upserting %s items into %s: %s", len(items), collection_name, e)
+            return None
         except Exception as e:
-            logging.error(f"Failed to insert item into {collection_name}: {e}")
+            logger.error("Failed to upsert %s items into %s: %s", len(items), collection_name, e)
             return None
     return None
 
+'''
+UpdateOne(..., upsert=True) operations for upsert_items, shared with the async connector
+'''
+def upsert_operations(items: list, key_field: str, unset_fields=()):
+    operations = []
+    for item in items:
+        update = {'$set': {field: value for field, value in item.items() if field != '_id'}}
+        unset = {field: '' for field in unset_fields if field not in item}
+        if unset:
+            update['$unset'] = unset
+        operations.append(UpdateOne({key_field: item[key_field]}, update, upsert=True))
+    return operations
+
 '''
 Get the db from the server
 Runs the query against the collection
+Fields stored compressed by the text codec (infra.text_codec) are decoded
 return query response, if exception return empty list
 '''
+@timed('mongodb/find_item')
 def find_item(query: dict, collection_name: str, projection: dict = None):
     db = get_db()
     items = []
@@ -88,32 +215,65 @@ def find_item(query: dict, collection_name: str, projection: dict = None):
         try:
             collection = db[collection_name]
             cursor = collection.find(query, projection)
-            items = list(cursor)
-            logging.debug(f"Found {len(items)} items in {collection_name} matching query")
+            items = decode_documents(list(cursor), db)
+            logger.debug("Found %s items in %s matching query", len(items), collection_name)
+        except ConnectionFailure as e:
+            mark_mongo_unhealthy()
+            logger.error("Lost MongoDB connection while finding items in %s: %s", collection_name, e)
+            return []
         except Exception as e:
-            logging.error(f"Failed to fin items in {collection_name}: {e}")
+            logger.error("Failed to fin items in %s: %s", collection_name, e)
             return []
     return items
 
+'''
+Lazy counterpart of find_item for large results
+Returns the server side cursor without materializing it, documents are fetched
+batch_size at a time while the caller iterates
+Errors raised while iterating are left to the caller, returns None if the query could not be started
+The documents are decoded as they are iterated, like in find_item
+'''
+def iter_items(query: dict, collection_name: str, projection: dict = None, batch_size: int = None, sort: list = None):
+    db = get_db()
+    if db is None:
+        return None
+    try:
+        cursor = db[collection_name].find(query, projection)
+        if sort:
+            cursor = cursor.sort(sort)
+        if batch_size:
+            cursor = cursor.batch_size(batch_size)
+        return DecodingCursor(cursor, db)
+    except ConnectionFailure as e:
+        mark_mongo_unhealthy()
+        logger.error("Lost MongoDB connection while querying %s: %s", collection_name, e)
+    except Exception as e:
+        logger.error("Failed to query items in %s: %s", collection_name, e)
+    return None
+
 '''
 Close the mongo server connection
 '''
 def close_mongo_connection():
-    global mongo_client
+    global mongo_client, last_health_check
+    for aggregated_log in (inserted_log, upserted_log, write_errors_log):
+        aggregated_log.flush()
     if mongo_client:
         mongo_client.close()
         mongo_client = None
-        logging.info("MongoDB connection closed")
+        last_health_check = 0.0
+        logger.info("MongoDB connection closed")
 
 '''
 Runs a sample test connection to the mongo server when the python file is directly ran
 '''
 if __name__ == "__main__":
-    logging.info("Testing MongoDB connection")
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    logger.info("Testing MongoDB connection")
     db_instance = get_db()
 
     if db_instance is not None:
-        logging.info(f"Successfully obtained database instance: {db_instance.name}")
+        logger.info("Successfully obtained database instance: %s", db_instance.name)
     else:
-        logging.error("Failed to get database instance.")
+        logger.error("Failed to get database instance.")
     close_mongo_connection()
\ No newline at end of file
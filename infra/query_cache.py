@@ -0,0 +1,146 @@
+import hashlib
+import logging
+import os
+import time
+import zlib
+from bson import json_util
+from redis.exceptions import ConnectionError
+
+from infra import job_queries, job_search, mongodb_connector
+from infra.metrics import observe
+from infra.redis_connector import get_redis_binary_connection, mark_redis_unhealthy
+
+logger = logging.getLogger(__name__)
+
+# seconds a cached query result is kept, the generation counter usually invalidates it sooner
+QUERY_CACHE_TTL = int(os.getenv('QUERY_CACHE_TTL', '300'))
+QUERY_CACHE_PREFIX = os.getenv('QUERY_CACHE_PREFIX', 'jobcache')
+# zlib level of the cached extended JSON, 1 is the fastest and already shrinks job documents about 4x
+QUERY_CACHE_COMPRESS_LEVEL = int(os.getenv('QUERY_CACHE_COMPRESS_LEVEL', '1'))
+# larger compressed results are served from MongoDB without being cached
+QUERY_CACHE_MAX_BYTES = int(os.getenv('QUERY_CACHE_MAX_BYTES', str(1024 * 1024)))
+
+'''
+Read-through Redis cache of query results
+An entry is stored under <prefix>:<collection>:<hash of the normalized query, projection and
+options> with a TTL, as "<generation>:" followed by the zlib compressed extended JSON of the result
+(dates and ObjectIds survive the round trip). The generation is a per collection counter the
+ingestion pipelines increment when a crawl wrote to the collection: one MGET reads the counter and
+the entry, an entry of an older generation is a miss and gets overwritten, stale entries of earlier
+crawls are left to their TTL and to the volatile-lru eviction of the Redis server
+When Redis is down every call goes straight to MongoDB
+'''
+
+def generation_key(collection_name):
+    return f"{QUERY_CACHE_PREFIX}:{collection_name}:generation"
+
+'''
+Key of a cached result, the same for equal queries whatever the order of their dict keys
+'''
+def cache_key(collection_name, operation, query, projection=None, **options):
+    normalized = json_util.dumps({'op': operation, 'query': query, 'projection': projection, 'options': options}, sort_keys=True)
+    digest = hashlib.blake2b(normalized.encode('utf-8'), digest_size=16).hexdigest()
+    return f"{QUERY_CACHE_PREFIX}:{collection_name}:{digest}"
+
+def encode_entry(generation, value):
+    return generation + b':' + zlib.compress(json_util.dumps(value).encode('utf-8'), QUERY_CACHE_COMPRESS_LEVEL)
+
+def decode_entry(generation, entry):
+    prefix = generation + b':'
+    if entry is None or not entry.startswith(prefix):
+        return None
+    return json_util.loads(zlib.decompress(entry[len(prefix):]).decode('utf-8'))
+
+'''
+Returns the cached value of key for the current generation of the collection, else runs loader(),
+caches what it returns (unless it is None) for ttl seconds and returns it
+The hit and miss latencies are recorded as query_cache/hit and query_cache/miss
+'''
+def read_through(collection_name, key, loader, ttl=None):
+    started_at = time.perf_counter()
+    r = get_redis_binary_connection()
+    if r is None:
+        return loader()
+    try:
+        generation, entry = r.mget([generation_key(collection_name), key])
+        generation = generation or b'0'
+        value = decode_entry(generation, entry)
+    except ConnectionError as e:
+        mark_redis_unhealthy()
+        logger.error("Lost Redis connection while reading the query cache: %s", e)
+        return loader()
+    except Exception as e:
+        logger.error("Failed to read the query cache entry %s: %s", key, e)
+        generation, value = b'0', None
+    if value is not None:
+        observe('query_cache/hit', time.perf_counter() - started_at)
+        return value
+
+    value = loader()
+    if value is not None:
+        try:
+            payload = encode_entry(generation, value)
+            if len(payload) <= QUERY_CACHE_MAX_BYTES:
+                r.set(key, payload, ex=ttl or QUERY_CACHE_TTL)
+        except ConnectionError as e:
+            mark_redis_unhealthy()
+            logger.error("Lost Redis connection while writing the query cache: %s", e)
+        except Exception as e:
+            logger.error("Failed to write the query cache entry %s: %s", key, e)
+    observe('query_cache/miss', time.perf_counter() - started_at)
+    return value
+
+'''
+Cached infra.mongodb_connector.find_item, returns the list of documents
+Empty results are not cached, find_item returns them on errors as well
+'''
+def cached_find_item(query: dict, collection_name: str, projection: dict = None, ttl: int = None):
+    key = cache_key(collection_name, 'find_item', query, projection)
+    return read_through(collection_name, key, lambda: mongodb_connector.find_item(query, collection_name, projection) or None, ttl) or []
+
+'''
+Cached infra.job_queries.find_jobs_page, returns (documents, next_after) like it
+'''
+def cached_find_jobs_page(query: dict, collection_name: str, projection: dict = None, sort=None, limit: int = job_queries.DEFAULT_PAGE_SIZE, after=None, ttl: int = None):
+    key = cache_key(collection_name, 'find_jobs_page', query, projection, sort=sort, limit=limit, after=list(after) if after is not None else None)
+
+    def load_page():
+        documents, next_after = job_queries.find_jobs_page(query, collection_name, projection, sort=sort, limit=limit, after=after)
+        # find_jobs_page also returns an empty page on errors, those are not cached
+        if not documents:
+            return None
+        return {'documents': documents, 'next_after': list(next_after) if next_after is not None else None}
+
+    page = read_through(collection_name, key, load_page, ttl)
+    if page is None:
+        return [], None
+    next_after = page['next_after']
+    return page['documents'], tuple(next_after) if next_after is not None else None
+
+'''
+Cached infra.job_search.search_jobs, returns the list of documents, empty results are not cached
+'''
+def cached_search_jobs(keywords, collection_name: str, phrases=None, exclude=None, country_code=None, employment_type=None, projection: dict = None, limit: int = job_search.DEFAULT_SEARCH_LIMIT, skip: int = 0, ttl: int = None):
+    query = job_search.search_query(keywords, phrases, exclude, country_code, employment_type)
+    key = cache_key(collection_name, 'search_jobs', query, projection, limit=limit, skip=skip)
+    return read_through(collection_name, key, lambda: job_search.search_jobs(keywords, collection_name, phrases, exclude, country_code, employment_type, projection, limit, skip) or None, ttl) or []
+
+'''
+Increments the generation of the collection, which invalidates every cached result of it
+Called by the MongoDB pipelines when a crawl wrote to the collection
+Returns the new generation, None if Redis failed
+'''
+def bump_generation(collection_name: str):
+    r = get_redis_binary_connection()
+    if r is None:
+        return None
+    try:
+        generation = r.incr(generation_key(collection_name))
+        logger.info("Query cache of %s is now at generation %s", collection_name, generation)
+        return generation
+    except ConnectionError as e:
+        mark_redis_unhealthy()
+        logger.error("Lost Redis connection while bumping the query cache generation of %s: %s", collection_name, e)
+    except Exception as e:
+        logger.error("Failed to bump the query cache generation of %s: %s", collection_name, e)
+    return None
@@ -1,13 +1,37 @@
 import os
+import hashlib
 import logging
+import time
 import redis
 from redis.exceptions import ConnectionError
 
-logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+from infra.logging_utils import AggregatedLog
+from infra.metrics import timed
+
+# the handlers are configured by the application (Scrapy, the benchmarks), the hot path helpers
+# log a summary per LOG_AGGREGATE_INTERVAL instead of a line per call
+logger = logging.getLogger(__name__)
+added_log = AggregatedLog(logger, "Added %d new ids to Redis set '%s'")
 
 REDIS_URL = os.getenv('REDIS_URI', 'redis://localhost:6379/0')
+# Redis of the query cache (infra/query_cache.py), a separate instance in docker-compose.yml so that
+# its maxmemory eviction never reaches the dedup keys, the expiring dedup windows included
+REDIS_CACHE_URL = os.getenv('REDIS_CACHE_URI', REDIS_URL)
+
+# connection pool sizing and timeouts handed to the redis ConnectionPool
+REDIS_MAX_CONNECTIONS = int(os.getenv('REDIS_MAX_CONNECTIONS', '50'))
+REDIS_SOCKET_TIMEOUT = float(os.getenv('REDIS_SOCKET_TIMEOUT', '5'))
+REDIS_SOCKET_CONNECT_TIMEOUT = float(os.getenv('REDIS_SOCKET_CONNECT_TIMEOUT', '5'))
+# seconds a pooled connection may stay idle before redis-py pings it on its next use
+REDIS_HEALTH_CHECK_INTERVAL = int(os.getenv('REDIS_HEALTH_CHECK_INTERVAL', '30'))
+
+# hashed id storage (add_many_to_hashed_set), number of sets the 64 bit ids are spread over
+# keep ids per bucket under the server's set-max-intset-entries so every bucket stays an intset
+REDIS_HASHED_SET_BUCKETS = int(os.getenv('REDIS_HASHED_SET_BUCKETS', '65536'))
 
 redis_pool = None
+redis_client = None
+redis_binary_client = None
 
 '''
 Creates a redis connection pool
@@ -18,100 +42,492 @@ def get_redis_pool():
     global redis_pool
     if redis_pool is None:
         try:
-            logging.info(f"Trying to create a Redis Connection pool for the URL: {REDIS_URL}")
-            redis_pool = redis.ConnectionPool.from_url(REDIS_URL, decode_responses=True)
+            logger.info("Trying to create a Redis Connection pool for the URL: %s", REDIS_URL)
+            redis_pool = redis.ConnectionPool.from_url(
+                REDIS_URL,
+                decode_responses=True,
+                max_connections=REDIS_MAX_CONNECTIONS,
+                socket_timeout=REDIS_SOCKET_TIMEOUT,
+                socket_connect_timeout=REDIS_SOCKET_CONNECT_TIMEOUT,
+                health_check_interval=REDIS_HEALTH_CHECK_INTERVAL,
+            )
             temp_client = redis.Redis(connection_pool=redis_pool)
             temp_client.ping()
-            logging.info("Redis connection created")
+            logger.info("Redis connection created")
         except ConnectionError as e:
-            logging.error(f"Failed to create a Redis connection pool: {e}")
+            logger.error("Failed to create a Redis connection pool: %s", e)
             redis_pool = None
         except Exception as e:
-            logging.error(f"Unexpected error while connecting to Redis: {e}")
+            logger.error("Unexpected error while connecting to Redis: %s", e)
     return redis_pool
 
 '''
-returns the redis connection
+returns the long lived redis client shared by the helpers
+The pool already pinged the server when it was created, idle connections are checked
+by redis-py itself (REDIS_HEALTH_CHECK_INTERVAL), so no PING is sent here unless a
+helper marked the client unhealthy after a connection error
 '''
 def get_redis_connection():
+    global redis_client
+    if redis_client is not None:
+        return redis_client
     pool = get_redis_pool()
     if pool:
         try:
             r = redis.Redis(connection_pool=pool)
             r.ping()
+            redis_client = r
             return r
         except ConnectionError as e:
-            logging.error(f"Error getting redis connection: {e}")
+            logger.error("Error getting redis connection: %s", e)
             return None
     else:
-        logging.error("Cannot get Redis connection, pool is not available")
+        logger.error("Cannot get Redis connection, pool is not available")
         return None
 
+'''
+Returns the client of the query cache Redis (REDIS_CACHE_URL), with its own pool that leaves the
+replies as bytes for the compressed entries of infra.query_cache, None if Redis is not reachable
+'''
+def get_redis_binary_connection():
+    global redis_binary_client
+    if redis_binary_client is not None:
+        return redis_binary_client
+    try:
+        pool = redis.ConnectionPool.from_url(
+            REDIS_CACHE_URL,
+            decode_responses=False,
+            max_connections=REDIS_MAX_CONNECTIONS,
+            socket_timeout=REDIS_SOCKET_TIMEOUT,
+            socket_connect_timeout=REDIS_SOCKET_CONNECT_TIMEOUT,
+            health_check_interval=REDIS_HEALTH_CHECK_INTERVAL,
+        )
+        r = redis.Redis(connection_pool=pool)
+        r.ping()
+        redis_binary_client = r
+        return r
+    except ConnectionError as e:
+        logger.error("Error getting binary redis connection: %s", e)
+    except Exception as e:
+        logger.error("Unexpected error while connecting to Redis: %s", e)
+    return None
+
+'''
+Drops the cached clients so the next get_redis_connection call pings the server again
+Called by the helpers when a command fails with a connection error
+'''
+def mark_redis_unhealthy():
+    global redis_client, redis_binary_client
+    redis_client = None
+    if redis_binary_client is not None:
+        redis_binary_client.connection_pool.disconnect()
+        redis_binary_client = None
+
 '''
 Sets the key-value pair in redis
 Return True if the key and value added to redis else false
 '''
+@timed('redis/set_value')
 def set_value(key: str, value: str, expire_seconds: int = None):
     r = get_redis_connection()
     if r:
         try:
             r.set(key, value, ex=expire_seconds)
-            logging.info(f"Set redis key '{key}' and it expires in {expire_seconds}")
+            logger.debug("Set redis key '%s' and it expires in %s", key, expire_seconds)
             return True
+        except ConnectionError as e:
+            mark_redis_unhealthy()
+            logger.error("Lost Redis connection while setting key %s: %s", key, e)
         except Exception as s:
-            logging.error(f"Failed to set Redis key {key}")
+            logger.error("Failed to set Redis key %s", key)
     return False
 
 '''
 Gets the value for the key from redis cache
 if key doesn't exist return None
 '''
+@timed('redis/get_value')
 def get_value(key: str):
     r = get_redis_connection()
     value = None
     if r:
         try:
             value = r.get(key)
-            logging.info(f"Got the value for the key: {key}")
+            logger.debug("Got the value for the key: %s", key)
+        except ConnectionError as e:
+            mark_redis_unhealthy()
+            logger.error("Lost Redis connection while getting key: %s: %s", key, e)
         except Exception as e:
-            logging.error(f"Got an error when getting key: {key}")
+            logger.error("Got an error when getting key: %s", key)
     return value
 
 '''
 Added the value to set if not already present
-return the status of adding the value
+SADD is atomic, so its return value is both the membership check and the add
+return True if the value was added, False if it was already present and None if Redis failed
 Logs error if any
 '''
+@timed('redis/add_to_set')
 def add_to_set(set_name: str, value: str):
     r = get_redis_connection()
-    added = False
+    added = None
     if r:
         try:
             result = r.sadd(set_name, value)
             added = (result == 1)
-            logging.info(f"Value '{value}' {'added to' if added else 'already exists in'} Redis set '{set_name}'")
+            logger.debug("Value '%s' %s Redis set '%s'", value, 'added to' if added else 'already exists in', set_name)
+        except ConnectionError as e:
+            mark_redis_unhealthy()
+            logger.error("Lost Redis connection while adding %s to %s: %s", value, set_name, e)
         except Exception as e:
-            logging.error(f"Failed to add the {value} because of exception: {e}")
+            logger.error("Failed to add the %s because of exception: %s", value, e)
     return added
 
+'''
+Adds a batch of values to the set in one round trip using a non transactional pipeline
+Each SADD is still atomic, so a value repeated inside the batch is only reported as added once
+return a list with True/False per value (added / already present), None if Redis failed
+'''
+@timed('redis/add_many_to_set')
+def add_many_to_set(set_name: str, values: list):
+    if not values:
+        return []
+    r = get_redis_connection()
+    if r:
+        try:
+            pipe = r.pipeline(transaction=False)
+            for value in values:
+                pipe.sadd(set_name, value)
+            results = [result == 1 for result in pipe.execute()]
+            added_log.add(sum(results), set_name)
+            return results
+        except ConnectionError as e:
+            mark_redis_unhealthy()
+            logger.error("Lost Redis connection while adding %s values to Redis set '%s': %s", len(values), set_name, e)
+        except Exception as e:
+            logger.error("Failed to add %s values to Redis set '%s': %s", len(values), set_name, e)
+    return None
+
+'''
+Iterates over the members of the set with SSCAN, count members per round trip
+Unlike SMEMBERS it does not block the server on a large set
+If Redis fails the iteration stops early and the error is logged
+'''
+def scan_set(set_name: str, count: int = 1000):
+    r = get_redis_connection()
+    if not r:
+        return
+    try:
+        yield from r.sscan_iter(set_name, count=count)
+    except ConnectionError as e:
+        mark_redis_unhealthy()
+        logger.error("Lost Redis connection while scanning Redis set '%s': %s", set_name, e)
+    except Exception as e:
+        logger.error("Failed to scan Redis set '%s': %s", set_name, e)
+
+'''
+Returns the number of members of the set, None if Redis failed
+'''
+@timed('redis/set_size')
+def set_size(set_name: str):
+    r = get_redis_connection()
+    if r:
+        try:
+            return r.scard(set_name)
+        except ConnectionError as e:
+            mark_redis_unhealthy()
+            logger.error("Lost Redis connection while counting Redis set '%s': %s", set_name, e)
+        except Exception as e:
+            logger.error("Failed to count Redis set '%s': %s", set_name, e)
+    return None
+
+'''
+Hashed id storage, a compact alternative to one plain set of raw ids
+Every id is reduced to a signed 64 bit blake2b digest and stored as an integer in one of
+`buckets` sets named {set_name}:h:{bucket}. Redis keeps sets of integers as an intset,
+8 bytes per id, instead of a hash table entry plus the id string
+With expire_seconds the sets are also split into time windows of expire_seconds / expire_windows,
+named {set_name}:h:{window}:{bucket}, each expiring on its own. An id counts as seen while any of
+the last expire_windows + 1 windows holds it, so it is forgotten between expire_seconds and
+expire_seconds plus one window after it was first added
+Two different ids collide with a probability of about n / 2**64 for n stored ids
+'''
+def hashed_member(value: str):
+    digest = hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'big', signed=True)
+
+def hashed_set_pattern(set_name: str):
+    return f"{set_name}:h:*"
+
+def hashed_set_keys(set_name: str, member: int, buckets: int = REDIS_HASHED_SET_BUCKETS, expire_seconds: int = None, expire_windows: int = 4, now: float = None):
+    bucket = member % buckets
+    if not expire_seconds:
+        return [f"{set_name}:h:{bucket}"]
+    window_seconds = max(1, expire_seconds // expire_windows)
+    window = int((time.time() if now is None else now) // window_seconds)
+    return [f"{set_name}:h:{window - age}:{bucket}" for age in range(expire_windows + 1)]
+
+# KEYS[1] is the current window, the others the older ones, ARGV: member, ttl of the current window
+ADD_TO_WINDOWED_SET_SCRIPT = """
+for i = 2, #KEYS do
+    if redis.call('SISMEMBER', KEYS[i], ARGV[1]) == 1 then
+        return 0
+    end
+end
+local added = redis.call('SADD', KEYS[1], ARGV[1])
+if added == 1 and redis.call('TTL', KEYS[1]) < 0 then
+    redis.call('EXPIRE', KEYS[1], ARGV[2])
+end
+return added
+"""
+
+'''
+Hashed version of add_many_to_set, values are the raw ids
+Without expiry it is one pipelined SADD per id, with expiry one script call per id that
+checks the older windows and adds to the current one atomically
+return a list with True/False per value (added / already present), None if Redis failed
+'''
+@timed('redis/add_many_to_hashed_set')
+def add_many_to_hashed_set(set_name: str, values: list, buckets: int = REDIS_HASHED_SET_BUCKETS, expire_seconds: int = None, expire_windows: int = 4):
+    if not values:
+        return []
+    r = get_redis_connection()
+    if r:
+        try:
+            now = time.time()
+            pipe = r.pipeline(transaction=False)
+            if expire_seconds:
+                ttl = max(1, expire_seconds // expire_windows) * (expire_windows + 1)
+                script = r.register_script(ADD_TO_WINDOWED_SET_SCRIPT)
+                for value in values:
+                    member = hashed_member(value)
+                    script(keys=hashed_set_keys(set_name, member, buckets, expire_seconds, expire_windows, now), args=[member, ttl], client=pipe)
+            else:
+                for value in values:
+                    member = hashed_member(value)
+                    pipe.sadd(hashed_set_keys(set_name, member, buckets)[0], member)
+            results = [result == 1 for result in pipe.execute()]
+            added_log.add(sum(results), hashed_set_pattern(set_name))
+            return results
+        except ConnectionError as e:
+            mark_redis_unhealthy()
+            logger.error("Lost Redis connection while adding %s hashed values to Redis sets '%s': %s", len(values), hashed_set_pattern(set_name), e)
+        except Exception as e:
+            logger.error("Failed to add %s hashed values to Redis sets '%s': %s", len(values), hashed_set_pattern(set_name), e)
+    return None
+
+@timed('redis/add_to_hashed_set')
+def add_to_hashed_set(set_name: str, value: str, **kwargs):
+    results = add_many_to_hashed_set(set_name, [value], **kwargs)
+    return results[0] if results else None
+
+'''
+Checks for the id in the hashed sets, in any of the live windows when expiry is used
+'''
+@timed('redis/is_hashed_member')
+def is_hashed_member(set_name: str, value: str, buckets: int = REDIS_HASHED_SET_BUCKETS, expire_seconds: int = None, expire_windows: int = 4):
+    r = get_redis_connection()
+    member = False
+    if r:
+        try:
+            hashed = hashed_member(value)
+            pipe = r.pipeline(transaction=False)
+            for key in hashed_set_keys(set_name, hashed, buckets, expire_seconds, expire_windows):
+                pipe.sismember(key, hashed)
+            member = any(pipe.execute())
+        except ConnectionError as e:
+            mark_redis_unhealthy()
+            logger.error("Lost Redis connection while checking the hashed member %s in %s: %s", value, hashed_set_pattern(set_name), e)
+        except Exception as e:
+            logger.error("Received an error while checking the hashed member %s in %s: %s", value, hashed_set_pattern(set_name), e)
+    return member
+
+'''
+Iterates over the hashed members (as strings) of all the bucket sets with SCAN and SSCAN
+If Redis fails the iteration stops early and the error is logged
+'''
+def scan_hashed_set(set_name: str, count: int = 1000):
+    r = get_redis_connection()
+    if not r:
+        return
+    try:
+        for key in r.scan_iter(match=hashed_set_pattern(set_name), count=count):
+            yield from r.sscan_iter(key, count=count)
+    except ConnectionError as e:
+        mark_redis_unhealthy()
+        logger.error("Lost Redis connection while scanning Redis sets '%s': %s", hashed_set_pattern(set_name), e)
+    except Exception as e:
+        logger.error("Failed to scan Redis sets '%s': %s", hashed_set_pattern(set_name), e)
+
+'''
+Returns the number of hashed members over all the bucket sets (ids in several windows count once per window),
+None if Redis failed
+'''
+@timed('redis/hashed_set_size')
+def hashed_set_size(set_name: str, count: int = 1000):
+    r = get_redis_connection()
+    if r:
+        try:
+            keys = list(r.scan_iter(match=hashed_set_pattern(set_name), count=count))
+            total = 0
+            for start in range(0, len(keys), count):
+                pipe = r.pipeline(transaction=False)
+                for key in keys[start:start + count]:
+                    pipe.scard(key)
+                total += sum(pipe.execute())
+            return total
+        except ConnectionError as e:
+            mark_redis_unhealthy()
+            logger.error("Lost Redis connection while counting Redis sets '%s': %s", hashed_set_pattern(set_name), e)
+        except Exception as e:
+            logger.error("Failed to count Redis sets '%s': %s", hashed_set_pattern(set_name), e)
+    return None
+
+'''
+Content keyed storage, one hash field per id holding the content hash of its latest version,
+so a changed posting replaces its entry instead of adding one per version
+The plain variant keeps the raw ids and hashes in the hash hash_name, the hashed one their 64 bit
+digests in bucketed hashes named like the hashed sets ({hash_name}:h:{bucket}, with the time
+windows when expire_seconds is given), which Redis keeps as listpacks while they stay small
+'''
+# KEYS: the hashes that may hold the id, newest first, ARGV: id, content hash, ttl of KEYS[1] (0 for none)
+# the newest hash holding the id decides, an unchanged content hash returns 0, otherwise it is stored in KEYS[1]
+STORE_IF_CHANGED_SCRIPT = """
+for i = 1, #KEYS do
+    local stored = redis.call('HGET', KEYS[i], ARGV[1])
+    if stored then
+        if stored == ARGV[2] then
+            return 0
+        end
+        break
+    end
+end
+redis.call('HSET', KEYS[1], ARGV[1], ARGV[2])
+if tonumber(ARGV[3]) > 0 and redis.call('TTL', KEYS[1]) < 0 then
+    redis.call('EXPIRE', KEYS[1], ARGV[3])
+end
+return 1
+"""
+
+def content_hash_entries(hash_name: str, pairs: list, hashed: bool = False, buckets: int = REDIS_HASHED_SET_BUCKETS, expire_seconds: int = None, expire_windows: int = 4):
+    if not hashed:
+        return [([hash_name], field, value) for field, value in pairs], 0
+    now = time.time()
+    ttl = max(1, expire_seconds // expire_windows) * (expire_windows + 1) if expire_seconds else 0
+    entries = []
+    for field, value in pairs:
+        member = hashed_member(field)
+        entries.append((hashed_set_keys(hash_name, member, buckets, expire_seconds, expire_windows, now), member, hashed_member(value)))
+    return entries, ttl
+
+'''
+Stores the (id, content hash) pairs with one script call per pair in a pipelined round trip
+return a list with True/False per pair (new or changed / unchanged), None if Redis failed
+'''
+@timed('redis/store_many_if_changed')
+def store_many_if_changed(hash_name: str, pairs: list, **kwargs):
+    if not pairs:
+        return []
+    r = get_redis_connection()
+    if r:
+        try:
+            entries, ttl = content_hash_entries(hash_name, pairs, **kwargs)
+            script = r.register_script(STORE_IF_CHANGED_SCRIPT)
+            pipe = r.pipeline(transaction=False)
+            for keys, field, value in entries:
+                script(keys=keys, args=[field, value, ttl], client=pipe)
+            results = [result == 1 for result in pipe.execute()]
+            added_log.add(sum(results), hash_name)
+            return results
+        except ConnectionError as e:
+            mark_redis_unhealthy()
+            logger.error("Lost Redis connection while storing %s content hashes in '%s': %s", len(pairs), hash_name, e)
+        except Exception as e:
+            logger.error("Failed to store %s content hashes in '%s': %s", len(pairs), hash_name, e)
+    return None
+
+'''
+Iterates over the (id, content hash) pairs with HSCAN, over all the bucket hashes when hashed
+(the digests are returned as strings)
+If Redis fails the iteration stops early and the error is logged
+'''
+def scan_content_hashes(hash_name: str, hashed: bool = False, count: int = 1000):
+    r = get_redis_connection()
+    if not r:
+        return
+    try:
+        keys = r.scan_iter(match=hashed_set_pattern(hash_name), count=count) if hashed else [hash_name]
+        for key in keys:
+            yield from r.hscan_iter(key, count=count)
+    except ConnectionError as e:
+        mark_redis_unhealthy()
+        logger.error("Lost Redis connection while scanning the content hashes '%s': %s", hash_name, e)
+    except Exception as e:
+        logger.error("Failed to scan the content hashes '%s': %s", hash_name, e)
+
+'''
+Returns the number of stored ids (ids in several windows count once per window), None if Redis failed
+'''
+@timed('redis/content_hashes_size')
+def content_hashes_size(hash_name: str, hashed: bool = False, count: int = 1000):
+    r = get_redis_connection()
+    if r:
+        try:
+            if not hashed:
+                return r.hlen(hash_name)
+            keys = list(r.scan_iter(match=hashed_set_pattern(hash_name), count=count))
+            total = 0
+            for start in range(0, len(keys), count):
+                pipe = r.pipeline(transaction=False)
+                for key in keys[start:start + count]:
+                    pipe.hlen(key)
+                total += sum(pipe.execute())
+            return total
+        except ConnectionError as e:
+            mark_redis_unhealthy()
+            logger.error("Lost Redis connection while counting the content hashes '%s': %s", hash_name, e)
+        except Exception as e:
+            logger.error("Failed to count the content hashes '%s': %s", hash_name, e)
+    return None
+
 '''
 Checks foe the slug in the redis cache
 '''
+@timed('redis/is_member')
 def is_member(set_name: str, value: str):
     r = get_redis_connection()
     member = False
     if r:
         try:
             member = r.sismember(set_name, value)
-            logging.info(f"Checked membership for {value} in {set_name}: {member}")
+            logger.debug("Checked membership for %s in %s: %s", value, set_name, member)
+        except ConnectionError as e:
+            mark_redis_unhealthy()
+            logger.error("Lost Redis connection while checking the member %s in %s: %s", value, set_name, e)
         except Exception as e:
-            logging.error(f"Received an error while checking the member if {value} in {set_name}: {e}")
+            logger.error("Received an error while checking the member if %s in %s: %s", value, set_name, e)
     return member
 
+'''
+Logs the pending summaries and disconnects the pooled connections, the next helper call reconnects
+'''
+def close_redis_connection():
+    global redis_pool, redis_client, redis_binary_client
+    added_log.flush()
+    if redis_binary_client is not None:
+        redis_binary_client.connection_pool.disconnect()
+        redis_binary_client = None
+    if redis_pool is not None:
+        redis_pool.disconnect()
+        redis_pool = None
+        redis_client = None
+        logger.info("Redis connection closed")
+
 if __name__ == "__main__":
-    logging.info("Testing Redis Connection")
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    logger.info("Testing Redis Connection")
     redis_conn = get_redis_connection()
     if redis_conn:
-        logging.info("Successfully obtained the redis connection")
+        logger.info("Successfully obtained the redis connection")
     else:
-        logging.error("Failed to connect to Redis")
\ No newline at end of file
+        logger.error("Failed to connect to Redis")
\ No newline at end of file
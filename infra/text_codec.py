@@ -0,0 +1,260 @@
+import logging
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+import bson
+from bson.binary import Binary
+from pymongo import ASCENDING, DESCENDING
+from pymongo.errors import ConnectionFailure
+
+from infra.metrics import observe
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# collection holding the trained dictionaries, one document per collection and version
+TEXT_CODEC_COLLECTION = os.getenv('TEXT_CODEC_COLLECTION', 'text_codec_dictionaries')
+# the fields the codec may store compressed, the readers only look at these
+CODEC_FIELDS = ('description', 'meta_data')
+# binary subtypes (user defined range) of a compressed string and of a compressed BSON document
+TEXT_SUBTYPE = 0x80
+DOCUMENT_SUBTYPE = 0x81
+# zstd's default dictionary size
+DEFAULT_DICT_SIZE = 112640
+DEFAULT_LEVEL = 3
+
+'''
+Dictionary compression of the large text fields of the job documents
+description repeats kilobytes of boilerplate across the postings of a brand, which generic
+compression of a single document barely catches. A zstd dictionary trained on a sample of the
+ingested jobs holds that shared text, so each value compresses against it
+A compressed value is stored in its field as a Binary of TEXT_SUBTYPE (utf-8 text) or
+DOCUMENT_SUBTYPE (a BSON document, for meta_data) holding one zstd frame. The frame header carries
+the id of its dictionary, the dictionaries are stored by version in TEXT_CODEC_COLLECTION and never
+deleted, so documents written with an older version stay readable after a retraining
+Values stored in the clear are left as they are by the readers, the codec can be switched on or
+off at any time
+'''
+
+# ZstdCompressionDict per dictionary id, shared by the threads
+dictionaries = {}
+# ZstdDecompressor per dictionary id, per thread as they must not be used concurrently
+decompressors = threading.local()
+
+def available():
+    return zstandard is not None
+
+def value_bytes(value):
+    if isinstance(value, str):
+        return TEXT_SUBTYPE, value.encode('utf-8')
+    if isinstance(value, dict):
+        return DOCUMENT_SUBTYPE, bson.encode(value)
+    return None, None
+
+def is_encoded(value):
+    return isinstance(value, Binary) and value.subtype in (TEXT_SUBTYPE, DOCUMENT_SUBTYPE)
+
+"""
+    Compresses the CODEC_FIELDS values of documents with one trained dictionary.
+    Not thread safe, every writer keeps its own.
+"""
+class TextCodec:
+    def __init__(self, dictionary_data, version, fields=('description',), level=DEFAULT_LEVEL):
+        self.dictionary = zstandard.ZstdCompressionDict(dictionary_data)
+        self.dict_id = self.dictionary.dict_id()
+        self.version = version
+        self.fields = tuple(field for field in fields if field in CODEC_FIELDS)
+        self.level = level
+        self.dictionary.precompute_compress(level=level)
+        self.compressor = zstandard.ZstdCompressor(dict_data=self.dictionary, level=level)
+        dictionaries.setdefault(self.dict_id, self.dictionary)
+
+    '''
+    Replaces the codec fields of the document by their compressed value
+    Returns (bytes before, bytes stored) of the compressed fields, a value that would not get
+    smaller is kept in the clear
+    '''
+    def encode_document(self, document):
+        raw_bytes = stored_bytes = 0
+        started_at = time.perf_counter()
+        for field in self.fields:
+            subtype, data = value_bytes(document.get(field))
+            if data is None:
+                continue
+            compressed = self.compressor.compress(data)
+            raw_bytes += len(data)
+            if len(compressed) < len(data):
+                document[field] = Binary(compressed, subtype)
+                stored_bytes += len(compressed)
+            else:
+                stored_bytes += len(data)
+        if raw_bytes:
+            observe('codec/encode', time.perf_counter() - started_at)
+        return raw_bytes, stored_bytes
+
+def decompressor(db, dict_id):
+    cache = getattr(decompressors, 'by_id', None)
+    if cache is None:
+        cache = decompressors.by_id = {}
+    if dict_id not in cache:
+        dictionary = dictionaries.get(dict_id) or load_dictionary(db, dict_id)
+        if dictionary is None:
+            return None
+        cache[dict_id] = zstandard.ZstdDecompressor(dict_data=dictionary)
+    return cache[dict_id]
+
+def load_dictionary(db, dict_id):
+    if db is None:
+        return None
+    document = db[TEXT_CODEC_COLLECTION].find_one({'dict_id': dict_id})
+    if document is None:
+        logger.error("Text codec dictionary %s is missing from %s, its values cannot be decoded", dict_id, TEXT_CODEC_COLLECTION)
+        return None
+    return dictionaries.setdefault(dict_id, zstandard.ZstdCompressionDict(document['dictionary']))
+
+'''
+Restores the compressed codec fields of a document in place and returns it
+A value that cannot be decoded (zstandard missing, unknown dictionary) is left as the Binary
+'''
+def decode_document(document, db):
+    started_at = None
+    for field in CODEC_FIELDS:
+        value = document.get(field)
+        if not is_encoded(value):
+            continue
+        if started_at is None:
+            started_at = time.perf_counter()
+        if zstandard is None:
+            logger.error("zstandard is not installed, cannot decode the compressed %s", field)
+            continue
+        try:
+            dict_id = zstandard.get_frame_parameters(value).dict_id
+            frame_decompressor = decompressor(db, dict_id)
+            if frame_decompressor is None:
+                continue
+            data = frame_decompressor.decompress(value)
+        except Exception as e:
+            logger.error("Failed to decode the compressed %s: %s", field, e)
+            continue
+        document[field] = data.decode('utf-8') if value.subtype == TEXT_SUBTYPE else bson.decode(data)
+    if started_at is not None:
+        observe('codec/decode', time.perf_counter() - started_at)
+    return document
+
+def decode_documents(documents, db):
+    for document in documents:
+        decode_document(document, db)
+    return documents
+
+"""
+    Cursor decoding the documents as they are iterated, the rest is left to the pymongo cursor.
+"""
+class DecodingCursor:
+    def __init__(self, cursor, db):
+        self.cursor = cursor
+        self.db = db
+
+    def __iter__(self):
+        for document in self.cursor:
+            yield decode_document(document, self.db)
+
+    def __getattr__(self, name):
+        return getattr(self.cursor, name)
+
+'''
+Latest dictionary version stored for the collection, None if there is none yet or on errors
+'''
+def latest_dictionary(db, collection_name: str):
+    try:
+        return db[TEXT_CODEC_COLLECTION].find_one({'collection': collection_name}, sort=[('version', DESCENDING)])
+    except ConnectionFailure as e:
+        logger.error("Lost MongoDB connection while loading the text codec dictionary of %s: %s", collection_name, e)
+    except Exception as e:
+        logger.error("Failed to load the text codec dictionary of %s: %s", collection_name, e)
+    return None
+
+'''
+TextCodec of the latest dictionary version of the collection, None if there is none yet
+'''
+def load_codec(db, collection_name: str, fields=('description',), level=DEFAULT_LEVEL):
+    if zstandard is None:
+        logger.error("zstandard is not installed, the text codec is disabled")
+        return None
+    document = latest_dictionary(db, collection_name)
+    if document is None:
+        return None
+    codec = TextCodec(document['dictionary'], document['version'], fields, level)
+    logger.info("Compressing %s of %s with text codec dictionary version %s", ', '.join(codec.fields), collection_name, codec.version)
+    return codec
+
+'''
+Trains a dictionary of dict_size bytes on the sample values (str or dict) and stores it as the
+next version for the collection
+Returns the TextCodec of the new version, None if the sample was too small or on errors
+'''
+def train_codec(db, collection_name: str, samples, fields=('description',), level=DEFAULT_LEVEL, dict_size=DEFAULT_DICT_SIZE):
+    if zstandard is None:
+        logger.error("zstandard is not installed, the text codec is disabled")
+        return None
+    sample_bytes = [data for _, data in map(value_bytes, samples) if data]
+    started_at = time.perf_counter()
+    try:
+        dictionary = zstandard.train_dictionary(dict_size, sample_bytes, level=level)
+    except zstandard.ZstdError as e:
+        logger.error("Could not train a text codec dictionary on %s samples of %s: %s", len(sample_bytes), collection_name, e)
+        return None
+    elapsed = time.perf_counter() - started_at
+    try:
+        dictionaries_collection = db[TEXT_CODEC_COLLECTION]
+        dictionaries_collection.create_index([('collection', ASCENDING), ('version', DESCENDING)], unique=True)
+        dictionaries_collection.create_index('dict_id')
+        latest = latest_dictionary(db, collection_name)
+        version = latest['version'] + 1 if latest is not None else 1
+        dictionaries_collection.insert_one({
+            'collection': collection_name,
+            'version': version,
+            'dict_id': dictionary.dict_id(),
+            'dictionary': Binary(dictionary.as_bytes()),
+            'fields': list(fields),
+            'samples': len(sample_bytes),
+            'sample_bytes': sum(map(len, sample_bytes)),
+            'created_at': datetime.now(timezone.utc),
+        })
+    except Exception as e:
+        logger.error("Failed to store the text codec dictionary of %s: %s", collection_name, e)
+        return None
+    logger.info("Trained text codec dictionary version %s of %s on %s samples in %.1fs", version, collection_name, len(sample_bytes), elapsed)
+    return TextCodec(dictionary.as_bytes(), version, fields, level)
+
+'''
+Sample values of the fields from the stored documents of the collection (in the clear only)
+'''
+def sample_values(db, collection_name: str, fields=('description',), sample_size=2000):
+    pipeline = [{'$sample': {'size': sample_size}}, {'$project': {field: 1 for field in fields}}]
+    values = []
+    for document in db[collection_name].aggregate(pipeline):
+        for field in fields:
+            value = document.get(field)
+            if isinstance(value, (str, dict)) and value:
+                values.append(value)
+    return values
+
+'''
+Trains a new dictionary version from the stored documents when the python file is directly ran
+'''
+if __name__ == "__main__":
+    import sys
+    from infra.mongodb_connector import get_db, close_mongo_connection
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+    collection = sys.argv[1] if len(sys.argv) > 1 else 'testing_jobs'
+    codec_fields = sys.argv[2].split(',') if len(sys.argv) > 2 else ['description']
+    db_instance = get_db()
+    if db_instance is not None:
+        train_codec(db_instance, collection, sample_values(db_instance, collection, codec_fields), codec_fields)
+    close_mongo_connection()
@@ -0,0 +1,215 @@
+import asyncio
+import logging
+import time
+from scrapy.exceptions import NotConfigured
+from scrapy.utils.defer import deferred_from_coro
+
+from jobs_project.pipelines import RedisDeduplicationPipeline, MongoDBPipeline
+
+# importing the asyncio connectors, they need redis.asyncio and pymongo's AsyncMongoClient
+try:
+    from infra import async_redis_connector, async_mongodb_connector
+    from infra.job_queries import job_index_models
+    from infra.metrics import timed
+except ImportError as e:
+    logging.error(f"Could not import the async connectors from 'infra' module: {e}. Ensure it's in the Python path.")
+    async_redis_connector = None
+    async_mongodb_connector = None
+    def job_index_models(): return []
+    def timed(name): return lambda func: func
+
+"""
+    Asyncio variant of RedisDeduplicationPipeline for the AsyncioSelectorReactor.
+    process_item is a coroutine awaiting redis.asyncio, so waiting for Redis never blocks the reactor.
+    Ids are still batched (REDIS_DEDUP_BATCH_SIZE, REDIS_DEDUP_FLUSH_INTERVAL) and the batches are sent
+    one after the other, which keeps the order of the SADDs the Bloom filter shortcut relies on.
+    The Bloom filter warm up and save use the blocking helpers in a worker thread.
+"""
+class AsyncRedisDeduplicationPipeline(RedisDeduplicationPipeline):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.flush_lock = None
+        self.flush_tasks = set()
+
+    @classmethod
+    def open_connection(cls):
+        if async_redis_connector is None:
+            raise NotConfigured("infra.async_redis_connector missing")
+        # connected in open_spider, on the event loop
+        return None
+
+    async def open_spider(self):
+        spider = self.crawler.spider
+        self.configure(spider)
+        self.flush_lock = asyncio.Lock()
+        self.redis_conn = await async_redis_connector.get_redis_connection()
+        if self.redis_conn is None:
+            logging.error("AsyncRedisDeduplicationPipeline: Redis is not reachable, items will be passed on unchecked")
+        if self.bloom_capacity > 0:
+            self.bloom = await asyncio.to_thread(self.open_bloom, spider)
+        self.start_flush_loop()
+
+    async def close_spider(self):
+        spider = self.spider
+        if self.flush_loop is not None and self.flush_loop.running:
+            self.flush_loop.stop()
+        await self.flush(spider)
+        if self.flush_tasks:
+            await asyncio.gather(*self.flush_tasks)
+        if self.bloom is not None:
+            await asyncio.to_thread(self.close_bloom, spider)
+        await async_redis_connector.close_redis_connection()
+        logging.info("Redis connection closed for deduplication pipeline.")
+
+    @timed('pipeline/redis_dedup')
+    async def process_item(self, item):
+        spider = self.spider
+        item_unique_id_str = self.dedup_id(item, spider)
+        if item_unique_id_str is None:
+            return item
+
+        if self.bloom is not None and self.bloom_passes(item_unique_id_str, spider):
+            if self.queue_add(item_unique_id_str):
+                self.schedule_flush(spider)
+            return item
+
+        waiter = asyncio.get_running_loop().create_future()
+        if self.queue_check(item_unique_id_str, item, waiter):
+            self.schedule_flush(spider)
+        return await waiter
+
+    def schedule_flush(self, spider):
+        flush = asyncio.ensure_future(self.flush(spider))
+        self.flush_tasks.add(flush)
+        flush.add_done_callback(self.flush_tasks.discard)
+
+    def flush_if_due(self):
+        if (self.pending or self.pending_adds) and time.monotonic() - self.pending_started_at >= self.flush_interval:
+            return deferred_from_coro(self.flush(self.spider))
+
+    async def flush(self, spider):
+        async with self.flush_lock:
+            if not self.pending and not self.pending_adds:
+                return
+            adds, batch = self.take_pending()
+            item_ids = adds + [item_id for item_id, _, _ in batch]
+            try:
+                results = await self.add_seen_ids_async(item_ids)
+            except Exception as e:
+                logging.error(f"Redis error during batched deduplication of {len(item_ids)} ids in set '{self.seen_set_key}': {e}", extra={'spider': spider})
+                results = None
+            self.finish_batch(adds, batch, results, spider)
+
+    async def add_seen_ids_async(self, item_ids):
+        if self.key_on_content:
+            return await async_redis_connector.store_many_if_changed(self.seen_set_key, [self.content_pair(item_id) for item_id in item_ids], **self.content_storage_options())
+        if self.storage == 'hashed':
+            return await async_redis_connector.add_many_to_hashed_set(self.seen_set_key, item_ids, expire_seconds=self.expire_seconds or None, expire_windows=self.expire_windows)
+        return await async_redis_connector.add_many_to_set(self.seen_set_key, item_ids)
+
+    def settle_waiter(self, future, result):
+        if not future.done():
+            future.set_result(result)
+
+    def fail_waiter(self, future, error):
+        if not future.done():
+            future.set_exception(error)
+
+"""
+    Asyncio variant of MongoDBPipeline for the AsyncioSelectorReactor, writing with pymongo's AsyncMongoClient.
+    process_item is a coroutine, the item that fills a batch awaits its write while the other items
+    move on, so up to MONGO_MAX_INFLIGHT_WRITES batches are written at the same time.
+"""
+class AsyncMongoDBPipeline(MongoDBPipeline):
+    def __init__(self, *args, max_inflight_writes=4, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.max_inflight_writes = max(1, max_inflight_writes)
+        self.write_slots = None
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        pipeline = super().from_crawler(crawler)
+        pipeline.max_inflight_writes = max(1, crawler.settings.getint('MONGO_MAX_INFLIGHT_WRITES', 4))
+        if pipeline.write_behind:
+            logging.warning("AsyncMongoDBPipeline does not use MONGO_WRITE_BEHIND, its writes already overlap the crawl")
+            pipeline.write_behind = False
+        return pipeline
+
+    @classmethod
+    def open_connection(cls):
+        if async_mongodb_connector is None:
+            raise NotConfigured("infra.async_mongodb_connector missing")
+        # connected in open_spider, on the event loop
+        return None
+
+    async def open_spider(self):
+        self.configure(self.crawler.spider)
+        self.write_slots = asyncio.Semaphore(self.max_inflight_writes)
+        self.mongo_db = await async_mongodb_connector.get_db()
+        if self.mongo_db is None:
+            logging.error("AsyncMongoDBPipeline: MongoDB is not reachable, writes will fail")
+        else:
+            try:
+                await self.mongo_db[self.collection_name].create_index(self.unique_key_field, unique=True)
+                logging.info(f"Ensured unique index on '{self.unique_key_field}' in collection '{self.collection_name}'")
+            except Exception as e:
+                logging.warning(f"Could not ensure unique index on '{self.unique_key_field}' in {self.collection_name}: {e}")
+            if self.query_indexes and job_index_models():
+                try:
+                    names = await self.mongo_db[self.collection_name].create_indexes(job_index_models())
+                    logging.info(f"Ensured query indexes {', '.join(names)} on {self.collection_name}")
+                except Exception as e:
+                    logging.warning(f"Could not ensure the query indexes on {self.collection_name}: {e}")
+        if self.text_codec:
+            # the dictionaries are read and stored with the blocking client, like the query cache
+            await asyncio.to_thread(self.open_codec)
+        self.start_flush_loop()
+
+    async def close_spider(self):
+        if self.flush_loop is not None and self.flush_loop.running:
+            self.flush_loop.stop()
+        await self.flush(self.spider)
+        # waits for the writes still in flight
+        for _ in range(self.max_inflight_writes):
+            await self.write_slots.acquire()
+        await asyncio.to_thread(self.invalidate_query_cache)
+        self.log_codec_savings()
+        await async_mongodb_connector.close_mongo_connection()
+
+    @timed('pipeline/mongodb')
+    async def process_item(self, item):
+        if self.buffer_item(self.to_document(item)):
+            await self.write_batch(self.take_buffer(), self.spider)
+        return item
+
+    def flush_if_due(self):
+        if self.buffer and self.flush_interval > 0 and time.monotonic() - self.buffer_started_at >= self.flush_interval:
+            return deferred_from_coro(self.flush(self.spider))
+
+    async def flush(self, spider):
+        if self.buffer:
+            await self.write_batch(self.take_buffer(), spider)
+
+    async def write_batch(self, batch, spider):
+        async with self.write_slots:
+            if self.write_mode == 'upsert':
+                await self.write_upserts(batch, spider)
+            else:
+                await self.write_inserts(batch, spider)
+
+    async def write_inserts(self, batch, spider):
+        result = await async_mongodb_connector.insert_items(batch, self.collection_name, ordered=False)
+        self.record_insert_result(batch, result, spider)
+
+    async def write_upserts(self, batch, spider):
+        latest, without_key = self.group_upserts(batch, spider)
+        if without_key:
+            await self.write_inserts(without_key, spider)
+        if not latest:
+            return
+        documents = await async_mongodb_connector.find_item(self.stored_hashes_query(latest), self.collection_name, self.stored_hashes_projection())
+        changed = self.changed_items(latest, documents, spider)
+        if not changed:
+            return
+        result = await async_mongodb_connector.upsert_items(changed, self.collection_name, self.unique_key_field, unset_fields=self.item_field_names, ordered=False)
+        self.record_upsert_result(changed, result, spider)
@@ -0,0 +1,88 @@
+import hashlib
+import json
+import logging
+import math
+import os
+
+# first line of a saved filter, followed by a json header line and the raw bit array
+FILE_MAGIC = b'BLOOM1\n'
+
+'''
+In process Bloom filter over string ids
+A lookup that returns False means the id was never added, True means it probably was
+(false positives at about error_rate once capacity ids are in). The k bit positions
+come from one blake2b digest split into two 64 bit hashes (double hashing)
+'''
+class BloomFilter:
+    def __init__(self, capacity, error_rate=0.001):
+        self.capacity = max(1, int(capacity))
+        self.error_rate = error_rate
+        self.num_bits = max(8, int(math.ceil(-self.capacity * math.log(error_rate) / (math.log(2) ** 2))))
+        self.num_hashes = max(1, int(round(self.num_bits / self.capacity * math.log(2))))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def positions(self, value):
+        digest = hashlib.blake2b(value.encode('utf-8'), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        num_bits = self.num_bits
+        return [(h1 + i * h2) % num_bits for i in range(self.num_hashes)]
+
+    def add(self, value):
+        bits = self.bits
+        for position in self.positions(value):
+            bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, value):
+        bits = self.bits
+        for position in self.positions(value):
+            if not bits[position >> 3] & (1 << (position & 7)):
+                return False
+        return True
+
+    def __len__(self):
+        return self.count
+
+    '''
+    Writes the filter to path through a temporary file, extra is stored in the header
+    (the pipeline keeps the size of the Redis set the filter was built from there)
+    '''
+    def save(self, path, **extra):
+        header = dict(extra, capacity=self.capacity, error_rate=self.error_rate, num_bits=self.num_bits, num_hashes=self.num_hashes, count=self.count)
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(FILE_MAGIC)
+                f.write(json.dumps(header, sort_keys=True).encode('utf-8') + b'\n')
+                f.write(self.bits)
+            os.replace(tmp_path, path)
+            return True
+        except IOError as e:
+            logging.error(f"Could not save the Bloom filter to {path}: {e}")
+            return False
+
+    '''
+    Reads a filter written by save
+    Returns (filter, header) or (None, None) when the file is missing or unreadable
+    '''
+    @classmethod
+    def load(cls, path):
+        if not path or not os.path.exists(path):
+            return None, None
+        try:
+            with open(path, 'rb') as f:
+                if f.readline() != FILE_MAGIC:
+                    raise ValueError("not a Bloom filter file")
+                header = json.loads(f.readline())
+                bits = f.read()
+            bloom = cls(header['capacity'], header['error_rate'])
+            if (bloom.num_bits, bloom.num_hashes) != (header['num_bits'], header['num_hashes']) or len(bits) != len(bloom.bits):
+                raise ValueError("header does not match the bit array")
+            bloom.bits = bytearray(bits)
+            bloom.count = header['count']
+            return bloom, header
+        except (IOError, ValueError, KeyError) as e:
+            logging.error(f"Could not load the Bloom filter from {path}: {e}")
+            return None, None
@@ -0,0 +1,96 @@
+import logging
+from scrapy import signals
+from scrapy.exceptions import NotConfigured
+from twisted.internet import task
+
+try:
+    from infra import metrics, logging_utils
+except ImportError as e:
+    logging.error(f"Could not import from 'infra' module: {e}. Ensure it's in the Python path.")
+    metrics = None
+    logging_utils = None
+
+"""
+    Publishes the latency histograms of infra.metrics (spider parse, both pipelines and every
+    connector call) every METRICS_INTERVAL seconds: as latency/<operation>/count, mean_ms, p50_ms
+    and p99_ms Scrapy stats, to the Prometheus textfile METRICS_TEXTFILE_PATH and on
+    http://METRICS_HTTP_HOST:METRICS_HTTP_PORT/metrics, both with the numeric Scrapy stats as gauges.
+"""
+class MetricsExporter:
+    def __init__(self, stats, interval=15.0, textfile_path=None, http_port=0, http_host='127.0.0.1'):
+        self.stats = stats
+        self.interval = interval
+        self.textfile_path = textfile_path
+        self.http_port = http_port
+        self.http_host = http_host
+        self.publish_loop = None
+        self.http_server = None
+        # copy of the Scrapy stats taken on the reactor thread, read by the http thread
+        self.stats_snapshot = {}
+
+    @classmethod
+    def from_crawler(cls, crawler):
+        if metrics is None or not metrics.METRICS_ENABLED or not crawler.settings.getbool('METRICS_ENABLED', True):
+            raise NotConfigured
+        exporter = cls(
+            crawler.stats,
+            interval=crawler.settings.getfloat('METRICS_INTERVAL', 15.0),
+            textfile_path=crawler.settings.get('METRICS_TEXTFILE_PATH'),
+            http_port=crawler.settings.getint('METRICS_HTTP_PORT', 0),
+            http_host=crawler.settings.get('METRICS_HTTP_HOST', '127.0.0.1'),
+        )
+        crawler.signals.connect(exporter.spider_opened, signal=signals.spider_opened)
+        crawler.signals.connect(exporter.spider_closed, signal=signals.spider_closed)
+        return exporter
+
+    def spider_opened(self, spider):
+        if self.http_port:
+            self.http_server = metrics.start_http_server(self.http_port, self.http_host, self.render)
+        if self.interval > 0:
+            self.publish_loop = task.LoopingCall(self.publish)
+            self.publish_loop.start(self.interval, now=False)
+
+    def spider_closed(self, spider, reason):
+        if self.publish_loop is not None and self.publish_loop.running:
+            self.publish_loop.stop()
+        self.publish()
+        for operation, values in metrics.summary().items():
+            logging.info(f"Latency of {operation}: {values['count']} calls, mean {values['mean_ms']}ms, p50 {values['p50_ms']}ms, p99 {values['p99_ms']}ms")
+        if self.http_server is not None:
+            self.http_server.shutdown()
+            self.http_server.server_close()
+            self.http_server = None
+
+    def publish(self):
+        for operation, values in metrics.summary().items():
+            for name, value in values.items():
+                self.stats.set_value(f"latency/{operation}/{name}", value)
+        self.stats_snapshot = dict(self.stats.get_stats())
+        if self.textfile_path:
+            metrics.write_textfile(self.textfile_path, self.render())
+
+    def render(self):
+        return metrics.render_prometheus(self.stats_snapshot)
+
+"""
+    With LOG_QUEUE_ENABLED the log records are written by a QueueListener thread, the reactor
+    thread only formats the message and puts it on a queue, so a slow disk or terminal never
+    stalls the crawl. The handlers are moved once the engine started (Scrapy installs its root
+    handler while the crawler is set up) and the queue is drained when the engine stops.
+"""
+class QueueLogging:
+    @classmethod
+    def from_crawler(cls, crawler):
+        if logging_utils is None or not crawler.settings.getbool('LOG_QUEUE_ENABLED', False):
+            raise NotConfigured
+        extension = cls()
+        crawler.signals.connect(extension.engine_started, signal=signals.engine_started)
+        crawler.signals.connect(extension.engine_stopped, signal=signals.engine_stopped)
+        return extension
+
+    def engine_started(self):
+        if logging_utils.start_queue_logging() is None:
+            logging.warning("LOG_QUEUE_ENABLED is set but the root logger has no handler to move behind a queue")
+
+    def engine_stopped(self):
+        logging_utils.stop_queue_logging()
@@ -0,0 +1,142 @@
+import glob
+import gzip
+import json
+import logging
+import os
+import queue
+
+from jobs_project.items import JobsProjectItem
+from jobs_project.item_mapper import JobFieldMapper
+from jobs_project.json_stream import iter_array_items, DEFAULT_CHUNK_SIZE
+
+# file names picked up when an input path is a directory
+DATA_FILE_PATTERNS = ('*.json', '*.json.gz')
+# yielded by iter_parallel_results while no message of the workers is ready
+PARSE_PENDING = object()
+
+job_mapper = JobFieldMapper(JobsProjectItem)
+
+'''
+Expands the INPUT_PATHS setting into the sorted list of data files to ingest
+Every entry is either a directory (its *.json and *.json.gz files are used)
+or a glob pattern, ** matches nested directories
+'''
+def discover_input_files(input_paths):
+    found = set()
+    for input_path in input_paths:
+        input_path = os.path.expanduser(str(input_path))
+        if os.path.isdir(input_path):
+            for pattern in DATA_FILE_PATTERNS:
+                found.update(glob.glob(os.path.join(input_path, pattern)))
+        else:
+            matches = glob.glob(input_path, recursive=True)
+            if not matches:
+                logging.warning(f"No data files match the input path {input_path}")
+            found.update(match for match in matches if os.path.isfile(match))
+    return sorted(os.path.abspath(path) for path in found)
+
+'''
+Opens a data file for reading text, gzip compressed files (*.gz) are decompressed on the fly
+'''
+def open_data_file(file_path):
+    if file_path.endswith('.gz'):
+        return gzip.open(file_path, 'rt', encoding='utf-8')
+    return open(file_path, 'r', encoding='utf-8')
+
+'''
+Iterates over the job entries of an open data file, lazily in streaming mode
+'''
+def iter_job_entries(f, streaming=True, chunk_size=DEFAULT_CHUNK_SIZE):
+    if streaming:
+        return iter_array_items(f, 'jobs', chunk_size=chunk_size)
+    jobs_data_list = json.load(f).get('jobs', [])
+    if not isinstance(jobs_data_list, list):
+        raise json.JSONDecodeError(f"Expected 'jobs' to be a list, found {type(jobs_data_list)}", '', 0)
+    return iter(jobs_data_list)
+
+'''
+Validates one entry of the jobs array and maps it onto the fields declared on JobsProjectItem,
+with their declared coercions applied
+Returns (fields, None) or (None, reason) when the entry has to be skipped
+'''
+def normalize_job_entry(job_entry):
+    if not isinstance(job_entry, dict):
+        return None, f"Skipping non-dictionary item in jobs list: {job_entry}"
+    job_data = job_entry.get('data')
+    if not isinstance(job_data, dict):
+        return None, f"Skipping item without 'data' dictionary: {job_entry}"
+    return job_mapper.map(job_data), None
+
+'''
+Entry point of the parse worker processes
+Takes (file_path, start_offset) tasks from task_queue until it gets None and sends back messages:
+('batch', file_path, [(index, fields or None, skip_reason), ...]) every batch_size records,
+('done', file_path, records_read) at the end of a file and ('error', file_path, message) if it failed
+'''
+def parse_files_worker(task_queue, result_queue, streaming, chunk_size, batch_size):
+    while True:
+        task = task_queue.get()
+        if task is None:
+            return
+        file_path, start_offset = task
+        try:
+            records_read = 0
+            batch = []
+            with open_data_file(file_path) as f:
+                for index, job_entry in enumerate(iter_job_entries(f, streaming, chunk_size)):
+                    records_read = index + 1
+                    if index < start_offset:
+                        continue
+                    fields, skip_reason = normalize_job_entry(job_entry)
+                    batch.append((index, fields, skip_reason))
+                    if len(batch) >= batch_size:
+                        result_queue.put(('batch', file_path, batch))
+                        batch = []
+            if batch:
+                result_queue.put(('batch', file_path, batch))
+            result_queue.put(('done', file_path, records_read))
+        except FileNotFoundError:
+            result_queue.put(('error', file_path, f"File not found: {file_path}"))
+        except json.JSONDecodeError as e:
+            result_queue.put(('error', file_path, f"Error decoding JSON in: {file_path}: {e}"))
+        except Exception as e:
+            result_queue.put(('error', file_path, f"Unexpected error parsing {file_path}: {e!r}"))
+
+'''
+Runs parse_files_worker in a pool of processes over the given (file_path, start_offset) tasks
+and yields their messages as they arrive
+The result queue is bounded, so the workers pause when the pipelines fall behind
+The queue is never waited on, PARSE_PENDING is yielded instead while it is empty, so a consumer
+running on the reactor thread can give control back to the reactor before asking again
+'''
+def iter_parallel_results(context, tasks, workers, streaming, chunk_size, batch_size, queue_size):
+    task_queue = context.Queue()
+    result_queue = context.Queue(maxsize=queue_size)
+    for task in tasks:
+        task_queue.put(task)
+    processes = []
+    for _ in range(min(workers, len(tasks))):
+        task_queue.put(None)
+        process = context.Process(target=parse_files_worker, args=(task_queue, result_queue, streaming, chunk_size, batch_size), daemon=True)
+        process.start()
+        processes.append(process)
+
+    pending_files = len(tasks)
+    try:
+        while pending_files:
+            try:
+                message = result_queue.get_nowait()
+            except queue.Empty:
+                if not any(process.is_alive() for process in processes) and result_queue.empty():
+                    logging.error(f"All parse workers exited with {pending_files} files left")
+                    return
+                yield PARSE_PENDING
+                continue
+            if message[0] in ('done', 'error'):
+                pending_files -= 1
+            yield message
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+            process.join()
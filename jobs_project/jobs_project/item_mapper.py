@@ -0,0 +1,86 @@
+import logging
+from datetime import datetime
+
+from dateutil import parser as date_parser
+
+'''
+Coercions that can be declared on an item field, e.g. scrapy.Field(coerce=to_float)
+They take the raw value from the feed and return the stored value, None drops the field
+'''
+def to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        logging.debug(f"Could not convert {value!r} to float")
+        return None
+
+def to_datetime(value):
+    if isinstance(value, datetime):
+        return value
+    try:
+        # the feeds use 2024-02-02T06:06:02+0000, strptime is much faster than the generic parser
+        return datetime.strptime(value, '%Y-%m-%dT%H:%M:%S%z')
+    except (TypeError, ValueError):
+        pass
+    try:
+        return date_parser.isoparse(str(value))
+    except (TypeError, ValueError):
+        logging.debug(f"Could not convert {value!r} to datetime")
+        return None
+
+'''
+Derivation declared on an item field, e.g. scrapy.Field(derive=to_geo_point)
+It takes the mapped fields and returns the GeoJSON point of latitude/longitude for the 2dsphere
+index, None (no field) when a coordinate is missing or out of range
+'''
+def to_geo_point(fields):
+    latitude = fields.get('latitude')
+    longitude = fields.get('longitude')
+    if latitude is None or longitude is None:
+        return None
+    # NaN fails both comparisons as well
+    if not (-90.0 <= latitude <= 90.0 and -180.0 <= longitude <= 180.0):
+        logging.debug(f"Coordinates {latitude!r}, {longitude!r} are out of range, no location stored")
+        return None
+    return {'type': 'Point', 'coordinates': [longitude, latitude]}
+
+'''
+Maps the job data of a feed record onto the fields of an item class
+The (field, coercion) table is built once from the field declarations, so building
+an item is one dict lookup per field plus the declared coercions, without the
+ItemLoader machinery and without wrapping every value in a list
+Fields declared with derive= are not read from the feed but computed from the mapped fields
+'''
+class JobFieldMapper:
+    def __init__(self, item_class):
+        self.item_class = item_class
+        self.field_table = tuple(
+            (field_name, field_meta.get('coerce'))
+            for field_name, field_meta in item_class.fields.items()
+            if 'derive' not in field_meta
+        )
+        self.derived_table = tuple(
+            (field_name, field_meta['derive'])
+            for field_name, field_meta in item_class.fields.items()
+            if 'derive' in field_meta
+        )
+
+    '''
+    Returns the dict of item fields found in job_data, missing and None values are left out
+    '''
+    def map(self, job_data):
+        fields = {}
+        for field_name, coerce in self.field_table:
+            value = job_data.get(field_name)
+            if value is None:
+                continue
+            if coerce is not None:
+                value = coerce(value)
+                if value is None:
+                    continue
+            fields[field_name] = value
+        for field_name, derive in self.derived_table:
+            value = derive(fields)
+            if value is not None:
+                fields[field_name] = value
+        return fields
@@ -4,9 +4,14 @@
 # https=//docs.scrapy.org/en/latest/topics/items.html
 
 import scrapy
+
+from jobs_project.item_mapper import to_float, to_datetime, to_geo_point
+
 class JobsProjectItem(scrapy.Item):
     # defining the fields from json like the below example
     # name = scrapy.Field()
+    # coerce= converts the raw feed value when the item is built (see item_mapper.JobFieldMapper)
+    # derive= computes the field from the other fields instead of reading it from the feed
 
     # job data details
     slug = scrapy.Field()
@@ -20,8 +25,10 @@ class JobsProjectItem(scrapy.Item):
     country_code= scrapy.Field()
     postal_code= scrapy.Field()
     location_type= scrapy.Field()
-    latitude= scrapy.Field()
-    longitude= scrapy.Field()
+    latitude= scrapy.Field(coerce=to_float)
+    longitude= scrapy.Field(coerce=to_float)
+    # GeoJSON point of latitude/longitude, indexed with 2dsphere (infra/geo_queries.py)
+    location= scrapy.Field(derive=to_geo_point)
     categories= scrapy.Field()
     tags= scrapy.Field()
     tags5= scrapy.Field()
@@ -43,8 +50,8 @@ class JobsProjectItem(scrapy.Item):
     li_easy_applyable= scrapy.Field()
     ats_code= scrapy.Field()
     meta_data= scrapy.Field()
-    update_date= scrapy.Field()
-    create_date= scrapy.Field()
+    update_date= scrapy.Field(coerce=to_datetime)
+    create_date= scrapy.Field(coerce=to_datetime)
     category= scrapy.Field()
     full_location= scrapy.Field()
     short_location= scrapy.Field()
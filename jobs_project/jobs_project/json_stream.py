@@ -0,0 +1,114 @@
+import json
+
+# default number of characters read from the file at a time
+DEFAULT_CHUNK_SIZE = 64 * 1024
+# a single array element bigger than this is treated as malformed input
+DEFAULT_MAX_ITEM_SIZE = 16 * 1024 * 1024
+
+_WHITESPACE = ' \t\n\r'
+_NUMBER_CHARS = set('0123456789.eE+-')
+
+'''
+Incremental reader over a text file object holding a JSON document
+Keeps only the undecoded tail of the file in memory, so the memory used
+is bounded by the chunk size plus the size of the biggest single value
+'''
+class _JSONStreamReader:
+    def __init__(self, fp, chunk_size=DEFAULT_CHUNK_SIZE, max_item_size=DEFAULT_MAX_ITEM_SIZE):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.max_item_size = max_item_size
+        self.decoder = json.JSONDecoder()
+        self.buffer = ''
+        self.pos = 0
+        self.consumed = 0
+        self.eof = False
+
+    def _fill(self):
+        if self.eof:
+            return False
+        chunk = self.fp.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        # dropping the already decoded part of the buffer before growing it
+        self.consumed += self.pos
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def _error(self, msg):
+        return json.JSONDecodeError(msg, self.buffer, self.pos)
+
+    def peek(self):
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in _WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self._fill():
+                return ''
+
+    def expect(self, char):
+        found = self.peek()
+        if found != char:
+            raise self._error(f"Expecting '{char}' at offset {self.consumed + self.pos}, found {found!r}")
+        self.pos += 1
+
+    def decode_value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+                # a number running up to the buffer end may be truncated (e.g. 12 of 12.5)
+                truncated = (not self.eof and isinstance(value, (int, float)) and not isinstance(value, bool)
+                             and all(c in _NUMBER_CHARS for c in self.buffer[end:]))
+                if not truncated:
+                    self.pos = end
+                    return value
+            except json.JSONDecodeError:
+                if self.eof:
+                    raise
+            if len(self.buffer) - self.pos > self.max_item_size:
+                raise self._error(f"JSON value at offset {self.consumed + self.pos} exceeds {self.max_item_size} characters")
+            self._fill()
+
+'''
+Lazily yields the elements of the array stored under `key` in the top level
+JSON object of the file, e.g. iter_array_items(f, 'jobs') walks {"jobs": [...]}
+The other top level values are decoded one at a time and discarded
+Raises json.JSONDecodeError on malformed input, the elements decoded before the
+error have already been yielded
+'''
+def iter_array_items(fp, key, chunk_size=DEFAULT_CHUNK_SIZE, max_item_size=DEFAULT_MAX_ITEM_SIZE):
+    reader = _JSONStreamReader(fp, chunk_size=chunk_size, max_item_size=max_item_size)
+    reader.expect('{')
+    if reader.peek() == '}':
+        return
+    while True:
+        name = reader.decode_value()
+        if not isinstance(name, str):
+            raise reader._error(f"Expecting a property name, found {name!r}")
+        reader.expect(':')
+        if name == key:
+            if reader.peek() != '[':
+                value = reader.decode_value()
+                raise reader._error(f"Expected '{key}' to be a list, found {type(value)}")
+            reader.expect('[')
+            if reader.peek() == ']':
+                reader.pos += 1
+            else:
+                while True:
+                    yield reader.decode_value()
+                    if reader.peek() == ',':
+                        reader.pos += 1
+                        continue
+                    reader.expect(']')
+                    break
+        else:
+            reader.decode_value()
+        if reader.peek() == ',':
+            reader.pos += 1
+            continue
+        reader.expect('}')
+        return
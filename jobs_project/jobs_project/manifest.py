@@ -0,0 +1,156 @@
+import hashlib
+import json
+import logging
+import os
+import time
+
+# bytes read at a time when hashing a data file
+HASH_CHUNK_SIZE = 1024 * 1024
+
+STATUS_IN_PROGRESS = 'in_progress'
+STATUS_COMPLETE = 'complete'
+
+'''
+Persistent record of the data files already ingested, keyed by path
+Every entry keeps the size, mtime and sha256 of the file plus how far the
+ingestion got, so unchanged files are skipped before they are parsed and an
+interrupted file resumes from its last checkpointed record offset
+The offset only counts the leading records whose items went all the way
+through the item pipelines (scraped, dropped or failed), items still in
+flight when the crawl died are parsed again and left to the Redis dedup
+'''
+class IngestionManifest:
+    def __init__(self, path, checkpoint_interval=1000):
+        self.path = path
+        self.checkpoint_interval = max(1, checkpoint_interval)
+        self.files = {}
+        self.in_flight = {}
+        self.item_records = {}
+        self.parsed_upto = {}
+        self.parsing_done = set()
+        self.updates_since_save = 0
+
+    def load(self):
+        if not os.path.exists(self.path):
+            logging.info(f"No ingestion manifest at {self.path}, every data file will be parsed")
+            return self
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.files = json.load(f).get('files', {})
+            logging.info(f"Loaded ingestion manifest {self.path} with {len(self.files)} files")
+        except (IOError, ValueError) as e:
+            logging.error(f"Could not read the ingestion manifest {self.path}, starting from an empty one: {e}")
+            self.files = {}
+        return self
+
+    '''
+    Writes the manifest to a temporary file and renames it, so a crash never leaves a half written manifest
+    '''
+    def save(self):
+        for file_path in self.parsed_upto:
+            entry = self.files.get(file_path)
+            if entry and entry['status'] == STATUS_IN_PROGRESS:
+                entry['offset'] = self.safe_offset(file_path)
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump({'files': self.files}, f, indent=2, sort_keys=True)
+            os.replace(tmp_path, self.path)
+        except IOError as e:
+            logging.error(f"Could not save the ingestion manifest {self.path}: {e}")
+        self.updates_since_save = 0
+
+    @staticmethod
+    def content_hash(file_path):
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+                digest.update(chunk)
+        return digest.hexdigest()
+
+    '''
+    Decides what to do with a data file before it is opened
+    Returns None when the file was already fully ingested, otherwise the record offset to start from
+    (0 for new or changed files). The content is only hashed when the size or mtime changed
+    '''
+    def check(self, file_path):
+        stat = os.stat(file_path)
+        entry = self.files.get(file_path)
+        if entry and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+            unchanged = True
+        else:
+            sha256 = self.content_hash(file_path)
+            unchanged = entry is not None and entry.get('sha256') == sha256
+            if unchanged:
+                # touched but identical, remembering the new stat avoids hashing it again next time
+                entry['size'] = stat.st_size
+                entry['mtime_ns'] = stat.st_mtime_ns
+            else:
+                entry = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns, 'sha256': sha256, 'status': STATUS_IN_PROGRESS, 'offset': 0}
+                self.files[file_path] = entry
+
+        if unchanged and entry['status'] == STATUS_COMPLETE:
+            return None
+        return entry['offset']
+
+    '''
+    Marks the file as being ingested from the given record offset
+    '''
+    def begin(self, file_path, offset=0):
+        entry = self.files[file_path]
+        entry['status'] = STATUS_IN_PROGRESS
+        entry['offset'] = offset
+        entry['started_at'] = time.time()
+        self.in_flight[file_path] = set()
+        self.parsed_upto[file_path] = offset
+        self.parsing_done.discard(file_path)
+        self.save()
+
+    '''
+    Called for every record read from the file, with the item built from it (None if the record was skipped)
+    '''
+    def record_consumed(self, file_path, index, item=None):
+        if item is not None:
+            self.in_flight[file_path].add(index)
+            self.item_records[id(item)] = (file_path, index)
+        self.parsed_upto[file_path] = index + 1
+        self.updates_since_save += 1
+        if self.updates_since_save >= self.checkpoint_interval:
+            self.save()
+
+    '''
+    Called once the item went through the item pipelines
+    '''
+    def item_finished(self, item):
+        record = self.item_records.pop(id(item), None)
+        if record is None:
+            return
+        file_path, index = record
+        self.in_flight[file_path].discard(index)
+        self.maybe_complete(file_path)
+
+    '''
+    Called when the whole jobs array of the file has been read
+    '''
+    def file_parsed(self, file_path):
+        self.parsing_done.add(file_path)
+        self.maybe_complete(file_path)
+
+    def maybe_complete(self, file_path):
+        if file_path not in self.parsing_done or self.in_flight[file_path]:
+            return
+        entry = self.files[file_path]
+        entry['status'] = STATUS_COMPLETE
+        entry['offset'] = self.parsed_upto[file_path]
+        entry['completed_at'] = time.time()
+        self.parsing_done.discard(file_path)
+        self.save()
+
+    '''
+    Number of leading records of the file whose items are all out of the pipelines
+    '''
+    def safe_offset(self, file_path):
+        in_flight = self.in_flight.get(file_path)
+        if in_flight:
+            return min(in_flight)
+        return self.parsed_upto.get(file_path, 0)
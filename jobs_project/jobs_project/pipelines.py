@@ -1,31 +1,113 @@
 import logging
+import hashlib
 import json
+import threading
+import time
+from collections import deque
 from itemadapter import ItemAdapter
 from scrapy.exceptions import DropItem, NotConfigured
+from scrapy.utils.defer import maybe_deferred_to_future
+from twisted.internet import defer, task
+
+from jobs_project.bloom import BloomFilter
+from jobs_project.write_behind import WriteBehindWriter
+
+# server error code MongoDB reports for a unique index violation
+DUPLICATE_KEY_ERROR_CODE = 11000
 
 # importing the mongodb and redis function to be re-used in the pipeline
 try:
-    from infra.mongodb_connector import insert_item, get_db, close_mongo_connection
-    from infra.redis_connector import get_redis_connection, add_to_set, is_member
+    from infra.mongodb_connector import insert_item, insert_items, upsert_items, find_item, get_db, close_mongo_connection
+    from infra.redis_connector import get_redis_connection, add_to_set, add_many_to_set, is_member, scan_set, set_size, close_redis_connection
+    from infra.redis_connector import add_to_hashed_set, add_many_to_hashed_set, scan_hashed_set, hashed_set_size, hashed_member
+    from infra.redis_connector import store_many_if_changed, scan_content_hashes, content_hashes_size
+    from infra.job_queries import ensure_indexes
+    from infra.query_cache import bump_generation
+    from infra.text_codec import load_codec, train_codec
+    from infra.metrics import timed
+    from infra.logging_utils import SampledLog
 except ImportError as e:
     logging.error(f"Could not import from 'infra' module: {e}. Ensure it's in the Python path.")
     def insert_item(*args, **kwargs): raise ImportError("infra.mongodb_connector missing")
+    def insert_items(*args, **kwargs): raise ImportError("infra.mongodb_connector missing")
+    def upsert_items(*args, **kwargs): raise ImportError("infra.mongodb_connector missing")
+    def find_item(*args, **kwargs): raise ImportError("infra.mongodb_connector missing")
     def get_db(*args, **kwargs): raise ImportError("infra.mongodb_connector missing")
     def close_mongo_connection(*args, **kwargs): pass
     def get_redis_connection(*args, **kwargs): raise ImportError("infra.redis_connector missing")
     def add_to_set(*args, **kwargs): raise ImportError("infra.redis_connector missing")
+    def add_many_to_set(*args, **kwargs): raise ImportError("infra.redis_connector missing")
     def is_member(*args, **kwargs): raise ImportError("infra.redis_connector missing")
+    def scan_set(*args, **kwargs): raise ImportError("infra.redis_connector missing")
+    def set_size(*args, **kwargs): raise ImportError("infra.redis_connector missing")
+    def close_redis_connection(*args, **kwargs): pass
+    def add_to_hashed_set(*args, **kwargs): raise ImportError("infra.redis_connector missing")
+    def add_many_to_hashed_set(*args, **kwargs): raise ImportError("infra.redis_connector missing")
+    def scan_hashed_set(*args, **kwargs): raise ImportError("infra.redis_connector missing")
+    def hashed_set_size(*args, **kwargs): raise ImportError("infra.redis_connector missing")
+    def hashed_member(*args, **kwargs): raise ImportError("infra.redis_connector missing")
+    def store_many_if_changed(*args, **kwargs): raise ImportError("infra.redis_connector missing")
+    def scan_content_hashes(*args, **kwargs): raise ImportError("infra.redis_connector missing")
+    def content_hashes_size(*args, **kwargs): raise ImportError("infra.redis_connector missing")
+    def ensure_indexes(*args, **kwargs): return None
+    def bump_generation(*args, **kwargs): return None
+    def load_codec(*args, **kwargs): return None
+    def train_codec(*args, **kwargs): return None
+    def timed(name): return lambda func: func
+    class SampledLog:
+        def __init__(self, logger, level=logging.WARNING, **kwargs): self.logger, self.level = logger, level
+        def log(self, message, *args, **kwargs): self.logger.log(self.level, message, *args, **kwargs)
+
+# per item warnings and errors are sampled on large crawls, the stats keep the exact counts
+item_warnings = SampledLog(logging.getLogger(), logging.WARNING)
+item_errors = SampledLog(logging.getLogger(), logging.ERROR)
+
+# document field holding content_hash of the stored item
+CONTENT_HASH_FIELD = '_content_hash'
+
+'''
+Stable digest of the item fields, two versions of a posting with the same fields get the same hash
+'''
+def content_hash(item_dict):
+    payload = json.dumps(item_dict, sort_keys=True, default=str, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.blake2b(payload.encode('utf-8'), digest_size=16).hexdigest()
 
 """
     Pipeline for filtering out items that have already been seen, using a Redis set.
+    The check and the add are a single SADD, whose return value tells if the id was new.
+    With REDIS_DEDUP_BATCH_SIZE > 1 the ids are collected and sent in one pipelined round trip,
+    process_item is a coroutine, it awaits the Deferred that fires once the batch has been answered.
+    With BLOOM_FILTER_ENABLED ids the in process Bloom filter has never seen pass at once and
+    are only added to the set with the next batch, Redis is asked just for possible duplicates.
+    REDIS_DEDUP_STORAGE = 'hashed' stores 64 bit digests of the ids in bucketed integer sets instead,
+    optionally forgotten after REDIS_DEDUP_EXPIRE_SECONDS (see infra.redis_connector).
+    With MONGO_WRITE_MODE = 'upsert' the content hash of the latest version is kept per id instead, in the
+    {spider_name}:seen_content hash (or its hashed buckets), so a changed posting replaces its entry and
+    passes on to the MongoDB pipeline while an identical copy is dropped.
 """
 class RedisDeduplicationPipeline:
-    def __init__(self, redis_conn, dupefilter_key_field, stats):
+    def __init__(self, redis_conn, dupefilter_key_field, stats, batch_size=1, flush_interval=0, bloom_capacity=0, bloom_error_rate=0.001, bloom_path=None, storage='set', expire_seconds=0, expire_windows=4, key_on_content=False):
         self.redis_conn = redis_conn
-        self.seen_set_key_template = "{spider_name}:seen_ids"
+        self.seen_set_key_template = "{spider_name}:seen_content" if key_on_content else "{spider_name}:seen_ids"
         self.dupefilter_key_field = dupefilter_key_field
         self.stats = stats
         self.seen_set_key = None
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.pending = []
+        self.pending_adds = []
+        self.pending_started_at = None
+        self.flush_loop = None
+        self.spider = None
+        self.crawler = None
+        self.bloom_capacity = bloom_capacity
+        self.bloom_error_rate = bloom_error_rate
+        self.bloom_path = bloom_path
+        self.bloom = None
+        self.storage = storage
+        self.expire_seconds = expire_seconds
+        self.expire_windows = max(1, expire_windows)
+        self.key_on_content = key_on_content
 
     @classmethod
     def from_crawler(cls, crawler):
@@ -34,7 +116,34 @@ class RedisDeduplicationPipeline:
 
         if not dupefilter_key_field:
             raise NotConfigured("RedisDeduplicationPipeline requires the 'DUPEFILTER_KEY_FIELD' setting (e.g., 'slug', 'req_id').")
+        storage = settings.get('REDIS_DEDUP_STORAGE', 'set')
+        if storage not in ('set', 'hashed'):
+            raise NotConfigured(f"Unknown REDIS_DEDUP_STORAGE '{storage}', expected 'set' or 'hashed'")
+        expire_seconds = settings.getint('REDIS_DEDUP_EXPIRE_SECONDS', 0)
+        if expire_seconds and storage != 'hashed':
+            logging.warning("REDIS_DEDUP_EXPIRE_SECONDS is only used with REDIS_DEDUP_STORAGE = 'hashed', seen ids are kept forever")
+
+        redis_conn = cls.open_connection()
 
+        pipeline = cls(
+            redis_conn,
+            dupefilter_key_field,
+            crawler.stats,
+            batch_size=settings.getint('REDIS_DEDUP_BATCH_SIZE', 1),
+            flush_interval=settings.getfloat('REDIS_DEDUP_FLUSH_INTERVAL', 0.1),
+            bloom_capacity=settings.getint('BLOOM_FILTER_CAPACITY', 1000000) if settings.getbool('BLOOM_FILTER_ENABLED', False) else 0,
+            bloom_error_rate=settings.getfloat('BLOOM_FILTER_ERROR_RATE', 0.001),
+            bloom_path=settings.get('BLOOM_FILTER_PATH'),
+            storage=storage,
+            expire_seconds=expire_seconds,
+            expire_windows=settings.getint('REDIS_DEDUP_EXPIRE_WINDOWS', 4),
+            key_on_content=settings.get('MONGO_WRITE_MODE', 'insert') == 'upsert',
+        )
+        pipeline.crawler = crawler
+        return pipeline
+
+    @classmethod
+    def open_connection(cls):
         try:
             redis_conn = get_redis_connection()
             if not redis_conn:
@@ -46,61 +155,367 @@ class RedisDeduplicationPipeline:
         except Exception as e:
             logging.error(f"Error getting Redis connection: {e}. Deduplication pipeline disabled.")
             raise NotConfigured(f"Redis connection error: {e}")
+        return redis_conn
 
+    def open_spider(self):
+        spider = self.crawler.spider
+        self.configure(spider)
+        if self.bloom_capacity > 0:
+            self.bloom = self.open_bloom(spider)
+        self.start_flush_loop()
 
-        pipeline = cls(redis_conn, dupefilter_key_field, crawler.stats)
-        return pipeline
-
-    def open_spider(self, spider):
+    def configure(self, spider):
+        self.spider = spider
         self.seen_set_key = self.seen_set_key_template.format(spider_name=spider.name)
         logging.info(f"RedisDeduplicationPipeline: Using key '{self.seen_set_key}' for deduplication based on item field '{self.dupefilter_key_field}'.")
+        if self.storage == 'hashed':
+            logging.info(f"RedisDeduplicationPipeline: Storing hashed ids in '{self.seen_set_key}:h:*'" + (f", forgotten after {self.expire_seconds}s" if self.expire_seconds else ""))
+
+    def start_flush_loop(self):
+        if self.batch_size > 1:
+            logging.info(f"RedisDeduplicationPipeline: Checking ids in batches of {self.batch_size} (flush interval {self.flush_interval}s)")
+            if self.flush_interval > 0:
+                # answers a partially filled batch when the item flow stalls
+                self.flush_loop = task.LoopingCall(self.flush_if_due)
+                self.flush_loop.start(self.flush_interval, now=False)
 
-    def close_spider(self, spider):
+    def close_spider(self):
+        spider = self.spider
+        if self.flush_loop is not None and self.flush_loop.running:
+            self.flush_loop.stop()
+        self.flush(spider)
+        if self.bloom is not None:
+            self.close_bloom(spider)
         try:
+            close_redis_connection()
             logging.info("Redis connection closed for deduplication pipeline.")
         except Exception as e:
              logging.warning(f"Error closing Redis connection: {e}")
 
 
-    def process_item(self, item, spider):
+    @timed('pipeline/redis_dedup')
+    async def process_item(self, item):
+        spider = self.spider
+        item_unique_id_str = self.dedup_id(item, spider)
+        if item_unique_id_str is None:
+            return item
+
+        if self.bloom is not None and self.bloom_passes(item_unique_id_str, spider):
+            # never seen: pass it on now, the SADD goes out with the next batch
+            if self.queue_add(item_unique_id_str):
+                self.flush(spider)
+            return item
+
+        if self.batch_size > 1:
+            deferred = defer.Deferred()
+            if self.queue_check(item_unique_id_str, item, deferred):
+                self.flush(spider)
+            return await maybe_deferred_to_future(deferred)
+
+        try:
+            added = self.add_seen_id(item_unique_id_str)
+        except Exception as e:
+            added = None
+            logging.error(f"Redis error during deduplication check/add for ID '{item_unique_id_str}' in set '{self.seen_set_key}': {e}", extra={'spider': spider})
+        if self.bloom is not None and added:
+            self.stats.inc_value('bloom/false_positives')
+        return self.resolve(item, item_unique_id_str, added, spider)
+
+    '''
+    The id the item is deduplicated on, None (item passed on unchecked) when it has no DUPEFILTER_KEY_FIELD
+    '''
+    def dedup_id(self, item, spider):
         adapter = ItemAdapter(item)
         item_unique_id = adapter.get(self.dupefilter_key_field)
 
         if item_unique_id is None:
-            logging.warning(f"Item lacks unique identifier field '{self.dupefilter_key_field}' or value is None. Skipping deduplication check.", extra={'spider': spider})
-            self.stats.inc_value('redis/skipped_no_id', spider=spider)
-            return item
+            item_warnings.log("Item lacks unique identifier field '%s' or value is None. Skipping deduplication check.", self.dupefilter_key_field, extra={'spider': spider})
+            self.stats.inc_value('redis/skipped_no_id')
+            return None
         item_unique_id_str = str(item_unique_id)
+        if self.key_on_content:
+            item_unique_id_str = f"{item_unique_id_str}:{content_hash(adapter.asdict())}"
+        return item_unique_id_str
+
+    '''
+    The (id, content hash) pair of a content keyed dedup id, the hash is hex so the last colon splits them
+    '''
+    def content_pair(self, item_unique_id_str):
+        item_id, _, item_hash = item_unique_id_str.rpartition(':')
+        return item_id, item_hash
+
+    '''
+    True when the Bloom filter has never seen the id, the id is added to the filter right away
+    '''
+    def bloom_passes(self, item_unique_id_str, spider):
+        bloom_value = self.bloom_value(item_unique_id_str)
+        if bloom_value in self.bloom:
+            self.stats.inc_value('bloom/maybe_seen')
+            return False
+        self.bloom.add(bloom_value)
+        self.stats.inc_value('bloom/definitely_new')
+        return True
+
+    '''
+    Queue an id passed by the Bloom filter (queue_add) or an id whose item waits for its
+    SADD answer on waiter (queue_check), both return True once the batch is full
+    '''
+    def queue_add(self, item_unique_id_str):
+        if not self.pending and not self.pending_adds:
+            self.pending_started_at = time.monotonic()
+        self.pending_adds.append(item_unique_id_str)
+        return len(self.pending) + len(self.pending_adds) >= self.batch_size
 
+    def queue_check(self, item_unique_id_str, item, waiter):
+        if not self.pending and not self.pending_adds:
+            self.pending_started_at = time.monotonic()
+        self.pending.append((item_unique_id_str, item, waiter))
+        return len(self.pending) + len(self.pending_adds) >= self.batch_size
+
+    '''
+    Turns the SADD answer for one id into the pipeline result
+    New ids pass the item on, seen ids drop it and on a Redis failure the item is kept
+    '''
+    def resolve(self, item, item_unique_id_str, added, spider):
+        if added is None:
+            logging.error(f"Redis error during deduplication check/add for ID '{item_unique_id_str}' in set '{self.seen_set_key}'", extra={'spider': spider})
+            self.stats.inc_value('redis/errors')
+            return item
+        if not added:
+            self.stats.inc_value('redis/duplicate_items')
+            if self.key_on_content:
+                # an unchanged posting never reaches MongoDBPipeline, it is counted with the ones it skips
+                self.stats.inc_value('mongodb/unchanged_items')
+            # Scrapy logs dropped items at WARNING, a duplicate is expected so it is logged at DEBUG
+            raise DropItem(f"Duplicate item found based on '{self.dupefilter_key_field}': {item_unique_id_str}", log_level='DEBUG')
+        self.stats.inc_value('redis/new_items')
+        return item
+
+    '''
+    Answers the pending batch when it is older than REDIS_DEDUP_FLUSH_INTERVAL
+    '''
+    def flush_if_due(self):
+        if (self.pending or self.pending_adds) and time.monotonic() - self.pending_started_at >= self.flush_interval:
+            self.flush(self.spider)
+
+    '''
+    Sends all the pending ids in one pipelined round trip and fires the deferred of each item
+    The ids passed by the Bloom filter go first, so a later copy of the same id in the batch is seen as a duplicate
+    '''
+    def flush(self, spider):
+        if not self.pending and not self.pending_adds:
+            return
+        adds, batch = self.take_pending()
+        item_ids = adds + [item_id for item_id, _, _ in batch]
         try:
-            already_seen = is_member(self.seen_set_key, item_unique_id_str)
+            results = self.add_seen_ids(item_ids)
+        except Exception as e:
+            logging.error(f"Redis error during batched deduplication of {len(item_ids)} ids in set '{self.seen_set_key}': {e}", extra={'spider': spider})
+            results = None
+        self.finish_batch(adds, batch, results, spider)
+
+    def take_pending(self):
+        adds = self.pending_adds
+        batch = self.pending
+        self.pending_adds = []
+        self.pending = []
+        self.pending_started_at = None
+        return adds, batch
 
-            if already_seen:
-                self.stats.inc_value('redis/duplicate_items', spider=spider)
-                raise DropItem(f"Duplicate item found based on '{self.dupefilter_key_field}': {item_unique_id_str}")
+    '''
+    Records the SADD answers of a flushed batch and settles the waiter of each checked item
+    '''
+    def finish_batch(self, adds, batch, results, spider):
+        if results is None:
+            results = [None] * (len(adds) + len(batch))
+
+        # the items passed by the filter count as new once the SADD confirms it
+        for item_id, added in zip(adds, results):
+            if added:
+                self.stats.inc_value('redis/new_items')
+            elif added is None:
+                self.stats.inc_value('bloom/failed_adds')
+            else:
+                # the filter missed an id already in the set (stale or incomplete warm up), the item was passed on
+                item_warnings.log("Bloom filter passed '%s' which was already in Redis set '%s'", item_id, self.seen_set_key, extra={'spider': spider})
+                self.stats.inc_value('bloom/false_negatives')
+
+        for (item_id, item, waiter), added in zip(batch, results[len(adds):]):
+            if self.bloom is not None and added:
+                self.stats.inc_value('bloom/false_positives')
+            try:
+                result = self.resolve(item, item_id, added, spider)
+            except DropItem as e:
+                self.fail_waiter(waiter, e)
             else:
-                added = add_to_set(self.seen_set_key, item_unique_id_str)
-                if added:
-                    self.stats.inc_value('redis/new_items', spider=spider)
-                else:
-                    logging.warning(f"Failed to add presumably new item ID '{item_unique_id_str}' to Redis set '{self.seen_set_key}'. Possible race condition or Redis error.", extra={'spider': spider})
-                    self.stats.inc_value('redis/add_failed', spider=spider)
+                self.settle_waiter(waiter, result)
+
+    def settle_waiter(self, deferred, result):
+        deferred.callback(result)
+
+    def fail_waiter(self, deferred, error):
+        deferred.errback(error)
+
+    '''
+    Storage of the seen ids, a plain set of the raw ids or the hashed bucket sets, or with key_on_content
+    the latest content hash per id
+    add_seen_id(s) return True/False per id (added or changed / already present), None if Redis failed
+    '''
+    def add_seen_id(self, item_unique_id_str):
+        if self.key_on_content:
+            results = self.add_seen_ids([item_unique_id_str])
+            return results[0] if results else None
+        if self.storage == 'hashed':
+            return add_to_hashed_set(self.seen_set_key, item_unique_id_str, expire_seconds=self.expire_seconds or None, expire_windows=self.expire_windows)
+        return add_to_set(self.seen_set_key, item_unique_id_str)
 
-                return item
+    def add_seen_ids(self, item_ids):
+        if self.key_on_content:
+            return store_many_if_changed(self.seen_set_key, [self.content_pair(item_id) for item_id in item_ids], **self.content_storage_options())
+        if self.storage == 'hashed':
+            return add_many_to_hashed_set(self.seen_set_key, item_ids, expire_seconds=self.expire_seconds or None, expire_windows=self.expire_windows)
+        return add_many_to_set(self.seen_set_key, item_ids)
 
+    def scan_seen_ids(self):
+        if self.key_on_content:
+            return (f"{item_id}:{item_hash}" for item_id, item_hash in scan_content_hashes(self.seen_set_key, hashed=self.storage == 'hashed'))
+        if self.storage == 'hashed':
+            return scan_hashed_set(self.seen_set_key)
+        return scan_set(self.seen_set_key)
+
+    def seen_ids_count(self):
+        if self.key_on_content:
+            return content_hashes_size(self.seen_set_key, hashed=self.storage == 'hashed')
+        if self.storage == 'hashed':
+            return hashed_set_size(self.seen_set_key)
+        return set_size(self.seen_set_key)
+
+    def content_storage_options(self):
+        if self.storage == 'hashed':
+            return {'hashed': True, 'expire_seconds': self.expire_seconds or None, 'expire_windows': self.expire_windows}
+        return {}
+
+    '''
+    Value kept in the Bloom filter for an id, the same form scan_seen_ids returns
+    '''
+    def bloom_value(self, item_unique_id_str):
+        if self.key_on_content and self.storage == 'hashed':
+            item_id, item_hash = self.content_pair(item_unique_id_str)
+            return f"{hashed_member(item_id)}:{hashed_member(item_hash)}"
+        if self.storage == 'hashed':
+            return str(hashed_member(item_unique_id_str))
+        return item_unique_id_str
+
+    '''
+    Builds the Bloom filter for the seen set
+    A filter saved by an earlier crawl is reused when it was built from the same set at its current size,
+    otherwise the set is read with SSCAN. Returns None (no pre-filter) if Redis could not be read
+    '''
+    def open_bloom(self, spider):
+        started_at = time.monotonic()
+        try:
+            seen_count = self.seen_ids_count()
         except Exception as e:
-             logging.error(f"Redis error during deduplication check/add for ID '{item_unique_id_str}' in set '{self.seen_set_key}': {e}", extra={'spider': spider})
-             self.stats.inc_value('redis/errors', spider=spider)
-             return item
+            logging.error(f"Redis error counting set '{self.seen_set_key}': {e}", extra={'spider': spider})
+            seen_count = None
+        if seen_count is None:
+            logging.warning("RedisDeduplicationPipeline: Could not read the seen set size, Bloom filter disabled")
+            return None
+
+        bloom, header = BloomFilter.load(self.bloom_path)
+        if (bloom is not None and header.get('set_key') == self.seen_set_key and header.get('storage', 'set') == self.storage and header.get('set_size') == seen_count
+                and header['error_rate'] == self.bloom_error_rate and bloom.capacity >= seen_count):
+            logging.info(f"RedisDeduplicationPipeline: Loaded Bloom filter with {len(bloom)} ids from {self.bloom_path}")
+            self.stats.set_value('bloom/loaded_ids', len(bloom))
+            return bloom
+
+        bloom = BloomFilter(max(self.bloom_capacity, seen_count * 2), self.bloom_error_rate)
+        try:
+            for member in self.scan_seen_ids():
+                bloom.add(member)
+        except Exception as e:
+            logging.error(f"Redis error scanning set '{self.seen_set_key}': {e}", extra={'spider': spider})
+        if len(bloom) < seen_count:
+            logging.warning(f"RedisDeduplicationPipeline: Scanned {len(bloom)} of {seen_count} seen ids, Bloom filter disabled")
+            return None
+        warmup_seconds = time.monotonic() - started_at
+        logging.info(f"RedisDeduplicationPipeline: Warmed Bloom filter ({bloom.num_bits // 8} bytes, {bloom.num_hashes} hashes) with {len(bloom)} ids in {warmup_seconds:.2f}s")
+        self.stats.set_value('bloom/warmed_ids', len(bloom))
+        self.stats.set_value('bloom/warmup_seconds', round(warmup_seconds, 3))
+        return bloom
+
+    '''
+    Reports the hit and false positive rates and saves the filter for the next crawl
+    hit rate: share of checked ids answered locally, false positive rate: share of new ids the filter sent to Redis
+    '''
+    def close_bloom(self, spider):
+        definitely_new = self.stats.get_value('bloom/definitely_new', 0)
+        maybe_seen = self.stats.get_value('bloom/maybe_seen', 0)
+        false_positives = self.stats.get_value('bloom/false_positives', 0)
+        if definitely_new + maybe_seen:
+            self.stats.set_value('bloom/hit_rate', round(definitely_new / (definitely_new + maybe_seen), 6))
+        if definitely_new + false_positives:
+            self.stats.set_value('bloom/false_positive_rate', round(false_positives / (definitely_new + false_positives), 6))
+
+        if self.bloom_path:
+            try:
+                seen_count = self.seen_ids_count()
+            except Exception as e:
+                logging.error(f"Redis error counting set '{self.seen_set_key}': {e}", extra={'spider': spider})
+                seen_count = None
+            if seen_count is not None and self.bloom.save(self.bloom_path, set_key=self.seen_set_key, storage=self.storage, set_size=seen_count):
+                logging.info(f"RedisDeduplicationPipeline: Saved Bloom filter with {len(self.bloom)} ids to {self.bloom_path}")
 
 """
     Pipeline for storing Scrapy items in a MongoDB database.
+    With MONGO_BATCH_SIZE > 1 the items are buffered and written with one unordered insert_many
+    once the batch is full, MONGO_BATCH_FLUSH_INTERVAL seconds passed or the spider closes.
+    Every document stores the content hash of its fields. With MONGO_WRITE_MODE = 'upsert' the stored
+    hashes of a batch are fetched first and only new or changed items are sent, as UpdateOne upserts.
+    Items RedisDeduplicationPipeline already found unchanged are dropped before and counted in
+    mongodb/unchanged_items by it, so inserted + updated + unchanged covers every item with a key.
+    With MONGO_WRITE_BEHIND the batches are written by a background thread (jobs_project.write_behind),
+    the crawl is paused while MONGO_WRITE_QUEUE_SIZE batches wait for it and batches MongoDB does not
+    take are journaled to MONGO_WRITE_JOURNAL_PATH and replayed once it is reachable again.
+    The stats and sampled logs of the writes are recorded on the reactor thread (see record).
+    With MONGO_TEXT_CODEC the MONGO_TEXT_CODEC_FIELDS are stored zstd compressed with a dictionary
+    (infra.text_codec): the latest version stored for the collection, or else one trained on the first
+    MONGO_TEXT_CODEC_TRAIN_SAMPLES items, which are written in the clear.
 """
 class MongoDBPipeline:
-    def __init__(self, mongo_db, collection_name, stats):
+    def __init__(self, mongo_db, collection_name, stats, batch_size=1, flush_interval=0, write_mode='insert', write_behind=False, write_queue_size=8, journal_path=None, retry_interval=5.0):
         self.mongo_db = mongo_db
         self.collection_name = collection_name
         self.stats = stats
+        self.batch_size = max(1, batch_size)
+        self.flush_interval = flush_interval
+        self.unique_key_field = 'slug'
+        self.buffer = []
+        self.buffer_started_at = None
+        self.flush_loop = None
+        self.spider = None
+        self.write_mode = write_mode
+        self.item_field_names = ()
+        self.query_indexes = True
+        self.write_behind = write_behind
+        self.write_queue_size = max(1, write_queue_size)
+        self.journal_path = journal_path
+        self.retry_interval = retry_interval
+        self.writer = None
+        self.crawler = None
+        # batches waiting for room in the write-behind queue while the crawl is paused
+        self.blocked_batches = []
+        self.paused_crawl = False
+        # stats and log updates of the writer thread waiting for the reactor thread
+        self.pending_records = deque()
+        self.text_codec = False
+        self.codec_fields = ('description',)
+        self.codec_level = 3
+        self.codec_train_samples = 1000
+        self.codec_dict_size = 112640
+        self.codec = None
+        # values collected to train the dictionary, None when not sampling
+        self.codec_samples = None
 
     @classmethod
     def from_crawler(cls, crawler):
@@ -109,7 +524,35 @@ class MongoDBPipeline:
 
         if not collection_name:
              raise NotConfigured("MongoDBPipeline requires the 'MONGO_COLLECTION' setting.")
+        write_mode = settings.get('MONGO_WRITE_MODE', 'insert')
+        if write_mode not in ('insert', 'upsert'):
+            raise NotConfigured(f"Unknown MONGO_WRITE_MODE '{write_mode}', expected 'insert' or 'upsert'")
 
+        mongo_db = cls.open_connection()
+
+        pipeline = cls(
+            mongo_db,
+            collection_name,
+            crawler.stats,
+            batch_size=settings.getint('MONGO_BATCH_SIZE', 1),
+            flush_interval=settings.getfloat('MONGO_BATCH_FLUSH_INTERVAL', 0),
+            write_mode=write_mode,
+            write_behind=settings.getbool('MONGO_WRITE_BEHIND', False),
+            write_queue_size=settings.getint('MONGO_WRITE_QUEUE_SIZE', 8),
+            journal_path=settings.get('MONGO_WRITE_JOURNAL_PATH') or '.mongo_write_journal.jsonl',
+            retry_interval=settings.getfloat('MONGO_WRITE_RETRY_INTERVAL', 5.0),
+        )
+        pipeline.crawler = crawler
+        pipeline.query_indexes = settings.getbool('MONGO_QUERY_INDEXES', True)
+        pipeline.text_codec = settings.getbool('MONGO_TEXT_CODEC', False)
+        pipeline.codec_fields = tuple(settings.getlist('MONGO_TEXT_CODEC_FIELDS', ['description']))
+        pipeline.codec_level = settings.getint('MONGO_TEXT_CODEC_LEVEL', 3)
+        pipeline.codec_train_samples = settings.getint('MONGO_TEXT_CODEC_TRAIN_SAMPLES', 1000)
+        pipeline.codec_dict_size = settings.getint('MONGO_TEXT_CODEC_DICT_SIZE', 112640)
+        return pipeline
+
+    @classmethod
+    def open_connection(cls):
         try:
             mongo_db = get_db()
             if mongo_db is None:
@@ -121,44 +564,372 @@ class MongoDBPipeline:
         except Exception as e:
              logging.error(f"Error getting MongoDB connection: {e}. MongoDB pipeline disabled.")
              raise NotConfigured(f"MongoDB connection error: {e}")
+        return mongo_db
 
-
-        pipeline = cls(mongo_db, collection_name, crawler.stats)
-        return pipeline
-
-    def open_spider(self, spider):
-        logging.info(f"MongoDBPipeline: Storing items in collection '{self.collection_name}'")
-        unique_key_field = spider.settings.get('DUPEFILTER_KEY_FIELD', 'slug')
+    def open_spider(self):
+        spider = self.crawler.spider
+        self.configure(spider)
         try:
-            self.mongo_db[self.collection_name].create_index(unique_key_field, unique=True, background=True)
-            logging.info(f"Ensured unique index on '{unique_key_field}' in collection '{self.collection_name}'")
+            self.mongo_db[self.collection_name].create_index(self.unique_key_field, unique=True, background=True)
+            logging.info(f"Ensured unique index on '{self.unique_key_field}' in collection '{self.collection_name}'")
         except Exception as e:
-            logging.warning(f"Could not ensure unique index on '{unique_key_field}' in {self.collection_name}: {e}")
+            logging.warning(f"Could not ensure unique index on '{self.unique_key_field}' in {self.collection_name}: {e}")
+        if self.query_indexes:
+            ensure_indexes(self.collection_name)
+        if self.text_codec:
+            self.open_codec()
+        self.start_flush_loop()
+        if self.write_behind:
+            self.start_writer(spider)
+
+    def configure(self, spider):
+        self.spider = spider
+        logging.info(f"MongoDBPipeline: Storing items in collection '{self.collection_name}' ({self.write_mode} mode)")
+        self.unique_key_field = spider.settings.get('DUPEFILTER_KEY_FIELD', 'slug')
+
+    def start_flush_loop(self):
+        if self.batch_size > 1:
+            logging.info(f"MongoDBPipeline: Writing items in batches of {self.batch_size} (flush interval {self.flush_interval}s)")
+            if self.flush_interval > 0:
+                # flushes a partially filled batch when the item flow stalls
+                self.flush_loop = task.LoopingCall(self.flush_if_due)
+                self.flush_loop.start(self.flush_interval, now=False)
 
+    '''
+    Starts the write-behind thread, the batches are written from it from now on
+    '''
+    def start_writer(self, spider):
+        from twisted.internet import reactor
+        logging.info(f"MongoDBPipeline: Writing behind through a queue of {self.write_queue_size} batches, journal {self.journal_path}")
+        # assigned before the thread starts, record() compares the current thread with it
+        self.writer = WriteBehindWriter(
+            lambda batch: self.write_batch(batch, spider),
+            lambda: get_db() is not None,
+            self.journal_path,
+            max_batches=self.write_queue_size,
+            batch_size=self.batch_size,
+            retry_interval=self.retry_interval,
+            on_drained=lambda: reactor.callFromThread(self.writer_drained),
+            on_event=lambda name, count: self.record(self.stats.inc_value, f"mongodb/{name}", count=count),
+        )
+        self.writer.start()
 
-    def close_spider(self, spider):
+    '''
+    Runs func now on the reactor thread, or hands it over to the reactor thread when called from the
+    write-behind writer: the stats collector and the sampled logs are not thread safe
+    '''
+    def record(self, func, *args, **kwargs):
+        if self.writer is None or threading.current_thread() is not self.writer.thread:
+            func(*args, **kwargs)
+            return
+        from twisted.internet import reactor
+        self.pending_records.append((func, args, kwargs))
+        reactor.callFromThread(self.run_pending_records)
+
+    def run_pending_records(self):
+        while self.pending_records:
+            func, args, kwargs = self.pending_records.popleft()
+            func(*args, **kwargs)
+
+    def close_spider(self):
+        spider = self.spider
+        if self.flush_loop is not None and self.flush_loop.running:
+            self.flush_loop.stop()
+        self.flush(spider)
+        if self.writer is not None:
+            self.resume_crawl()
+            remaining, self.blocked_batches = self.blocked_batches, []
+            self.writer.close(remaining)
+            self.writer = None
+            # the counts of the last writes, before the stats are read and dumped
+            self.run_pending_records()
+        self.invalidate_query_cache()
+        self.log_codec_savings()
         close_mongo_connection()
-        pass
 
-    def process_item(self, item, spider):
-        adapter = ItemAdapter(item)
-        item_dict = adapter.asdict()
+    '''
+    Bumps the query cache generation of the collection (infra.query_cache) when the crawl wrote to it,
+    so the cached query results of the previous crawl are not served anymore
+    '''
+    def invalidate_query_cache(self):
+        written = self.stats.get_value('mongodb/inserted_items', 0) + self.stats.get_value('mongodb/updated_items', 0)
+        if written:
+            bump_generation(self.collection_name)
+
+    @timed('pipeline/mongodb')
+    def process_item(self, item):
+        spider = self.spider
+        item_dict = self.to_document(item)
+
+        if self.batch_size > 1 or self.writer is not None:
+            if self.buffer_item(item_dict):
+                self.flush(spider)
+            else:
+                self.flush_if_due()
+            return item
+
+        if self.write_mode == 'upsert':
+            self.write_upserts([item_dict], spider)
+            return item
 
         try:
             result = insert_item(item_dict, self.collection_name)
             if result and result.inserted_id:
-                logging.debug(f"Item inserted into MongoDB collection {self.collection_name} with ID {result.inserted_id}", extra={'spider': spider})
-                self.stats.inc_value('mongodb/inserted_items', spider=spider)
+                logging.debug("Item inserted into MongoDB collection %s with ID %s", self.collection_name, result.inserted_id, extra={'spider': spider})
+                self.stats.inc_value('mongodb/inserted_items')
             elif result is None:
-                 logging.error(f"Failed to insert item into MongoDB (insert_item returned None). Item: {item_dict.get('slug', 'N/A')}", extra={'spider': spider})
-                 self.stats.inc_value('mongodb/failed_inserts', spider=spider)
+                 item_errors.log("Failed to insert item into MongoDB (insert_item returned None). Item: %s", item_dict.get('slug', 'N/A'), extra={'spider': spider})
+                 self.stats.inc_value('mongodb/failed_inserts')
 
         except Exception as e:
             if "duplicate key error" in str(e).lower():
-                 logging.warning(f"Duplicate key error inserting item into MongoDB (likely already exists). Key: {item_dict.get(self.settings.get('DUPEFILTER_KEY_FIELD', 'slug'), 'N/A')}", extra={'spider': spider})
-                 self.stats.inc_value('mongodb/duplicate_key_error', spider=spider)
+                 item_warnings.log("Duplicate key error inserting item into MongoDB (likely already exists). Key: %s", item_dict.get(self.unique_key_field, 'N/A'), extra={'spider': spider})
+                 self.stats.inc_value('mongodb/duplicate_key_error')
             else:
                 logging.error(f"Exception inserting item into MongoDB: {e}", extra={'spider': spider}, exc_info=True)
-                self.stats.inc_value('mongodb/failed_inserts', spider=spider)
+                self.stats.inc_value('mongodb/failed_inserts')
+
+        return item
+
+    '''
+    The document stored for the item, its fields plus their content hash
+    The hash is taken before the codec compresses the text fields, so it does not depend on the dictionary
+    '''
+    def to_document(self, item):
+        adapter = ItemAdapter(item)
+        item_dict = adapter.asdict()
+        item_dict[CONTENT_HASH_FIELD] = content_hash(item_dict)
+        if not self.item_field_names:
+            self.item_field_names = tuple(adapter.field_names())
+        if self.codec is not None:
+            self.encode_document(item_dict)
+        elif self.codec_samples is not None:
+            self.sample_document(item_dict)
+        return item_dict
 
-        return item
\ No newline at end of file
+    '''
+    Loads the latest dictionary of the collection, or starts collecting the samples to train one
+    '''
+    def open_codec(self):
+        db = get_db()
+        self.codec = load_codec(db, self.collection_name, self.codec_fields, self.codec_level) if db is not None else None
+        if self.codec is None:
+            logging.info(f"MongoDBPipeline: No text codec dictionary for '{self.collection_name}' yet, training one on the first {self.codec_train_samples} items")
+            self.codec_samples = []
+
+    def encode_document(self, item_dict):
+        raw_bytes, stored_bytes = self.codec.encode_document(item_dict)
+        if raw_bytes:
+            self.stats.inc_value('mongodb/codec_raw_bytes', count=raw_bytes)
+            self.stats.inc_value('mongodb/codec_stored_bytes', count=stored_bytes)
+
+    '''
+    Keeps the codec field values of the document, trains the dictionary once there are enough of them
+    Training blocks the crawl once, for about a second on the default sample
+    '''
+    def sample_document(self, item_dict):
+        for field in self.codec_fields:
+            value = item_dict.get(field)
+            if isinstance(value, (str, dict)) and value:
+                self.codec_samples.append(value)
+        if len(self.codec_samples) < self.codec_train_samples:
+            return
+        samples, self.codec_samples = self.codec_samples, None
+        db = get_db()
+        if db is not None:
+            self.codec = train_codec(db, self.collection_name, samples, self.codec_fields, self.codec_level, self.codec_dict_size)
+        if self.codec is None:
+            logging.warning(f"MongoDBPipeline: Could not train the text codec dictionary, storing '{self.collection_name}' in the clear")
+
+    def log_codec_savings(self):
+        raw_bytes = self.stats.get_value('mongodb/codec_raw_bytes', 0)
+        if raw_bytes:
+            stored_bytes = self.stats.get_value('mongodb/codec_stored_bytes', 0)
+            logging.info(f"MongoDBPipeline: Text codec stored {raw_bytes} bytes of {', '.join(self.codec.fields)} as {stored_bytes} bytes ({stored_bytes / raw_bytes:.1%})")
+
+    '''
+    Adds the document to the buffered batch, returns True once the batch is full
+    '''
+    def buffer_item(self, item_dict):
+        if not self.buffer:
+            self.buffer_started_at = time.monotonic()
+        self.buffer.append(item_dict)
+        return len(self.buffer) >= self.batch_size
+
+    def take_buffer(self):
+        batch = self.buffer
+        self.buffer = []
+        self.buffer_started_at = None
+        return batch
+
+    '''
+    Flushes the buffered batch when it is older than MONGO_BATCH_FLUSH_INTERVAL
+    '''
+    def flush_if_due(self):
+        if not self.buffer or self.flush_interval <= 0:
+            return
+        if time.monotonic() - self.buffer_started_at >= self.flush_interval:
+            self.flush(self.spider)
+
+    '''
+    Writes the buffered items, with one unordered insert_many or the upserts of write_upserts
+    With MONGO_WRITE_BEHIND the batch is handed to the writer thread instead
+    '''
+    def flush(self, spider):
+        if not self.buffer:
+            return
+        batch = self.take_buffer()
+        if self.writer is not None:
+            self.submit_batch(batch)
+        else:
+            self.write_batch(batch, spider)
+
+    '''
+    Returns False when MongoDB did not take the batch (the connector returned None)
+    '''
+    def write_batch(self, batch, spider):
+        if self.write_mode == 'upsert':
+            return self.write_upserts(batch, spider)
+        return self.write_inserts(batch, spider)
+
+    '''
+    Queues the batch for the writer thread, when the queue is full the batch waits here and the
+    crawl is paused until the writer caught up
+    '''
+    def submit_batch(self, batch):
+        if self.blocked_batches or not self.writer.submit(batch):
+            self.blocked_batches.append(batch)
+            self.pause_crawl()
+
+    '''
+    Called on the reactor thread after the writer wrote or journaled a batch
+    '''
+    def writer_drained(self):
+        if self.writer is None:
+            return
+        while self.blocked_batches and self.writer.submit(self.blocked_batches[0]):
+            self.blocked_batches.pop(0)
+        # resumes once the queue is half empty, so the crawl does not stop and go on every batch
+        if not self.blocked_batches and self.writer.pending_batches() <= self.write_queue_size // 2:
+            self.resume_crawl()
+
+    '''
+    Pauses the engine, the spider stops yielding (see JobProjectSpider.start) and no request is scheduled
+    '''
+    def pause_crawl(self):
+        if self.paused_crawl or self.crawler is None or self.crawler.engine is None:
+            return
+        logging.info(f"MongoDB write-behind queue is full ({self.write_queue_size} batches), pausing the crawl")
+        self.crawler.engine.pause()
+        self.paused_crawl = True
+        self.stats.inc_value('mongodb/backpressure_pauses')
+
+    def resume_crawl(self):
+        if not self.paused_crawl:
+            return
+        logging.debug("MongoDB write-behind queue has room again, resuming the crawl")
+        self.crawler.engine.unpause()
+        self.paused_crawl = False
+
+    '''
+    Inserts the batch and maps the per document write errors back onto the per item stats
+    '''
+    def write_inserts(self, batch, spider):
+        result = insert_items(batch, self.collection_name, ordered=False)
+        self.record(self.record_insert_result, batch, result, spider)
+        return result is not None
+
+    def record_insert_result(self, batch, result, spider):
+        if result is None:
+            # the write-behind writer journals the batch instead
+            if self.writer is None:
+                logging.error(f"Failed to insert a batch of {len(batch)} items into MongoDB (insert_items returned None)", extra={'spider': spider})
+                self.stats.inc_value('mongodb/failed_inserts', count=len(batch))
+            return
+
+        self.stats.inc_value('mongodb/inserted_items', count=result['inserted'])
+        self.record_write_errors(batch, result['write_errors'], spider)
+
+    '''
+    Upserts the new and changed items of the batch
+    The content hashes stored for the batch keys are read in one query, items whose hash did not
+    change are counted as unchanged without a write. When a key repeats in the batch the last copy wins
+    '''
+    def write_upserts(self, batch, spider):
+        latest, without_key = self.group_upserts(batch, spider)
+        written = True
+        if without_key:
+            written = self.write_inserts(without_key, spider)
+        if not latest:
+            return written
+        documents = find_item(self.stored_hashes_query(latest), self.collection_name, self.stored_hashes_projection())
+        changed = self.changed_items(latest, documents, spider)
+        if not changed:
+            return written
+        result = upsert_items(changed, self.collection_name, self.unique_key_field, unset_fields=self.item_field_names, ordered=False)
+        self.record(self.record_upsert_result, changed, result, spider)
+        return written and result is not None
+
+    '''
+    Splits a batch into the last copy of every key and the items without a usable key (inserted instead)
+    '''
+    def group_upserts(self, batch, spider):
+        latest = {}
+        without_key = []
+        for item_dict in batch:
+            key = item_dict.get(self.unique_key_field)
+            if key is None or isinstance(key, (list, dict)):
+                without_key.append(item_dict)
+                continue
+            if key in latest:
+                self.record(self.stats.inc_value, 'mongodb/superseded_items')
+            latest[key] = item_dict
+        if without_key:
+            logging.warning(f"Inserting {len(without_key)} items without a usable '{self.unique_key_field}' instead of upserting them", extra={'spider': spider})
+        return latest, without_key
+
+    def stored_hashes_query(self, latest):
+        return {self.unique_key_field: {'$in': list(latest)}}
+
+    def stored_hashes_projection(self):
+        return {self.unique_key_field: 1, CONTENT_HASH_FIELD: 1, '_id': 0}
+
+    '''
+    Compares the batch with the stored documents (key and content hash), returns the new and changed items
+    '''
+    def changed_items(self, latest, documents, spider):
+        stored_hashes = {}
+        for document in documents:
+            stored_key = document.get(self.unique_key_field)
+            # documents stored before the values were scalars hold the key in a list, they are rewritten
+            if not isinstance(stored_key, (list, dict)):
+                stored_hashes[stored_key] = document.get(CONTENT_HASH_FIELD)
+        changed = [item_dict for key, item_dict in latest.items() if stored_hashes.get(key) != item_dict[CONTENT_HASH_FIELD]]
+        self.record(self.stats.inc_value, 'mongodb/unchanged_items', count=len(latest) - len(changed))
+        return changed
+
+    def record_upsert_result(self, changed, result, spider):
+        if result is None:
+            if self.writer is None:
+                logging.error(f"Failed to upsert a batch of {len(changed)} items into MongoDB (upsert_items returned None)", extra={'spider': spider})
+                self.stats.inc_value('mongodb/failed_inserts', count=len(changed))
+            return
+        self.stats.inc_value('mongodb/inserted_items', count=result['inserted'])
+        self.stats.inc_value('mongodb/updated_items', count=result['updated'])
+        # matched but not modified: another writer stored the same content in the meantime
+        if result['matched'] > result['updated']:
+            self.stats.inc_value('mongodb/unchanged_items', count=result['matched'] - result['updated'])
+        self.record_write_errors(changed, result['write_errors'], spider)
+
+    '''
+    Maps the per document write errors of a bulk write back onto the per item stats
+    '''
+    def record_write_errors(self, batch, write_errors, spider):
+        for error in write_errors:
+            failed_item = batch[error.get('index', 0)] if error.get('index', 0) < len(batch) else {}
+            if error.get('code') == DUPLICATE_KEY_ERROR_CODE:
+                item_warnings.log("Duplicate key error inserting item into MongoDB (likely already exists). Key: %s", failed_item.get(self.unique_key_field, 'N/A'), extra={'spider': spider})
+                self.stats.inc_value('mongodb/duplicate_key_error')
+            else:
+                item_errors.log("Error inserting item into MongoDB: %s", error.get('errmsg'), extra={'spider': spider})
+                self.stats.inc_value('mongodb/failed_inserts')
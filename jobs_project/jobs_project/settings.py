@@ -9,15 +9,106 @@ ITEM_PIPELINES = {
     "jobs_project.pipelines.RedisDeduplicationPipeline": 100,
     "jobs_project.pipelines.MongoDBPipeline": 200,
 }
+# Asyncio pipelines (redis.asyncio and AsyncMongoClient) with the same settings, process_item is a
+# coroutine so Redis and MongoDB round trips do not block the reactor, enable them instead of the above:
+# ITEM_PIPELINES = {
+#     "jobs_project.async_pipelines.AsyncRedisDeduplicationPipeline": 100,
+#     "jobs_project.async_pipelines.AsyncMongoDBPipeline": 200,
+# }
 
 DUPEFILTER_KEY_FIELD = 'slug'
+# Number of ids checked against Redis per pipelined round trip, 1 sends one SADD per item
+REDIS_DEDUP_BATCH_SIZE = 100
+# Seconds after which a partially filled dedup batch is sent anyway
+REDIS_DEDUP_FLUSH_INTERVAL = 0.1
+# 'set' keeps the raw ids in one Redis set, 'hashed' keeps 64 bit digests of them in bucketed integer sets
+# (about 8 bytes per id, bucket count from the REDIS_HASHED_SET_BUCKETS environment variable)
+REDIS_DEDUP_STORAGE = 'set'
+# With 'hashed' storage, forget ids after this many seconds (0 keeps them forever), expiry is done per time window
+REDIS_DEDUP_EXPIRE_SECONDS = 0
+REDIS_DEDUP_EXPIRE_WINDOWS = 4
+# In process Bloom filter in front of the Redis set, warmed with SSCAN when the spider opens
+# Ids it has never seen pass without waiting for Redis, only possible duplicates are checked there
+BLOOM_FILTER_ENABLED = False
+# Expected number of ids (grown to twice the size of the Redis set when that is larger) and false positive rate
+BLOOM_FILTER_CAPACITY = 1000000
+BLOOM_FILTER_ERROR_RATE = 0.001
+# File the filter is saved to when the spider closes and loaded from on the next start, None keeps it in memory only
+BLOOM_FILTER_PATH = None
+
+# Directories or glob patterns (** for nested folders) of the data files to ingest, *.json and *.json.gz
+# Empty uses the jobs_project/data folder
+INPUT_PATHS = []
+# Worker processes decoding the data files, 0 or 1 parses them in the Scrapy process
+PARSE_WORKERS = 0
+# Records sent back per message by a parse worker
+PARSE_BATCH_SIZE = 500
+# Messages the parse workers may queue up before they wait for the pipelines
+PARSE_QUEUE_SIZE = 16
+
+# Decode the jobs array of the data files incrementally instead of loading the whole file with json.load
+JSON_STREAMING_ENABLED = True
+# Number of characters read from a data file at a time in streaming mode
+JSON_STREAM_CHUNK_SIZE = 65536
+
+# Skip the data files already ingested by an earlier crawl (same size/mtime or same sha256)
+INGEST_MANIFEST_ENABLED = True
+# Where the manifest is kept, defaults to .ingest_manifest.json in the data folder
+INGEST_MANIFEST_PATH = None
+# Records read between two saves of the resume offset of the file being ingested
+INGEST_MANIFEST_CHECKPOINT_RECORDS = 1000
 
 # MongoDB collection name where job items will be stored.
 MONGO_COLLECTION = 'testing_jobs' #
+# Number of items written per insert_many, 1 writes every item with its own insert_one
+MONGO_BATCH_SIZE = 500
+# Seconds after which a partially filled batch is written anyway, 0 only flushes on size and spider close
+MONGO_BATCH_FLUSH_INTERVAL = 2.0
+# 'insert' relies on the unique index to reject stored items, 'upsert' writes new and changed items
+# (compared by their stored content hash) with UpdateOne(..., upsert=True) and skips unchanged ones
+MONGO_WRITE_MODE = 'insert'
+# Create the compound indexes of the job queries (infra/job_queries.py) when the spider opens
+MONGO_QUERY_INDEXES = True
+# AsyncMongoDBPipeline only, batches written concurrently
+MONGO_MAX_INFLIGHT_WRITES = 4
+# Write the batches from a background thread (MongoDBPipeline only), the crawl is paused while
+# MONGO_WRITE_QUEUE_SIZE batches wait for the writer
+MONGO_WRITE_BEHIND = False
+MONGO_WRITE_QUEUE_SIZE = 8
+# Append-only JSONL file of the batches MongoDB did not take, replayed once it is reachable again
+# (and by the next crawl if it is still down when the spider closes)
+MONGO_WRITE_JOURNAL_PATH = '.mongo_write_journal.jsonl'
+# Seconds between two attempts to replay the journal
+MONGO_WRITE_RETRY_INTERVAL = 5.0
+# Store MONGO_TEXT_CODEC_FIELDS ('description' and/or 'meta_data') zstd compressed with a dictionary
+# trained on the first MONGO_TEXT_CODEC_TRAIN_SAMPLES items and versioned in MongoDB (infra/text_codec.py),
+# the readers of infra decode them. Compressed descriptions are not in the text index of the job search
+MONGO_TEXT_CODEC = False
+MONGO_TEXT_CODEC_FIELDS = ['description']
+MONGO_TEXT_CODEC_LEVEL = 3
+MONGO_TEXT_CODEC_TRAIN_SAMPLES = 1000
+# Dictionary size in bytes, zstd's default
+MONGO_TEXT_CODEC_DICT_SIZE = 112640
+
+# Latency histograms of the spider parse, the pipelines and the infra connector calls (infra/metrics.py)
+EXTENSIONS = {
+    'jobs_project.extensions.MetricsExporter': 500,
+    'jobs_project.extensions.QueueLogging': 0,
+}
+METRICS_ENABLED = True
+# Seconds between two copies of the histograms into the stats / the textfile
+METRICS_INTERVAL = 15.0
+# Prometheus textfile (e.g. in the node_exporter textfile collector directory), None disables it
+METRICS_TEXTFILE_PATH = None
+# Port of the /metrics endpoint scraped by Prometheus during the crawl, 0 disables it
+METRICS_HTTP_PORT = 0
+METRICS_HTTP_HOST = '127.0.0.1'
 
 REQUEST_FINGERPRINTER_IMPLEMENTATION = "2.7"
 TWISTED_REACTOR = "twisted.internet.asyncioreactor.AsyncioSelectorReactor"
 FEED_EXPORT_ENCODING = "utf-8"
 
 # Logging Settings
-LOG_LEVEL = 'INFO'
\ No newline at end of file
+LOG_LEVEL = 'INFO'
+# Writes the log from a background thread (jobs_project.extensions.QueueLogging)
+LOG_QUEUE_ENABLED = False
\ No newline at end of file
@@ -1,45 +1,205 @@
 import scrapy
 import json
 import logging
+import multiprocessing
 from pathlib import Path
 
-import scrapy.loader
+from scrapy import signals
+from scrapy.utils.defer import maybe_deferred_to_future
+from twisted.internet import task
 from jobs_project.items import JobsProjectItem
+from jobs_project.manifest import IngestionManifest
+from jobs_project.json_stream import DEFAULT_CHUNK_SIZE
+from jobs_project.inputs import discover_input_files, open_data_file, iter_job_entries, normalize_job_entry, iter_parallel_results, PARSE_PENDING
+
+# per item parse timing, fed to the metrics exporter
+try:
+    from infra.metrics import timed_iter
+except ImportError as e:
+    logging.error(f"Could not import from 'infra' module: {e}. Ensure it's in the Python path.")
+    def timed_iter(iterable, name): return iterable
+
+# seconds between two checks of a paused engine in start()
+PAUSE_POLL_INTERVAL = 0.05
+# seconds the reactor runs before the result queue of the parse workers is checked again when it was empty
+PARSE_POLL_INTERVAL = 0.01
 
 class JobProjectSpider(scrapy.Spider):
     name = "JobProjectSpider"
-    # setting the path to the data files
+    manifest = None
+    # setting the path to the data files, used when INPUT_PATHS is empty
     data_dir = Path(__file__).parent.parent.parent / 'jobs_project' / 'data'
-    start_urls = [
-        f'file://{str(data_dir.resolve() / "s01.json")}',
-        f'file://{str(data_dir.resolve() / "s02.json")}',
-    ]
+    # explicit urls take precedence over the discovered data files
+    start_urls = []
+
+    @classmethod
+    def from_crawler(cls, crawler, *args, **kwargs):
+        spider = super().from_crawler(crawler, *args, **kwargs)
+        spider.manifest = None
+        if crawler.settings.getbool('INGEST_MANIFEST_ENABLED', True):
+            manifest_path = crawler.settings.get('INGEST_MANIFEST_PATH') or str(cls.data_dir / '.ingest_manifest.json')
+            checkpoint_interval = crawler.settings.getint('INGEST_MANIFEST_CHECKPOINT_RECORDS', 1000)
+            spider.manifest = IngestionManifest(manifest_path, checkpoint_interval=checkpoint_interval).load()
+            for signal in (signals.item_scraped, signals.item_dropped, signals.item_error):
+                crawler.signals.connect(spider.item_finished, signal=signal)
+        return spider
 
     '''
     Sets the start request url for scrapy to communicate with
-    Defines the urls that will used by scrapy
+    Without explicit start_urls the data files are discovered from INPUT_PATHS
+    (directories or glob patterns, *.json and *.json.gz), the data folder by default
+    With JSON_STREAMING_ENABLED the jobs array is decoded incrementally, so
+    items are yielded while the file is still being read
+    With INGEST_MANIFEST_ENABLED files ingested by a previous crawl are skipped
+    and an interrupted file resumes from its checkpointed record offset
+    With PARSE_WORKERS > 1 the files are decoded in a pool of worker processes
     '''
     def start_requests(self):
+        file_paths = []
         for url in self.start_urls:
             logging.info(f"{url}")
             if url.startswith('file://'):
-                filepath = url[7:]
+                file_paths.append(url[7:])
+            else:
+                yield scrapy.Request(url=url, callback=self.parse)
+        if not self.start_urls:
+            input_paths = self.settings.getlist('INPUT_PATHS') or [str(self.data_dir.resolve())]
+            file_paths = discover_input_files(input_paths)
+            logging.info(f"Discovered {len(file_paths)} data files in {input_paths}")
+
+        tasks = []
+        for filepath in file_paths:
+            start_offset = 0
+            if self.manifest is not None:
                 try:
-                    with open(filepath, 'r', encoding='utf-8') as f:
-                        data = json.load(f)
-                        yield from self.parse(data=data, file_path=filepath)
+                    start_offset = self.manifest.check(filepath)
                 except FileNotFoundError:
                     self.logger.error(f"File not found: {filepath}")
-                except json.JSONDecodeError:
-                    self.logger.error(f"Error decoding JSON in: {filepath}")
+                    continue
+                if start_offset is None:
+                    logging.info(f"Skipping {filepath}, it was already ingested and has not changed")
+                    self.crawler.stats.inc_value('manifest/skipped_files')
+                    continue
+                if start_offset:
+                    logging.info(f"Resuming {filepath} from record {start_offset}")
+                    self.crawler.stats.inc_value('manifest/resumed_files')
+            tasks.append((filepath, start_offset))
+
+        workers = self.settings.getint('PARSE_WORKERS', 0)
+        if workers > 1 and len(tasks) > 1:
+            yield from self.parse_files_parallel(tasks, workers)
+        else:
+            for filepath, start_offset in tasks:
+                yield from timed_iter(self.parse_file(filepath, start_offset), 'spider/parse')
+
+    '''
+    Reads one data file in the reactor thread and yields its items
+    '''
+    def parse_file(self, filepath, start_offset=0):
+        streaming = self.settings.getbool('JSON_STREAMING_ENABLED', True)
+        chunk_size = self.settings.getint('JSON_STREAM_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+        try:
+            if self.manifest is not None:
+                self.manifest.begin(filepath, start_offset)
+            with open_data_file(filepath) as f:
+                yield from self.parse_jobs(iter_job_entries(f, streaming, chunk_size), file_path=filepath, start_offset=start_offset)
+            if self.manifest is not None:
+                self.manifest.file_parsed(filepath)
+        except FileNotFoundError:
+            self.logger.error(f"File not found: {filepath}")
+        except json.JSONDecodeError as e:
+            self.logger.error(f"Error decoding JSON in: {filepath}: {e}")
+
+    '''
+    Decodes and normalizes the data files in PARSE_WORKERS processes and turns the
+    normalized records they send back into items for the item pipelines
+    PARSE_PENDING is passed on while the workers have nothing ready, start() then waits
+    on the reactor instead of blocking it
+    '''
+    def parse_files_parallel(self, tasks, workers):
+        streaming = self.settings.getbool('JSON_STREAMING_ENABLED', True)
+        chunk_size = self.settings.getint('JSON_STREAM_CHUNK_SIZE', DEFAULT_CHUNK_SIZE)
+        batch_size = self.settings.getint('PARSE_BATCH_SIZE', 500)
+        queue_size = self.settings.getint('PARSE_QUEUE_SIZE', 16)
+        logging.info(f"Parsing {len(tasks)} data files with {min(workers, len(tasks))} worker processes")
+
+        for filepath, start_offset in tasks:
+            if self.manifest is not None:
+                self.manifest.begin(filepath, start_offset)
+        context = multiprocessing.get_context('spawn')
+        results = iter_parallel_results(context, tasks, workers, streaming, chunk_size, batch_size, queue_size)
+        offsets = dict(tasks)
+        for message in results:
+            if message is PARSE_PENDING:
+                yield message
+                continue
+            kind, filepath, payload = message
+            if kind == 'batch':
+                yield from timed_iter(self.parse_batch(filepath, payload), 'spider/parse')
+            elif kind == 'done':
+                logging.info(f"Read {payload} jobs from {filepath}")
+                self.crawler.stats.inc_value('parse/files')
+                if offsets[filepath]:
+                    self.crawler.stats.inc_value('manifest/skipped_records', min(offsets[filepath], payload))
+                if self.manifest is not None:
+                    self.manifest.file_parsed(filepath)
             else:
-                yield scrapy.Request(url=url, callback=self.parse)
+                self.logger.error(payload)
+                self.crawler.stats.inc_value('parse/failed_files')
+
+    '''
+    Builds the items of a batch of normalized records sent by a parse worker
+    '''
+    def parse_batch(self, filepath, batch):
+        for index, fields, skip_reason in batch:
+            if fields is None:
+                logging.warning(skip_reason)
+                if self.manifest is not None:
+                    self.manifest.record_consumed(filepath, index)
+                continue
+            item = self.build_item(fields)
+            if self.manifest is not None:
+                self.manifest.record_consumed(filepath, index, item)
+            yield item
+
+    '''
+    Signal handler for items leaving the item pipelines, moves the manifest checkpoint of their file
+    '''
+    def item_finished(self, item, **kwargs):
+        self.manifest.item_finished(item)
+
+    def closed(self, reason):
+        if self.manifest is not None:
+            self.manifest.save()
+
+    '''
+    Scrapy 2.13+ calls start() instead of start_requests()
+    Reuses start_requests so both versions read the files the same way
+    Scrapy keeps consuming start() while the engine is paused, so the items wait here
+    for the engine to be unpaused (e.g. by the MongoDB write-behind backpressure)
+    While the parse workers have nothing ready the reactor runs for PARSE_POLL_INTERVAL
+    '''
+    async def start(self):
+        from twisted.internet import reactor
+        for request_or_item in self.start_requests():
+            if request_or_item is PARSE_PENDING:
+                await maybe_deferred_to_future(task.deferLater(reactor, PARSE_POLL_INTERVAL, lambda: None))
+                continue
+            if self.crawler.engine.paused:
+                await self.wait_while_paused()
+            yield request_or_item
+
+    async def wait_while_paused(self):
+        from twisted.internet import reactor
+        engine = self.crawler.engine
+        while engine.paused and engine.running:
+            await maybe_deferred_to_future(task.deferLater(reactor, PAUSE_POLL_INTERVAL, lambda: None))
 
     '''
     From the urls generated, this function will scrape the data for the
     fields declared in items.py
     '''
-    def parse(self, data, file_path=None):
+    def parse(self, data, file_path=None, start_offset=0):
         if file_path:
             logging.info(f"Processing file: {file_path}")
         else:
@@ -51,56 +211,42 @@ class JobProjectSpider(scrapy.Spider):
             return
 
         logging.info(f"Found {len(jobs_data_list)} jobs in {file_path}")
+        yield from timed_iter(self.parse_jobs(jobs_data_list, file_path=file_path, start_offset=start_offset), 'spider/parse')
 
-        for job_entry in jobs_data_list:
-            if not isinstance(job_entry, dict):
-                logging.warning(f"Skipping non-dictionary item in jobs list: {job_data}")
-                continue
+    '''
+    Builds the items from an iterable of job entries, the iterable can be
+    a fully loaded list or the lazy iterator used in streaming mode
+    The first start_offset entries were ingested by an earlier crawl and are skipped
+    '''
+    def parse_jobs(self, jobs_entries, file_path=None, start_offset=0):
+        if file_path:
+            logging.info(f"Reading jobs from file: {file_path}")
+        track = self.manifest is not None and file_path is not None
 
-            job_data = job_entry.get('data')
-            if not isinstance(job_data, dict):
-                logging.warning(f"Skipping item without 'data' dictionary: {job_entry}")
+        jobs_count = 0
+        for job_entry in jobs_entries:
+            jobs_count += 1
+            if jobs_count <= start_offset:
+                continue
+            fields, skip_reason = normalize_job_entry(job_entry)
+            if fields is None:
+                logging.warning(skip_reason)
+                if track:
+                    self.manifest.record_consumed(file_path, jobs_count - 1)
                 continue
 
-            item = JobsProjectItem()
-            loader = scrapy.loader.ItemLoader(item=item)
-            loader.add_value('slug', job_data.get('slug'))
-            loader.add_value('language', job_data.get('language'))
-            loader.add_value('req_id', job_data.get('req_id'))
-            loader.add_value('title', job_data.get('title'))
-            loader.add_value('description', job_data.get('description'))
-            loader.add_value('street_address', job_data.get('street_address'))
-            loader.add_value('city', job_data.get('city'))
-            loader.add_value('state', job_data.get('state'))
-            loader.add_value('country_code', job_data.get('country_code'))
-            loader.add_value('postal_code', job_data.get('postal_code'))
-            loader.add_value('location_type', job_data.get('location_type'))
-            loader.add_value('latitude', job_data.get('latitude'))
-            loader.add_value('longitude', job_data.get('longitude'))
-            loader.add_value('categories', job_data.get('categories'))
-            loader.add_value('tags', job_data.get('tags'))
-            loader.add_value('tags5', job_data.get('tags5'))
-            loader.add_value('tags6', job_data.get('tags6'))
-            loader.add_value('brand', job_data.get('brand'))
-            loader.add_value('promotion_value', job_data.get('promotion_value'))
-            loader.add_value('salary_currency', job_data.get('salary_currency'))
-            loader.add_value('salary_value', job_data.get('salary_value'))
-            loader.add_value('salary_min_value', job_data.get('salary_min_value'))
-            loader.add_value('salary_max_value', job_data.get('salary_max_value'))
-            loader.add_value('benefits', job_data.get('benefits'))
-            loader.add_value('employment_type', job_data.get('employment_type'))
-            loader.add_value('hiring_organization', job_data.get('hiring_organization'))
-            loader.add_value('source', job_data.get('source'))
-            loader.add_value('apply_url', job_data.get('apply_url'))
-            loader.add_value('internal', job_data.get('internal'))
-            loader.add_value('searchable', job_data.get('searchable'))
-            loader.add_value('applyable', job_data.get('applyable'))
-            loader.add_value('li_easy_applyable', job_data.get('li_easy_applyable'))
-            loader.add_value('ats_code', job_data.get('ats_code'))
-            loader.add_value('meta_data', job_data.get('meta_data'))
-            loader.add_value('update_date', job_data.get('update_date'))
-            loader.add_value('create_date', job_data.get('create_date'))
-            loader.add_value('category', job_data.get('category'))
-            loader.add_value('full_location', job_data.get('full_location'))
-            loader.add_value('short_location', job_data.get('short_location'))
-            yield loader.load_item()
\ No newline at end of file
+            item = self.build_item(fields)
+            if track:
+                self.manifest.record_consumed(file_path, jobs_count - 1, item)
+            yield item
+
+        if file_path:
+            logging.info(f"Read {jobs_count} jobs from {file_path}")
+        if start_offset:
+            self.crawler.stats.inc_value('manifest/skipped_records', min(start_offset, jobs_count))
+
+    '''
+    Wraps the fields mapped by normalize_job_entry into an item
+    '''
+    def build_item(self, fields):
+        return JobsProjectItem(fields)
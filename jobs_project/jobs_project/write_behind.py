@@ -0,0 +1,186 @@
+import logging
+import os
+import queue
+import threading
+import time
+
+from bson import json_util
+
+# put on the queue by close() to stop the writer thread
+STOP_WRITER = object()
+
+"""
+    Append-only JSONL file of the documents MongoDB did not take, one extended JSON document per line
+    (ObjectIds and dates survive the round trip). Only the writer thread touches it.
+"""
+class WriteJournal:
+    def __init__(self, path):
+        self.path = path
+        self.pending = os.path.exists(path) and os.path.getsize(path) > 0
+
+    def append(self, batch):
+        with open(self.path, 'a', encoding='utf-8') as f:
+            for document in batch:
+                f.write(json_util.dumps(document))
+                f.write('\n')
+            f.flush()
+            os.fsync(f.fileno())
+        self.pending = True
+
+    '''
+    Yields the journaled documents in chunks of batch_size as (lines, documents)
+    Lines that do not decode (e.g. cut off by a crash while appending) are skipped with a warning
+    '''
+    def iter_batches(self, f, batch_size):
+        lines, documents = [], []
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                documents.append(json_util.loads(line))
+            except ValueError as e:
+                logging.warning(f"Skipping an unreadable line of the write journal {self.path}: {e}")
+                continue
+            lines.append(line)
+            if len(documents) >= batch_size:
+                yield lines, documents
+                lines, documents = [], []
+        if documents:
+            yield lines, documents
+
+    '''
+    Writes lines followed by the rest of the open journal f to a temporary file and renames it over the journal
+    '''
+    def keep(self, lines, f):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as tmp:
+            tmp.writelines(lines)
+            for line in f:
+                tmp.write(line)
+            tmp.flush()
+            os.fsync(tmp.fileno())
+        os.replace(tmp_path, self.path)
+
+    def clear(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        self.pending = False
+
+"""
+    Bounded write-behind queue between MongoDBPipeline and MongoDB.
+    The pipeline hands over full batches with submit(), a daemon thread writes them with write_batch
+    (which returns False when MongoDB did not take the batch). A batch that could not be written is
+    appended to the WriteJournal, and so is every batch after it while the journal is not empty, so the
+    documents reach MongoDB in the order they were scraped. Every retry_interval seconds the writer checks
+    is_available() and replays the journal, a journal left by an earlier crash is replayed on start.
+    on_drained is called from the writer thread after every batch, on_event(name, count) counts
+    'journaled_items' and 'replayed_items'.
+"""
+class WriteBehindWriter:
+    def __init__(self, write_batch, is_available, journal_path, max_batches=8, batch_size=500, retry_interval=5.0, on_drained=None, on_event=None):
+        self.write_batch = write_batch
+        self.is_available = is_available
+        self.journal = WriteJournal(journal_path)
+        self.max_batches = max(1, max_batches)
+        self.batch_size = max(1, batch_size)
+        self.retry_interval = retry_interval
+        self.on_drained = on_drained
+        self.on_event = on_event
+        self.batches = queue.Queue(maxsize=self.max_batches)
+        self.next_retry_at = 0.0
+        self.thread = None
+
+    def start(self):
+        if self.journal.pending:
+            logging.info(f"Found the write journal {self.journal.path} of an earlier crawl, replaying it once MongoDB is reachable")
+        self.thread = threading.Thread(target=self.run, name='mongodb-write-behind', daemon=True)
+        self.thread.start()
+        return self
+
+    '''
+    Queues the batch without blocking, returns False when the queue is full
+    '''
+    def submit(self, batch):
+        try:
+            self.batches.put_nowait(batch)
+            return True
+        except queue.Full:
+            return False
+
+    def pending_batches(self):
+        return self.batches.qsize()
+
+    '''
+    Queues the remaining batches, waits until the writer wrote or journaled everything and stops it
+    '''
+    def close(self, remaining_batches=()):
+        if self.thread is None:
+            return
+        for batch in remaining_batches:
+            self.batches.put(batch)
+        self.batches.put(STOP_WRITER)
+        self.thread.join()
+        self.thread = None
+        if self.journal.pending:
+            logging.warning(f"MongoDB is still not taking writes, the write journal {self.journal.path} is replayed by the next crawl")
+
+    def run(self):
+        while True:
+            # a journal due for a retry (or found on start) is replayed without waiting for a batch
+            replay_due = self.journal.pending and time.monotonic() >= self.next_retry_at
+            try:
+                batch = self.batches.get(timeout=0 if replay_due else self.retry_interval)
+            except queue.Empty:
+                batch = None
+            if batch is STOP_WRITER:
+                if self.journal.pending:
+                    self.replay()
+                return
+            try:
+                if self.journal.pending and time.monotonic() >= self.next_retry_at:
+                    self.replay()
+                if batch is not None:
+                    self.write(batch)
+            except Exception as e:
+                logging.error(f"MongoDB write-behind writer failed: {e}", exc_info=True)
+            if batch is not None and self.on_drained is not None:
+                self.on_drained()
+
+    def write(self, batch):
+        if self.journal.pending:
+            self.spill(batch)
+        elif not self.write_batch(batch):
+            logging.warning(f"MongoDB did not take a batch of {len(batch)} items, journaling to {self.journal.path} until it is reachable again")
+            self.next_retry_at = time.monotonic() + self.retry_interval
+            self.spill(batch)
+
+    def spill(self, batch):
+        self.journal.append(batch)
+        self.count('journaled_items', len(batch))
+
+    '''
+    Writes the journal to MongoDB in batches, stops at the first batch that fails and keeps it and
+    everything after it for the next retry. Returns True once the journal is empty
+    '''
+    def replay(self):
+        self.next_retry_at = time.monotonic() + self.retry_interval
+        if not self.is_available():
+            return False
+        replayed = 0
+        with open(self.journal.path, 'r', encoding='utf-8') as f:
+            for lines, documents in self.journal.iter_batches(f, self.batch_size):
+                if not self.write_batch(documents):
+                    self.journal.keep(lines, f)
+                    logging.warning(f"Replayed {replayed} journaled items, MongoDB failed again, keeping the rest in {self.journal.path}")
+                    return False
+                replayed += len(documents)
+                self.count('replayed_items', len(documents))
+        self.journal.clear()
+        logging.info(f"Replayed {replayed} journaled items into MongoDB, the write journal is empty")
+        return True
+
+    def count(self, name, value):
+        if self.on_event is not None:
+            self.on_event(name, value)
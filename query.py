@@ -1,10 +1,22 @@
+import argparse
 import csv
+import gzip
+import importlib
+import io
 import logging
-from datetime import datetime
+import multiprocessing
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
 import json
 
+from bson import json_util
+from dateutil import parser as date_parser
+
 try:
-    from infra.mongodb_connector import find_item, get_db, close_mongo_connection
+    from infra.mongodb_connector import iter_items, get_db, close_mongo_connection
 except ImportError:
     logging.error("Could not import from 'infra' module. Ensure it's in the Python path.")
     exit(1)
@@ -12,6 +24,15 @@ except ImportError:
 # Configuration
 MONGO_COLLECTION_NAME = 'testing_jobs'
 OUTPUT_CSV_FILE = 'final_jobs.csv'
+# documents the server returns per cursor round trip
+DEFAULT_BATCH_SIZE = 1000
+# seconds between two rows/s progress reports
+DEFAULT_PROGRESS_INTERVAL = 10.0
+# bytes copied at a time when merging the part files of a parallel export
+MERGE_BUFFER_SIZE = 1024 * 1024
+# write buffer of the CSV file and rows joined into one write
+CSV_WRITE_BUFFER_SIZE = 1024 * 1024
+CSV_ROWS_PER_WRITE = 1000
 
 CSV_FIELDNAMES = [
     'req_id',
@@ -37,6 +58,14 @@ CSV_FIELDNAMES = [
     'description'
 ]
 
+# the columnar and JSONL formats keep the nested fields as well
+COLUMNAR_FIELDNAMES = CSV_FIELDNAMES + ['categories', 'meta_data']
+# rows per Parquet row group / Arrow record batch
+ROW_GROUP_SIZE = 50000
+ZSTD_LEVEL = 3
+# where the incremental export keeps the last exported _id / update_date
+DEFAULT_STATE_FILE = '.export_watermark.json'
+
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 """
@@ -57,57 +86,702 @@ def format_value_for_csv(value):
     else:
         return str(value)
 
+def join_csv_list(value):
+    return "|".join([str(item) for item in value if item is not None])
+
+def empty_csv_value(value):
+    return ""
+
+"""
+    Converter of a value type to its CSV text (the same text as format_value_for_csv) and whether
+    the text can hold a delimiter, quote or line break. The converter is None for strings.
+"""
+def csv_converter(value_type):
+    if value_type is str:
+        return None, True
+    if value_type is type(None):
+        return empty_csv_value, False
+    if issubclass(value_type, bool):
+        return format_value_for_csv, False
+    if issubclass(value_type, (int, float)):
+        # repr is what csv.writer writes for floats, the shortest text that round trips
+        return value_type.__repr__ if issubclass(value_type, float) else value_type.__str__, False
+    if issubclass(value_type, datetime):
+        return value_type.isoformat, False
+    if issubclass(value_type, list):
+        return join_csv_list, True
+    return format_value_for_csv, True
+
+"""
+    Writes one exported document per call to an output file.
+    Subclasses define the file extension, the exported fields and how a document is encoded.
+    concatenable writers produce files that stay valid when parts are appended byte for byte,
+    the header (if any) is written by the merge step only.
+    appendable writers can add rows to an existing file (append=True).
+"""
+class JobWriter:
+    extension = ''
+    fieldnames = CSV_FIELDNAMES
+    concatenable = False
+    appendable = False
+
+    def __init__(self, path, write_header=True, append=False):
+        self.path = path
+        self.write_header = write_header
+        self.append = append
+
+    @classmethod
+    def header_bytes(cls):
+        return b''
+
+    def write(self, job_doc):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+"""
+    Flat CSV rows, lists joined with | and dicts dumped as JSON (the default format).
+    The rows are the bytes csv.writer writes (minimal quoting, \r\n line ends), but encoded with
+    str.join: csv.writer checks every character for quoting, which dominated the export with
+    descriptions of a few KB. The converters and the fields that may need quoting are worked out
+    once per combination of value types (documents of a collection mostly share a few), and
+    CSV_ROWS_PER_WRITE rows are written at a time through a CSV_WRITE_BUFFER_SIZE buffer.
+"""
+class CsvJobWriter(JobWriter):
+    extension = '.csv'
+    concatenable = True
+    appendable = True
+
+    def __init__(self, path, write_header=True, append=False):
+        super().__init__(path, write_header, append)
+        # appending to an existing file must not repeat the header
+        if append and os.path.exists(path) and os.path.getsize(path) > 0:
+            write_header = False
+        self.file = open(path, 'a' if append else 'w', newline='', encoding='utf-8', buffering=CSV_WRITE_BUFFER_SIZE)
+        if write_header:
+            csv.writer(self.file).writerow(self.fieldnames)
+        # (converters, quoted field indexes) per tuple of value types
+        self.plans = {}
+        self.lines = []
+
+    @classmethod
+    def header_bytes(cls):
+        header = io.StringIO()
+        csv.writer(header).writerow(cls.fieldnames)
+        return header.getvalue().encode('utf-8')
+
+    def write(self, job_doc):
+        row = list(map(job_doc.get, self.fieldnames))
+        value_types = tuple(map(type, row))
+        plan = self.plans.get(value_types)
+        if plan is None:
+            plan = self.plans[value_types] = self.compile_plan(value_types)
+        converters, quoted = plan
+        for index, convert in converters:
+            row[index] = convert(row[index])
+        for index in quoted:
+            value = row[index]
+            if ',' in value or '"' in value or '\n' in value or '\r' in value:
+                row[index] = '"' + value.replace('"', '""') + '"'
+        self.lines.append(','.join(row))
+        if len(self.lines) >= CSV_ROWS_PER_WRITE:
+            self.flush_lines()
+
+    def compile_plan(self, value_types):
+        converters = []
+        quoted = []
+        for index, value_type in enumerate(value_types):
+            convert, may_need_quotes = csv_converter(value_type)
+            if convert is not None:
+                converters.append((index, convert))
+            if may_need_quotes:
+                quoted.append(index)
+        return tuple(converters), tuple(quoted)
+
+    def flush_lines(self):
+        if self.lines:
+            self.lines.append('')
+            self.file.write('\r\n'.join(self.lines))
+            self.lines = []
+
+    def close(self):
+        try:
+            self.flush_lines()
+        finally:
+            self.file.close()
+
+"""
+    One JSON document per line with the nested fields kept as they are, compressed on the fly.
+"""
+class JsonLinesJobWriter(JobWriter):
+    fieldnames = COLUMNAR_FIELDNAMES
+    # gzip members and zstd frames can be concatenated into one valid stream
+    concatenable = True
+    appendable = True
+
+    def open_binary(self, path, mode):
+        raise NotImplementedError
+
+    def __init__(self, path, write_header=True, append=False):
+        super().__init__(path, write_header, append)
+        self.file = io.TextIOWrapper(self.open_binary(path, 'ab' if append else 'wb'), encoding='utf-8')
+
+    def write(self, job_doc):
+        record = {field: job_doc.get(field) for field in self.fieldnames}
+        self.file.write(json.dumps(record, default=json_default, ensure_ascii=False))
+        self.file.write('\n')
+
+    def close(self):
+        self.file.close()
+
+class GzipJsonLinesJobWriter(JsonLinesJobWriter):
+    extension = '.jsonl.gz'
+
+    def open_binary(self, path, mode):
+        return gzip.open(path, mode, compresslevel=6)
+
+class ZstdJsonLinesJobWriter(JsonLinesJobWriter):
+    extension = '.jsonl.zst'
+
+    def open_binary(self, path, mode):
+        zstandard = import_optional('zstandard', 'jsonl.zst')
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(open(path, mode), closefd=True)
+
+"""
+    Base of the Arrow based writers: buffers ROW_GROUP_SIZE documents and converts them
+    into one typed record batch (lists stay lists, categories a list of structs,
+    meta_data a string map, dates timestamps).
+"""
+class ArrowJobWriter(JobWriter):
+    fieldnames = COLUMNAR_FIELDNAMES
+
+    def __init__(self, path, write_header=True, append=False, row_group_size=None):
+        super().__init__(path, write_header, append)
+        self.pa = import_optional('pyarrow', self.extension.lstrip('.'))
+        self.schema = arrow_schema(self.pa)
+        self.row_group_size = row_group_size or ROW_GROUP_SIZE
+        self.columns = {field: [] for field in self.fieldnames}
+        self.buffered = 0
+
+    def write(self, job_doc):
+        for field in self.fieldnames:
+            self.columns[field].append(to_arrow_value(field, job_doc.get(field)))
+        self.buffered += 1
+        if self.buffered >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        if not self.buffered:
+            return
+        batch = self.pa.RecordBatch.from_pydict(self.columns, schema=self.schema)
+        self.write_batch(batch)
+        self.columns = {field: [] for field in self.fieldnames}
+        self.buffered = 0
+
+    def write_batch(self, batch):
+        raise NotImplementedError
+
+class ParquetJobWriter(ArrowJobWriter):
+    extension = '.parquet'
+
+    def __init__(self, path, write_header=True, append=False, row_group_size=None):
+        super().__init__(path, write_header, append, row_group_size)
+        parquet = import_optional('pyarrow.parquet', 'parquet')
+        self.writer = parquet.ParquetWriter(path, self.schema, compression='zstd')
+
+    def write_batch(self, batch):
+        self.writer.write_batch(batch, row_group_size=self.row_group_size)
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+
+class ArrowIpcJobWriter(ArrowJobWriter):
+    extension = '.arrow'
+
+    def __init__(self, path, write_header=True, append=False, row_group_size=None):
+        super().__init__(path, write_header, append, row_group_size)
+        options = self.pa.ipc.IpcWriteOptions(compression='zstd')
+        self.sink = self.pa.OSFile(path, 'wb')
+        self.writer = self.pa.ipc.new_file(self.sink, self.schema, options=options)
+
+    def write_batch(self, batch):
+        self.writer.write_batch(batch)
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+        self.sink.close()
+
+OUTPUT_FORMATS = {
+    'csv': CsvJobWriter,
+    'parquet': ParquetJobWriter,
+    'arrow': ArrowIpcJobWriter,
+    'jsonl.gz': GzipJsonLinesJobWriter,
+    'jsonl.zst': ZstdJsonLinesJobWriter,
+}
+
+"""
+    Imports an optional dependency of an output format, with a hint when it is missing.
+"""
+def import_optional(module_name, output_format):
+    try:
+        return importlib.import_module(module_name)
+    except ImportError:
+        raise ImportError(f"The '{output_format}' output format requires '{module_name.split('.')[0]}', install it with pip.")
+
+"""
+    json.dumps fallback for the BSON values (dates, ObjectIds) of exported documents.
+"""
+def json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+"""
+    Arrow schema of the columnar exports.
+"""
+def arrow_schema(pa):
+    types = {
+        'languages': pa.list_(pa.string()),
+        'tags': pa.list_(pa.string()),
+        'latitude': pa.float64(),
+        'longitude': pa.float64(),
+        'update_date': pa.timestamp('us', tz='UTC'),
+        'create_date': pa.timestamp('us', tz='UTC'),
+        'categories': pa.list_(pa.struct([('name', pa.string())])),
+        'meta_data': pa.map_(pa.string(), pa.string()),
+    }
+    return pa.schema([(field, types.get(field, pa.string())) for field in COLUMNAR_FIELDNAMES])
+
+ARROW_LIST_FIELDS = {'languages', 'tags', 'categories'}
+
+"""
+    Converts a stored value to the Arrow type of its column.
+    Scalar fields stored as one element loader lists are unwrapped first.
+"""
+def to_arrow_value(field, value):
+    if value is None:
+        return None
+    if field in ARROW_LIST_FIELDS:
+        if not isinstance(value, list):
+            value = [value]
+        if field == 'categories':
+            return [item if isinstance(item, dict) else {'name': str(item)} for item in value]
+        return [str(item) for item in value if item is not None]
+    if isinstance(value, list):
+        if not value:
+            return None
+        value = value[0] if len(value) == 1 else value
+    if field in ('latitude', 'longitude'):
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return None
+    if field in ('update_date', 'create_date'):
+        return to_datetime(value)
+    if field == 'meta_data':
+        if not isinstance(value, dict):
+            return None
+        return [(str(key), item if isinstance(item, str) else json.dumps(item, default=json_default))
+                for key, item in value.items()]
+    if isinstance(value, (list, dict)):
+        return json.dumps(value, default=json_default)
+    return str(value)
+
+"""
+    Parses the ISO 8601 dates of the feeds (e.g. 2024-02-02T06:06:02+0000), datetimes pass through.
+"""
+def to_datetime(value):
+    if isinstance(value, datetime):
+        return value
+    try:
+        return datetime.strptime(str(value), '%Y-%m-%dT%H:%M:%S%z')
+    except ValueError:
+        try:
+            return date_parser.isoparse(str(value))
+        except (TypeError, ValueError):
+            return None
+
+"""
+    Writes the documents of the cursor with the given writer and returns the number written.
+    Logs the rows/s every progress_interval seconds, label tells the shards of a parallel export apart.
+"""
+def write_rows(cursor, writer, progress_interval=DEFAULT_PROGRESS_INTERVAL, label="Exported"):
+    exported = 0
+    started_at = time.monotonic()
+    last_report = started_at
+    for job_doc in cursor:
+        writer.write(job_doc)
+        exported += 1
+
+        now = time.monotonic()
+        if now - last_report >= progress_interval:
+            logging.info(f"{label} {exported} jobs so far ({exported / (now - started_at):.0f} rows/s)")
+            last_report = now
+    return exported
+
+"""
+    Projection limiting the exported documents to the fields of the output format.
+"""
+def export_projection(fieldnames=CSV_FIELDNAMES):
+    projection = {field: 1 for field in fieldnames}
+    projection['_id'] = 0
+    return projection
+
+"""
+    Default output file name of a format, e.g. final_jobs.parquet
+"""
+def default_output_file(output_format):
+    return os.path.splitext(OUTPUT_CSV_FILE)[0] + OUTPUT_FORMATS[output_format].extension
+
 """
-    Fetches job data from MongoDB and exports selected fields to a CSV file.
+    Streams job data from MongoDB and exports selected fields to a CSV file.
+    Rows are written as the cursor returns them, so memory stays flat whatever the collection size.
 """
-def export_jobs_to_csv():
+def export_jobs_to_csv(output_file=OUTPUT_CSV_FILE, batch_size=DEFAULT_BATCH_SIZE, progress_interval=DEFAULT_PROGRESS_INTERVAL):
+    export_jobs(output_file=output_file, output_format='csv', batch_size=batch_size, progress_interval=progress_interval)
+
+"""
+    Streams job data from MongoDB into an output file of the given format (see OUTPUT_FORMATS).
+"""
+def export_jobs(output_file=None, output_format='csv', batch_size=DEFAULT_BATCH_SIZE, progress_interval=DEFAULT_PROGRESS_INTERVAL):
 
     logging.info("Starting job export process...")
+    writer_class = OUTPUT_FORMATS[output_format]
+    output_file = output_file or default_output_file(output_format)
 
     db = get_db()
     if db is None:
         logging.error("Failed to connect to MongoDB. Aborting export.")
         return
 
-    logging.info(f"Fetching all items from MongoDB collection: '{MONGO_COLLECTION_NAME}'")
+    logging.info(f"Streaming items from MongoDB collection: '{MONGO_COLLECTION_NAME}' (batch size {batch_size})")
+    cursor = iter_items(query={}, collection_name=MONGO_COLLECTION_NAME, projection=export_projection(writer_class.fieldnames), batch_size=batch_size)
+    if cursor is None:
+        logging.error("An error occurred while querying MongoDB. Aborting export.")
+        close_mongo_connection()
+        return
+
+    stream_to_file(cursor, output_file, output_format, progress_interval=progress_interval)
+
+    close_mongo_connection()
+    logging.info("MongoDB connection closed.")
+
+"""
+    Writes every document of the cursor to output_file and closes the cursor.
+    Returns the number of exported documents, None if the export failed.
+"""
+def stream_to_file(cursor, output_file, output_format, progress_interval=DEFAULT_PROGRESS_INTERVAL, append=False):
+    writer_class = OUTPUT_FORMATS[output_format]
+    logging.info(f"{'Appending' if append else 'Exporting'} to {output_format} file: {output_file}")
+    exported = None
+    started_at = time.monotonic()
     try:
-        cursor = find_item(query={}, collection_name=MONGO_COLLECTION_NAME)
-        all_jobs = list(cursor)
+        writer = writer_class(output_file, append=append)
+        try:
+            exported = write_rows(cursor, writer, progress_interval=progress_interval)
+        finally:
+            writer.close()
+
+        elapsed = time.monotonic() - started_at
+        if exported == 0:
+            logging.warning(f"No jobs found in collection '{MONGO_COLLECTION_NAME}'. Created {output_file} without rows.")
+        logging.info(f"Successfully exported {exported} jobs to {output_file} in {elapsed:.1f}s ({exported / elapsed if elapsed else 0:.0f} rows/s)")
+
+    except IOError as e:
+        exported = None
+        logging.error(f"Error writing to {output_format} file {output_file}: {e}")
     except Exception as e:
-        logging.error(f"An error occurred while fetching data from MongoDB: {e}", exc_info=True)
-        close_mongo_connection()
+        exported = None
+        logging.error(f"An unexpected error occurred during {output_format} export: {e}", exc_info=True)
+    finally:
+        cursor.close()
+    return exported
+
+"""
+    Reads the watermark saved by the last incremental export, None if there is none yet.
+    The state is stored as MongoDB extended JSON so ObjectIds and dates survive the round trip.
+"""
+def load_watermark(state_file, watermark_field):
+    if not os.path.exists(state_file):
+        return None
+    try:
+        with open(state_file, 'r', encoding='utf-8') as f:
+            state = json_util.loads(f.read())
+    except (IOError, ValueError) as e:
+        logging.error(f"Could not read the export watermark {state_file}: {e}")
+        raise
+    if state.get('field') != watermark_field:
+        raise ValueError(f"Watermark in {state_file} is on '{state.get('field')}', not '{watermark_field}'. Use another --state-file or remove it")
+    return state
+
+"""
+    Saves the (field value, _id) of the last exported document, written to a temporary
+    file first so a crash never leaves a half written watermark behind.
+"""
+def save_watermark(state_file, watermark_field, last_doc):
+    state = {
+        'field': watermark_field,
+        'value': last_doc.get(watermark_field),
+        '_id': last_doc.get('_id'),
+        'saved_at': datetime.now(timezone.utc),
+    }
+    tmp_file = f"{state_file}.tmp"
+    with open(tmp_file, 'w', encoding='utf-8') as f:
+        f.write(json_util.dumps(state))
+    os.replace(tmp_file, state_file)
+
+"""
+    Query and sort selecting the documents after the watermark, in watermark order.
+    update_date is not unique, so ties are broken on _id.
+"""
+def watermark_query(watermark_field, watermark):
+    if watermark_field == '_id':
+        query = {'_id': {'$gt': watermark['_id']}} if watermark else {}
+        return query, [('_id', 1)]
+    sort = [(watermark_field, 1), ('_id', 1)]
+    if not watermark:
+        return {}, sort
+    query = {'$or': [
+        {watermark_field: {'$gt': watermark['value']}},
+        {watermark_field: watermark['value'], '_id': {'$gt': watermark['_id']}},
+    ]}
+    return query, sort
+
+"""
+    Passes the documents of a cursor through and remembers the last one.
+"""
+class LastDocumentTracker:
+    def __init__(self, cursor):
+        self.cursor = cursor
+        self.last_doc = None
+
+    def __iter__(self):
+        for job_doc in self.cursor:
+            self.last_doc = job_doc
+            yield job_doc
+
+    def close(self):
+        self.cursor.close()
+
+"""
+    Exports only the documents added (watermark on _id) or updated (watermark on update_date)
+    since the last incremental run, using an index on the watermark field.
+    The delta is appended to output_file or written to its own timestamped delta file.
+    The watermark is only moved forward once the output file was written successfully.
+"""
+def export_jobs_incremental(output_file=None, output_format='csv', watermark_field='_id', state_file=DEFAULT_STATE_FILE,
+                            incremental_output='delta', batch_size=DEFAULT_BATCH_SIZE, progress_interval=DEFAULT_PROGRESS_INTERVAL):
+
+    logging.info(f"Starting incremental job export process on '{watermark_field}'...")
+    writer_class = OUTPUT_FORMATS[output_format]
+    output_file = output_file or default_output_file(output_format)
+    append = incremental_output == 'append'
+    if append and not writer_class.appendable:
+        logging.error(f"{output_format} files cannot be appended to, use --incremental-output delta. Aborting export.")
         return
+    if not append:
+        extension = writer_class.extension
+        base = output_file[:-len(extension)] if output_file.endswith(extension) else os.path.splitext(output_file)[0]
+        output_file = f"{base}.delta-{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')}{extension}"
 
-    if not all_jobs:
-        logging.warning(f"No jobs found in collection '{MONGO_COLLECTION_NAME}'. Creating CSV with headers only.")
+    try:
+        watermark = load_watermark(state_file, watermark_field)
+    except (IOError, ValueError) as e:
+        logging.error(f"{e}. Aborting export.")
+        return
+    if watermark:
+        logging.info(f"Exporting documents after {watermark_field} {watermark.get('value')} (_id {watermark.get('_id')})")
     else:
-         logging.info(f"Retrieved {len(all_jobs)} jobs from MongoDB.")
+        logging.info(f"No watermark in {state_file}, exporting the whole collection")
 
-    logging.info(f"Exporting to CSV file: {OUTPUT_CSV_FILE}")
+    db = get_db()
+    if db is None:
+        logging.error("Failed to connect to MongoDB. Aborting export.")
+        return
+
+    # the update_date watermark runs on the (update_date, _id) index of infra/job_queries.py
+    query, sort = watermark_query(watermark_field, watermark)
+    projection = export_projection(writer_class.fieldnames)
+    projection['_id'] = 1
+    projection[watermark_field] = 1
+    cursor = iter_items(query=query, collection_name=MONGO_COLLECTION_NAME, projection=projection, batch_size=batch_size, sort=sort)
+    if cursor is None:
+        logging.error("An error occurred while querying MongoDB. Aborting export.")
+        close_mongo_connection()
+        return
+
+    tracker = LastDocumentTracker(cursor)
+    # size to truncate an appended file back to when the export fails, the appendable formats
+    # are concatenations of rows or of compressed frames so the file stays valid
+    previous_size = os.path.getsize(output_file) if append and os.path.exists(output_file) else 0
+    exported = stream_to_file(tracker, output_file, output_format, progress_interval=progress_interval, append=append)
+    if exported and tracker.last_doc is not None:
+        save_watermark(state_file, watermark_field, tracker.last_doc)
+        logging.info(f"Saved watermark {watermark_field} {tracker.last_doc.get(watermark_field)} to {state_file}")
+    elif exported == 0 and not append:
+        os.remove(output_file)
+        logging.info(f"No new documents since the last export, removed the empty {output_file}")
+    elif exported is None and os.path.exists(output_file):
+        # the watermark was not moved, the next run exports these documents again
+        if append and previous_size:
+            with open(output_file, 'r+b') as f:
+                f.truncate(previous_size)
+            logging.info(f"Truncated {output_file} back to its {previous_size} bytes before the failed export")
+        else:
+            os.remove(output_file)
+            logging.info(f"Removed the partial {'output' if append else 'delta'} file {output_file}")
+
+    close_mongo_connection()
+    logging.info("MongoDB connection closed.")
+
+
+"""
+    Splits the collection into `shards` contiguous _id ranges of about the same size.
+    The boundaries are read from the _id index, returns a list of (lower, upper) bounds
+    where None means unbounded.
+"""
+def compute_id_ranges(db, shards):
+    collection = db[MONGO_COLLECTION_NAME]
+    total = collection.estimated_document_count()
+    boundaries = []
+    for shard in range(1, shards):
+        boundary = list(collection.find({}, {'_id': 1}).sort('_id', 1).skip(shard * total // shards).limit(1))
+        if boundary and (not boundaries or boundary[0]['_id'] > boundaries[-1]):
+            boundaries.append(boundary[0]['_id'])
+    lowers = [None] + boundaries
+    uppers = boundaries + [None]
+    return list(zip(lowers, uppers))
+
+"""
+    Query selecting the documents of one _id range, lower bound included and upper bound excluded.
+"""
+def id_range_query(lower, upper):
+    id_filter = {}
+    if lower is not None:
+        id_filter['$gte'] = lower
+    if upper is not None:
+        id_filter['$lt'] = upper
+    return {'_id': id_filter} if id_filter else {}
+
+"""
+    Worker process entry point of a parallel export: streams one _id range into its own part file.
+    Runs in a spawned process, so it opens its own MongoDB client.
+"""
+def export_id_range(shard, lower, upper, part_file, output_format, batch_size, progress_interval, write_header):
+    writer_class = OUTPUT_FORMATS[output_format]
+    cursor = iter_items(query=id_range_query(lower, upper), collection_name=MONGO_COLLECTION_NAME,
+                        projection=export_projection(writer_class.fieldnames), batch_size=batch_size)
+    if cursor is None:
+        raise RuntimeError(f"Shard {shard}: could not query MongoDB")
     try:
-        with open(OUTPUT_CSV_FILE, 'w', newline='', encoding='utf-8') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=CSV_FIELDNAMES)
+        writer = writer_class(part_file, write_header=write_header)
+        try:
+            exported = write_rows(cursor, writer, progress_interval=progress_interval, label=f"Shard {shard}: exported")
+        finally:
+            writer.close()
+    finally:
+        cursor.close()
+        close_mongo_connection()
+    return exported
 
-            writer.writeheader()
+"""
+    Name of the numbered part file of a shard, e.g. final_jobs.part-003.csv
+"""
+def part_file_name(output_file, output_format, shard):
+    extension = OUTPUT_FORMATS[output_format].extension
+    base = output_file[:-len(extension)] if output_file.endswith(extension) else os.path.splitext(output_file)[0]
+    return f"{base}.part-{shard:03d}{extension}"
 
-            for job_doc in all_jobs:
-                row_data = {}
-                for field in CSV_FIELDNAMES:
-                    raw_value = job_doc.get(field, None)
-                    row_data[field] = format_value_for_csv(raw_value)
+"""
+    Exports the collection with one worker process per _id range.
+    With merge the part files are concatenated, in _id order, into output_file and removed,
+    otherwise every part file is kept and is a complete file on its own.
+    Parquet and Arrow files cannot be concatenated, their parts are always kept.
+"""
+def export_jobs_parallel(output_file=None, output_format='csv', workers=2, batch_size=DEFAULT_BATCH_SIZE,
+                         progress_interval=DEFAULT_PROGRESS_INTERVAL, merge=True):
 
-                writer.writerow(row_data)
+    logging.info(f"Starting parallel job export process with {workers} workers...")
+    writer_class = OUTPUT_FORMATS[output_format]
+    output_file = output_file or default_output_file(output_format)
+    if merge and not writer_class.concatenable:
+        logging.info(f"{output_format} files cannot be concatenated, keeping the part files")
+        merge = False
+
+    db = get_db()
+    if db is None:
+        logging.error("Failed to connect to MongoDB. Aborting export.")
+        return
 
-        logging.info(f"Successfully exported {len(all_jobs)} jobs to {OUTPUT_CSV_FILE}")
+    ranges = compute_id_ranges(db, workers)
+    # the workers open their own clients, the parent one is not needed while they run
+    close_mongo_connection()
+    part_files = [part_file_name(output_file, output_format, shard) for shard in range(len(ranges))]
+    logging.info(f"Split collection '{MONGO_COLLECTION_NAME}' into {len(ranges)} _id ranges")
+
+    started_at = time.monotonic()
+    exported = 0
+    try:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            futures = [
+                executor.submit(export_id_range, shard, lower, upper, part_files[shard], output_format,
+                                batch_size, progress_interval, not merge)
+                for shard, (lower, upper) in enumerate(ranges)
+            ]
+            for future in futures:
+                exported += future.result()
+
+        if merge:
+            with open(output_file, 'wb') as output:
+                output.write(writer_class.header_bytes())
+                for part_file in part_files:
+                    with open(part_file, 'rb') as part:
+                        shutil.copyfileobj(part, output, MERGE_BUFFER_SIZE)
+                    os.remove(part_file)
+            written_to = output_file
+        else:
+            written_to = ", ".join(part_files)
+
+        elapsed = time.monotonic() - started_at
+        logging.info(f"Successfully exported {exported} jobs to {written_to} in {elapsed:.1f}s ({exported / elapsed if elapsed else 0:.0f} rows/s)")
 
     except IOError as e:
-        logging.error(f"Error writing to CSV file {OUTPUT_CSV_FILE}: {e}")
+        logging.error(f"Error writing to {output_format} file {output_file}: {e}")
     except Exception as e:
-        logging.error(f"An unexpected error occurred during CSV export: {e}", exc_info=True)
+        logging.error(f"An unexpected error occurred during parallel {output_format} export: {e}", exc_info=True)
 
-    close_mongo_connection()
-    logging.info("MongoDB connection closed.")
+
+"""
+    Command line options of the export script.
+"""
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Export the jobs stored in MongoDB to a CSV, Parquet, Arrow or compressed JSONL file.")
+    parser.add_argument('-o', '--output', default=None, help=f"output file (default: {OUTPUT_CSV_FILE} with the extension of the format)")
+    parser.add_argument('-f', '--format', default='csv', choices=sorted(OUTPUT_FORMATS), help="output format (default: csv)")
+    parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help=f"documents fetched per cursor round trip (default: {DEFAULT_BATCH_SIZE})")
+    parser.add_argument('--progress-interval', type=float, default=DEFAULT_PROGRESS_INTERVAL, help=f"seconds between progress reports (default: {DEFAULT_PROGRESS_INTERVAL})")
+    parser.add_argument('-w', '--workers', type=int, default=1, help="number of worker processes, each exporting one _id range of the collection (default: 1)")
+    parser.add_argument('--no-merge', action='store_true', help="with --workers, keep the numbered part files instead of merging them into the output file")
+    parser.add_argument('-i', '--incremental', action='store_true', help="only export the documents newer than the watermark saved by the last incremental run")
+    parser.add_argument('--watermark-field', default='_id', choices=['_id', 'update_date'], help="_id picks up new documents, update_date also updated ones (default: _id)")
+    parser.add_argument('--state-file', default=DEFAULT_STATE_FILE, help=f"file holding the watermark of the incremental export (default: {DEFAULT_STATE_FILE})")
+    parser.add_argument('--incremental-output', default='delta', choices=['delta', 'append'], help="write the new documents to a timestamped delta file or append them to the output file (default: delta)")
+    args = parser.parse_args(argv)
+    if args.incremental and args.workers > 1:
+        parser.error("--incremental exports run on a single cursor, drop --workers")
+    return args
 
 
 if __name__ == "__main__":
-    export_jobs_to_csv()
\ No newline at end of file
+    args = parse_args()
+    if args.incremental:
+        export_jobs_incremental(output_file=args.output, output_format=args.format, watermark_field=args.watermark_field, state_file=args.state_file,
+                                incremental_output=args.incremental_output, batch_size=args.batch_size, progress_interval=args.progress_interval)
+    elif args.workers > 1:
+        export_jobs_parallel(output_file=args.output, output_format=args.format, workers=args.workers, batch_size=args.batch_size,
+                             progress_interval=args.progress_interval, merge=not args.no_merge)
+    else:
+        export_jobs(output_file=args.output, output_format=args.format, batch_size=args.batch_size, progress_interval=args.progress_interval)
@@ -0,0 +1,141 @@
+import os
+import sys
+
+import fakeredis
+import mongomock
+import mongomock.collection
+import pytest
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PROJECT_DIR = os.path.join(ROOT_DIR, 'jobs_project')
+sys.path.insert(0, ROOT_DIR)
+sys.path.insert(0, PROJECT_DIR)
+os.environ.setdefault('SCRAPY_SETTINGS_MODULE', 'jobs_project.settings')
+
+# the reactor of settings.TWISTED_REACTOR, installed before anything imports twisted.internet.reactor
+from scrapy.utils.reactor import install_reactor
+install_reactor('twisted.internet.asyncioreactor.AsyncioSelectorReactor')
+
+from infra import async_mongodb_connector, async_redis_connector, mongodb_connector, redis_connector, text_codec
+
+# pymongo >= 4.11 passes sort to UpdateOne, which mongomock does not know about yet (as in benchmarks/crawl_worker.py)
+add_update = mongomock.collection.BulkOperationBuilder.add_update
+def add_update_without_sort(self, *args, sort=None, **kwargs):
+    return add_update(self, *args, **kwargs)
+mongomock.collection.BulkOperationBuilder.add_update = add_update_without_sort
+
+class AdminDatabase:
+    def command(self, *args, **kwargs):
+        return {'ok': 1.0}
+
+class MemoryMongoClient(mongomock.MongoClient):
+    @property
+    def admin(self):
+        return AdminDatabase()
+
+    def close(self):
+        pass
+
+class AsyncAdminDatabase:
+    async def command(self, *args, **kwargs):
+        return {'ok': 1.0}
+
+class AsyncCursor:
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    async def to_list(self, length=None):
+        return list(self.cursor)
+
+class AsyncCollection:
+    """
+        Awaitable front of a mongomock collection, with the AsyncMongoClient methods the async connector uses
+    """
+    def __init__(self, collection):
+        self.collection = collection
+
+    async def insert_one(self, document):
+        return self.collection.insert_one(document)
+
+    async def insert_many(self, documents, ordered=True):
+        return self.collection.insert_many(documents, ordered=ordered)
+
+    async def bulk_write(self, operations, ordered=True):
+        return self.collection.bulk_write(operations, ordered=ordered)
+
+    async def create_index(self, keys, **kwargs):
+        return self.collection.create_index(keys, **kwargs)
+
+    async def create_indexes(self, indexes):
+        return self.collection.create_indexes(indexes)
+
+    def find(self, *args, **kwargs):
+        return AsyncCursor(self.collection.find(*args, **kwargs))
+
+class AsyncDatabase:
+    def __init__(self, database):
+        self.database = database
+
+    def __getitem__(self, collection_name):
+        return AsyncCollection(self.database[collection_name])
+
+class AsyncMemoryMongoClient:
+    def __init__(self, client):
+        self.client = client
+        self.admin = AsyncAdminDatabase()
+
+    def __getitem__(self, db_name):
+        return AsyncDatabase(self.client[db_name])
+
+    async def close(self):
+        pass
+
+'''
+The sync and async Redis connectors on one in memory fakeredis server, yields a client of it
+'''
+@pytest.fixture
+def redis_server(monkeypatch):
+    server = fakeredis.FakeServer()
+    def sync_pool(url, **kwargs):
+        return fakeredis.FakeRedis(server=server, decode_responses=kwargs.get('decode_responses', False)).connection_pool
+    class AsyncConnectionPool:
+        @staticmethod
+        def from_url(url, **kwargs):
+            return fakeredis.FakeAsyncRedis(server=server, decode_responses=kwargs.get('decode_responses', False)).connection_pool
+    monkeypatch.setattr(redis_connector.redis.ConnectionPool, 'from_url', staticmethod(sync_pool))
+    monkeypatch.setattr(redis_connector, 'redis_pool', None)
+    monkeypatch.setattr(redis_connector, 'redis_client', None)
+    monkeypatch.setattr(redis_connector, 'redis_binary_client', None)
+    monkeypatch.setattr(async_redis_connector.aioredis, 'ConnectionPool', AsyncConnectionPool)
+    monkeypatch.setattr(async_redis_connector, 'redis_client', None)
+    monkeypatch.setattr(async_redis_connector, 'windowed_set_script_sha', None)
+    monkeypatch.setattr(async_redis_connector, 'store_if_changed_script_sha', None)
+    yield fakeredis.FakeRedis(server=server, decode_responses=True)
+
+'''
+The sync and async MongoDB connectors on one mongomock client, yields its database
+'''
+@pytest.fixture
+def mongo_db(monkeypatch):
+    client = MemoryMongoClient()
+    monkeypatch.setattr(mongodb_connector, 'MongoClient', lambda *args, **kwargs: client)
+    monkeypatch.setattr(mongodb_connector, 'mongo_client', None)
+    monkeypatch.setattr(mongodb_connector, 'last_health_check', 0.0)
+    monkeypatch.setattr(async_mongodb_connector, 'AsyncMongoClient', lambda *args, **kwargs: AsyncMemoryMongoClient(client))
+    monkeypatch.setattr(async_mongodb_connector, 'mongo_client', None)
+    monkeypatch.setattr(async_mongodb_connector, 'last_health_check', 0.0)
+    monkeypatch.setattr(text_codec, 'dictionaries', {})
+    yield client[mongodb_connector.MONGO_DB_NAME]
+
+'''
+A crawler with the given settings and an opened spider, as the pipelines get it from Scrapy
+'''
+@pytest.fixture
+def make_crawler():
+    from scrapy import Spider
+    from scrapy.utils.test import get_crawler
+    def make(settings=None, spider_name='JobProjectSpider'):
+        crawler = get_crawler(Spider, settings or {})
+        crawler.spider = Spider.from_crawler(crawler, name=spider_name)
+        return crawler
+    return make
@@ -0,0 +1,118 @@
+import asyncio
+
+from redis.exceptions import ConnectionError
+from scrapy.exceptions import DropItem
+
+from infra import async_redis_connector
+from jobs_project.async_pipelines import AsyncMongoDBPipeline, AsyncRedisDeduplicationPipeline
+
+ASYNC_SETTINGS = {
+    'MONGO_COLLECTION': 'jobs',
+    'DUPEFILTER_KEY_FIELD': 'slug',
+    'REDIS_DEDUP_FLUSH_INTERVAL': 0,
+    'MONGO_BATCH_FLUSH_INTERVAL': 0,
+    'MONGO_QUERY_INDEXES': False,
+    'BLOOM_FILTER_ENABLED': False,
+}
+
+'''
+Opens the pipeline, runs process_item for every item concurrently and closes it, all on one event loop
+Returns the item or the exception of each item and the crawler stats
+'''
+def run_pipeline(pipeline_class, make_crawler, items, **settings):
+    crawler = make_crawler({**ASYNC_SETTINGS, **settings})
+    pipeline = pipeline_class.from_crawler(crawler)
+    async def crawl():
+        await pipeline.open_spider()
+        tasks = [asyncio.ensure_future(pipeline.process_item(item)) for item in items]
+        await asyncio.sleep(0)
+        await pipeline.close_spider()
+        return await asyncio.gather(*tasks, return_exceptions=True)
+    return asyncio.run(crawl()), crawler.stats
+
+def test_async_dedup_drops_the_seen_ids(redis_server, make_crawler):
+    redis_server.sadd('JobProjectSpider:seen_ids', 'old')
+    items = [{'slug': 'old'}, {'slug': 'a'}, {'slug': 'a'}, {'slug': 'b'}, {'slug': 'c'}]
+
+    results, stats = run_pipeline(AsyncRedisDeduplicationPipeline, make_crawler, items, REDIS_DEDUP_BATCH_SIZE=2)
+
+    assert [isinstance(result, DropItem) for result in results] == [True, False, True, False, False]
+    assert stats.get_value('redis/new_items') == 3
+    assert stats.get_value('redis/duplicate_items') == 2
+    assert redis_server.smembers('JobProjectSpider:seen_ids') == {'old', 'a', 'b', 'c'}
+    assert async_redis_connector.redis_client is None
+
+def test_async_dedup_on_the_hashed_and_content_storage(redis_server, make_crawler):
+    items = [{'slug': 'a', 'title': 'A'}, {'slug': 'a', 'title': 'A'}, {'slug': 'a', 'title': 'A2'}]
+
+    results, _ = run_pipeline(AsyncRedisDeduplicationPipeline, make_crawler, items, REDIS_DEDUP_BATCH_SIZE=3, REDIS_DEDUP_STORAGE='hashed', MONGO_WRITE_MODE='upsert')
+
+    assert [isinstance(result, DropItem) for result in results] == [False, True, False]
+    assert not redis_server.exists('JobProjectSpider:seen_content')
+    assert redis_server.keys('JobProjectSpider:seen_content:h:*')
+
+def test_async_dedup_keeps_the_items_when_redis_is_down(redis_server, make_crawler, monkeypatch):
+    async def unreachable():
+        return None
+    monkeypatch.setattr(async_redis_connector, 'get_redis_connection', unreachable)
+    items = [{'slug': 'a'}, {'slug': 'a'}]
+
+    results, stats = run_pipeline(AsyncRedisDeduplicationPipeline, make_crawler, items, REDIS_DEDUP_BATCH_SIZE=2)
+
+    assert results == items
+    assert stats.get_value('redis/errors') == 2
+
+def spy_on_close(monkeypatch):
+    closed = []
+    close_client = async_redis_connector.close_client
+    async def recording_close_client(client):
+        closed.append(client)
+        await close_client(client)
+    monkeypatch.setattr(async_redis_connector, 'close_client', recording_close_client)
+    return closed
+
+def test_unhealthy_client_is_closed_and_replaced(redis_server, monkeypatch):
+    closed = spy_on_close(monkeypatch)
+    async def lose_connection():
+        client = await async_redis_connector.get_redis_connection()
+        async def lost(*args, **kwargs):
+            raise ConnectionError('connection lost')
+        monkeypatch.setattr(client.connection_pool, 'get_connection', lost)
+        assert await async_redis_connector.add_many_to_set('ids', ['a']) is None
+        fresh = await async_redis_connector.add_many_to_set('ids', ['a'])
+        await async_redis_connector.close_redis_connection()
+        return client, fresh
+
+    client, fresh = asyncio.run(lose_connection())
+
+    assert closed[0] is client
+    assert fresh == [True]
+    assert len(closed) == 2 and async_redis_connector.redis_client is None
+
+def test_client_that_fails_its_ping_is_closed(redis_server, monkeypatch):
+    closed = spy_on_close(monkeypatch)
+    async def failing_ping(self, **kwargs):
+        raise ConnectionError('refused')
+    monkeypatch.setattr(async_redis_connector.aioredis.Redis, 'ping', failing_ping)
+
+    assert asyncio.run(async_redis_connector.get_redis_connection()) is None
+    assert len(closed) == 1
+
+def test_async_mongo_writes_every_batch(redis_server, mongo_db, make_crawler):
+    items = [{'slug': f'job-{number}'} for number in range(7)] + [{'slug': 'job-0'}]
+
+    results, stats = run_pipeline(AsyncMongoDBPipeline, make_crawler, items, MONGO_BATCH_SIZE=3, MONGO_MAX_INFLIGHT_WRITES=2)
+
+    assert results == items
+    assert mongo_db.jobs.count_documents({}) == 7
+    assert stats.get_value('mongodb/inserted_items') == 7
+    assert stats.get_value('mongodb/duplicate_key_error') == 1
+
+def test_async_mongo_upserts_only_changed_items(redis_server, mongo_db, make_crawler):
+    run_pipeline(AsyncMongoDBPipeline, make_crawler, [{'slug': 'a', 'title': 'A'}, {'slug': 'b', 'title': 'B'}], MONGO_BATCH_SIZE=2, MONGO_WRITE_MODE='upsert')
+
+    _, stats = run_pipeline(AsyncMongoDBPipeline, make_crawler, [{'slug': 'a', 'title': 'A'}, {'slug': 'b', 'title': 'B2'}], MONGO_BATCH_SIZE=2, MONGO_WRITE_MODE='upsert')
+
+    assert stats.get_value('mongodb/unchanged_items') == 1
+    assert stats.get_value('mongodb/updated_items') == 1
+    assert mongo_db.jobs.find_one({'slug': 'b'})['title'] == 'B2'
@@ -0,0 +1,74 @@
+import gzip
+import json
+import os
+import sys
+
+import pytest
+
+BENCHMARK_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks')
+# the benchmark scripts import each other as top level modules
+sys.path.insert(0, BENCHMARK_DIR)
+
+import crawl_worker
+import feeds
+import run_benchmark
+
+def test_same_seed_generates_the_same_feed():
+    first = list(feeds.generate_records(50, duplicate_ratio=0.2, update_ratio=0.2, seed=7))
+
+    assert list(feeds.generate_records(50, duplicate_ratio=0.2, update_ratio=0.2, seed=7)) == first
+    assert list(feeds.generate_records(50, duplicate_ratio=0.2, update_ratio=0.2, seed=8)) != first
+
+def test_duplicates_are_exact_copies_and_updates_keep_the_slug():
+    records = list(feeds.generate_records(400, duplicate_ratio=0.25, update_ratio=0.25, seed=1))
+
+    serialized = [json.dumps(record, sort_keys=True) for record in records]
+    duplicates = len(serialized) - len(set(serialized))
+    slugs = [record['slug'] for record in records]
+    assert 60 < duplicates < 140
+    assert len(set(slugs)) < len(set(serialized))
+    assert all(slug.startswith('bench-1-') for slug in slugs)
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_written_feeds_hold_every_record(tmp_path, compress):
+    paths = feeds.write_feeds(str(tmp_path), 25, files=3, seed=2, compress=compress)
+
+    assert [os.path.basename(path) for path in paths] == [f"bench_{index:03d}.json" + ('.gz' if compress else '') for index in range(3)]
+    records = []
+    for path in paths:
+        with (gzip.open(path, 'rt', encoding='utf-8') if compress else open(path, encoding='utf-8')) as f:
+            records += [job['data'] for job in json.load(f)['jobs']]
+    assert records == list(feeds.generate_records(25, seed=2))
+
+def test_clean_backend_drops_the_collection_and_the_dedup_keys(redis_server, mongo_db):
+    mongo_db.jobs.insert_one({'slug': 'a'})
+    redis_server.sadd('JobProjectSpider:seen_ids', 'a')
+    redis_server.sadd('JobProjectSpider:seen_ids:h:3', 1)
+    redis_server.hset('JobProjectSpider:seen_content', 'a', 'hash')
+    redis_server.hset('JobProjectSpider:seen_content:h:3', 1, 2)
+    redis_server.set('OtherSpider:seen_ids', 'kept')
+
+    crawl_worker.clean_backend('jobs', 'JobProjectSpider')
+
+    assert mongo_db.jobs.count_documents({}) == 0
+    assert redis_server.keys('*') == ['OtherSpider:seen_ids']
+
+def test_latency_summary():
+    summary = crawl_worker.latency_summary([0.003, 0.001, 0.002, 0.004])
+
+    assert summary == {'count': 4, 'p50_ms': 2.5, 'p99_ms': 4.0, 'mean_ms': 2.5, 'max_ms': 4.0}
+    assert crawl_worker.latency_summary([])['p50_ms'] is None
+
+def test_summary_is_the_median_of_the_runs():
+    runs = [{'items_per_sec': rate, 'crawl_seconds': None, 'pipeline_latency': {'p50_ms': rate / 10}} for rate in (100, 300, 200)]
+
+    summary = run_benchmark.summarise(runs)
+
+    assert summary['items_per_sec'] == 200
+    assert summary['crawl_seconds'] is None
+    assert summary['pipeline_latency']['p50_ms'] == 20
+
+def test_settings_overrides_must_be_name_value_pairs():
+    assert run_benchmark.parse_settings(['MONGO_WRITE_MODE=upsert', 'A = b=c']) == {'MONGO_WRITE_MODE': 'upsert', 'A': ' b=c'}
+    with pytest.raises(SystemExit):
+        run_benchmark.parse_settings(['PARSE_WORKERS'])
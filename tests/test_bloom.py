@@ -0,0 +1,105 @@
+import asyncio
+
+import pytest
+from scrapy.exceptions import DropItem
+
+from jobs_project.bloom import BloomFilter
+from jobs_project.pipelines import RedisDeduplicationPipeline
+
+BLOOM_SETTINGS = {
+    'DUPEFILTER_KEY_FIELD': 'slug',
+    'REDIS_DEDUP_BATCH_SIZE': 1,
+    'REDIS_DEDUP_FLUSH_INTERVAL': 0,
+    'BLOOM_FILTER_ENABLED': True,
+    'BLOOM_FILTER_CAPACITY': 1000,
+}
+
+def open_pipeline(make_crawler, **settings):
+    crawler = make_crawler({**BLOOM_SETTINGS, **settings})
+    pipeline = RedisDeduplicationPipeline.from_crawler(crawler)
+    pipeline.open_spider()
+    return pipeline, crawler.stats
+
+def test_added_values_are_always_found():
+    bloom = BloomFilter(1000, 0.01)
+    values = [f'job-{number}' for number in range(1000)]
+    for value in values:
+        bloom.add(value)
+
+    assert all(value in bloom for value in values)
+    assert len(bloom) == 1000
+
+def test_false_positive_rate_stays_near_the_error_rate():
+    bloom = BloomFilter(2000, 0.01)
+    for number in range(2000):
+        bloom.add(f'job-{number}')
+
+    false_positives = sum(f'other-{number}' in bloom for number in range(10000))
+
+    assert false_positives < 10000 * 0.02
+
+def test_saved_filter_loads_with_its_header(tmp_path):
+    path = str(tmp_path / 'bloom.bin')
+    bloom = BloomFilter(100)
+    bloom.add('a')
+
+    assert bloom.save(path, set_key='JobProjectSpider:seen_ids', set_size=1)
+    loaded, header = BloomFilter.load(path)
+
+    assert 'a' in loaded and 'b' not in loaded
+    assert (header['set_key'], header['set_size'], header['count']) == ('JobProjectSpider:seen_ids', 1, 1)
+
+def test_corrupt_filter_file_is_ignored(tmp_path):
+    path = tmp_path / 'bloom.bin'
+    path.write_bytes(b'BLOOM1\n{"capacity": 100}\n')
+
+    assert BloomFilter.load(str(path)) == (None, None)
+    assert BloomFilter.load(str(tmp_path / 'missing.bin')) == (None, None)
+
+def test_filter_is_off_unless_enabled(redis_server, make_crawler):
+    pipeline, _ = open_pipeline(make_crawler, BLOOM_FILTER_ENABLED=False)
+
+    assert pipeline.bloom is None
+
+def test_new_ids_are_counted_once_redis_confirms(redis_server, make_crawler):
+    redis_server.sadd('JobProjectSpider:seen_ids', 'old')
+    pipeline, stats = open_pipeline(make_crawler)
+    assert stats.get_value('bloom/warmed_ids') == 1
+
+    item = {'slug': 'new'}
+    assert asyncio.run(pipeline.process_item(item)) is item
+    with pytest.raises(DropItem):
+        asyncio.run(pipeline.process_item({'slug': 'old'}))
+
+    assert stats.get_value('bloom/definitely_new') == 1
+    assert stats.get_value('bloom/maybe_seen') == 1
+    assert stats.get_value('redis/new_items') == 1
+    assert stats.get_value('redis/duplicate_items') == 1
+    assert redis_server.smembers('JobProjectSpider:seen_ids') == {'old', 'new'}
+
+def test_id_missed_by_the_filter_is_a_false_negative(redis_server, make_crawler):
+    pipeline, stats = open_pipeline(make_crawler)
+    # added behind the back of the warmed filter
+    redis_server.sadd('JobProjectSpider:seen_ids', 'late')
+
+    item = {'slug': 'late'}
+    assert asyncio.run(pipeline.process_item(item)) is item
+
+    assert stats.get_value('bloom/false_negatives') == 1
+    assert stats.get_value('redis/new_items') is None
+
+def test_filter_saved_on_close_is_reused_by_the_next_crawl(redis_server, make_crawler, tmp_path):
+    bloom_path = str(tmp_path / 'bloom.bin')
+    pipeline, _ = open_pipeline(make_crawler, BLOOM_FILTER_PATH=bloom_path)
+    asyncio.run(pipeline.process_item({'slug': 'a'}))
+    pipeline.close_spider()
+
+    pipeline, stats = open_pipeline(make_crawler, BLOOM_FILTER_PATH=bloom_path)
+    assert stats.get_value('bloom/loaded_ids') == 1
+    assert 'a' in pipeline.bloom
+
+    # the set changed since the filter was saved, it is warmed from Redis again
+    redis_server.sadd('JobProjectSpider:seen_ids', 'b')
+    pipeline, stats = open_pipeline(make_crawler, BLOOM_FILTER_PATH=bloom_path)
+    assert stats.get_value('bloom/loaded_ids') is None
+    assert stats.get_value('bloom/warmed_ids') == 2
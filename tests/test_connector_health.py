@@ -0,0 +1,91 @@
+import redis
+from pymongo.errors import ConnectionFailure
+
+from infra import mongodb_connector, redis_connector
+
+class PingCountingAdmin:
+    def __init__(self, client):
+        self.client = client
+
+    def command(self, name):
+        self.client.pings += 1
+        if self.client.down:
+            raise ConnectionFailure('server is down')
+        return {'ok': 1.0}
+
+class PingCountingClient:
+    def __init__(self):
+        self.pings = 0
+        self.down = False
+        self.closed = False
+        self.admin = PingCountingAdmin(self)
+
+    def close(self):
+        self.closed = True
+
+def patch_mongo_client(monkeypatch, interval=30.0):
+    clients = []
+    def new_client(*args, **kwargs):
+        clients.append(PingCountingClient())
+        return clients[-1]
+    monkeypatch.setattr(mongodb_connector, 'MongoClient', new_client)
+    monkeypatch.setattr(mongodb_connector, 'mongo_client', None)
+    monkeypatch.setattr(mongodb_connector, 'last_health_check', 0.0)
+    monkeypatch.setattr(mongodb_connector, 'MONGO_HEALTH_CHECK_INTERVAL', interval)
+    return clients
+
+def test_mongo_client_is_reused_without_a_ping_within_the_interval(monkeypatch):
+    clients = patch_mongo_client(monkeypatch)
+
+    first = mongodb_connector.get_mongo_client()
+    for _ in range(5):
+        assert mongodb_connector.get_mongo_client() is first
+
+    assert len(clients) == 1
+    assert first.pings == 1
+
+def test_mongo_client_is_pinged_again_once_marked_unhealthy(monkeypatch):
+    clients = patch_mongo_client(monkeypatch)
+    first = mongodb_connector.get_mongo_client()
+
+    mongodb_connector.mark_mongo_unhealthy()
+
+    assert mongodb_connector.get_mongo_client() is first
+    assert first.pings == 2
+
+def test_interval_zero_pings_on_every_call(monkeypatch):
+    clients = patch_mongo_client(monkeypatch, interval=0)
+
+    for _ in range(3):
+        mongodb_connector.get_mongo_client()
+
+    assert len(clients) == 1
+    assert clients[0].pings == 3
+
+def test_lost_mongo_client_is_closed_and_replaced(monkeypatch):
+    clients = patch_mongo_client(monkeypatch)
+    first = mongodb_connector.get_mongo_client()
+    first.down = True
+
+    mongodb_connector.mark_mongo_unhealthy()
+    second = mongodb_connector.get_mongo_client()
+
+    assert first.closed
+    assert second is clients[1] and second is not first
+
+def test_redis_client_is_reused(redis_server):
+    client = redis_connector.get_redis_connection()
+
+    assert redis_connector.get_redis_connection() is client
+    assert redis_connector.add_to_set('ids', 'a')
+    assert redis_connector.get_redis_connection() is client
+
+def test_connection_error_drops_the_redis_client(redis_server, monkeypatch):
+    client = redis_connector.get_redis_connection()
+    def lost_connection(*args):
+        raise redis.exceptions.ConnectionError('connection lost')
+    monkeypatch.setattr(client, 'sadd', lost_connection)
+
+    assert redis_connector.add_to_set('ids', 'a') is None
+    assert redis_connector.redis_client is None
+    assert redis_connector.get_redis_connection() is not client
@@ -0,0 +1,65 @@
+import csv
+from datetime import datetime, timezone
+
+import pytest
+from bson import ObjectId
+
+import query
+
+VALUES = [
+    'plain', '', 'a,b', 'say "hi"', 'two\nlines', 'carriage\rreturn', ' padded ',
+    None, 0, -12, 1.5, 0.1 + 0.2, 1e20, float('nan'), True, False,
+    ['a', None, 'b,c'], [], {'key': 'value, "quoted"'},
+    datetime(2024, 5, 1, 12, 30), datetime(2024, 5, 1, tzinfo=timezone.utc), ObjectId('65f000000000000000000001'),
+]
+
+'''
+Documents that cycle every value through every column, so rows mix the value types
+'''
+def make_jobs(count):
+    jobs = []
+    for number in range(count):
+        jobs.append({field: VALUES[(number + index) % len(VALUES)] for index, field in enumerate(query.CSV_FIELDNAMES)})
+    jobs.append({'slug': 'only-a-slug'})
+    return jobs
+
+def write_with_dict_writer(path, jobs):
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.DictWriter(f, fieldnames=query.CSV_FIELDNAMES, extrasaction='ignore')
+        writer.writeheader()
+        for job in jobs:
+            writer.writerow({field: query.format_value_for_csv(job.get(field)) for field in query.CSV_FIELDNAMES})
+
+@pytest.mark.parametrize('rows_per_write', [1, 7, 1000])
+def test_rows_are_the_bytes_of_dict_writer(tmp_path, monkeypatch, rows_per_write):
+    monkeypatch.setattr(query, 'CSV_ROWS_PER_WRITE', rows_per_write)
+    jobs = make_jobs(len(VALUES) * 2)
+    writer = query.CsvJobWriter(str(tmp_path / 'fast.csv'))
+
+    for job in jobs:
+        writer.write(job)
+    writer.close()
+
+    write_with_dict_writer(tmp_path / 'dict_writer.csv', jobs)
+    assert (tmp_path / 'fast.csv').read_bytes() == (tmp_path / 'dict_writer.csv').read_bytes()
+
+@pytest.mark.parametrize('value', VALUES, ids=repr)
+def test_converter_gives_the_text_of_format_value_for_csv(value):
+    convert, may_need_quotes = query.csv_converter(type(value))
+
+    text = value if convert is None else convert(value)
+
+    assert text == query.format_value_for_csv(value)
+    if not may_need_quotes:
+        assert not any(character in text for character in ',"\r\n')
+
+def test_appending_does_not_repeat_the_header(tmp_path):
+    path = str(tmp_path / 'jobs.csv')
+    for slug in ('a', 'b'):
+        writer = query.CsvJobWriter(path, append=True)
+        writer.write({'slug': slug})
+        writer.close()
+
+    with open(path, newline='', encoding='utf-8') as f:
+        rows = list(csv.DictReader(f))
+    assert [row['slug'] for row in rows] == ['a', 'b']
@@ -0,0 +1,72 @@
+import csv
+from datetime import datetime
+
+import query
+
+def seed_jobs(mongo_db, count):
+    jobs = [{
+        'slug': f'job-{number}',
+        'title': f'Engineer, "level" {number}',
+        'languages': ['en', 'de'],
+        'latitude': 52.5 + number,
+        'update_date': datetime(2024, 1, 1 + number),
+        'description': 'first line\nsecond line',
+    } for number in range(count)]
+    mongo_db[query.MONGO_COLLECTION_NAME].insert_many(jobs)
+    return jobs
+
+def read_csv(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        return list(csv.DictReader(f))
+
+def test_every_document_is_exported_as_a_row(mongo_db, tmp_path):
+    jobs = seed_jobs(mongo_db, 5)
+    output_file = tmp_path / 'jobs.csv'
+
+    query.export_jobs_to_csv(output_file=str(output_file), batch_size=2)
+
+    rows = read_csv(output_file)
+    assert [row['slug'] for row in rows] == [job['slug'] for job in jobs]
+    assert list(rows[0]) == query.CSV_FIELDNAMES
+    assert rows[1]['title'] == 'Engineer, "level" 1'
+    assert rows[1]['languages'] == 'en|de'
+    assert rows[1]['latitude'] == '53.5'
+    assert rows[1]['update_date'] == '2024-01-02T00:00:00'
+    assert rows[1]['description'] == 'first line\nsecond line'
+    assert rows[1]['brand'] == ''
+
+def test_cursor_is_read_in_batches_and_closed(mongo_db, tmp_path, monkeypatch):
+    seed_jobs(mongo_db, 3)
+    cursors = []
+    iter_items = query.iter_items
+    def recording_iter_items(**kwargs):
+        cursors.append((kwargs, iter_items(**kwargs)))
+        return cursors[-1][1]
+    monkeypatch.setattr(query, 'iter_items', recording_iter_items)
+
+    query.export_jobs(output_file=str(tmp_path / 'jobs.csv'), batch_size=2)
+
+    (kwargs, cursor), = cursors
+    assert kwargs['batch_size'] == 2
+    assert kwargs['projection'] == query.export_projection()
+    assert cursor.cursor.alive is False
+
+def test_empty_collection_writes_only_the_header(mongo_db, tmp_path):
+    output_file = tmp_path / 'jobs.csv'
+
+    query.export_jobs_to_csv(output_file=str(output_file))
+
+    assert output_file.read_bytes() == query.CsvJobWriter.header_bytes()
+
+def test_failed_cursor_returns_none_and_closes_it(tmp_path):
+    class FailingCursor:
+        closed = False
+        def __iter__(self):
+            yield {'slug': 'a'}
+            raise RuntimeError('cursor lost')
+        def close(self):
+            self.closed = True
+    cursor = FailingCursor()
+
+    assert query.stream_to_file(cursor, str(tmp_path / 'jobs.csv'), 'csv') is None
+    assert cursor.closed
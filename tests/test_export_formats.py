@@ -0,0 +1,97 @@
+import gzip
+import io
+import json
+from datetime import datetime, timezone
+
+import pytest
+
+import query
+
+JOBS = [
+    {
+        'slug': 'job-0',
+        'title': 'Engineer',
+        'languages': ['en', None, 'de'],
+        'tags': 'remote',
+        'latitude': '52.52',
+        'longitude': 13.4,
+        'update_date': '2024-02-02T06:06:02+0000',
+        'create_date': datetime(2024, 1, 1, tzinfo=timezone.utc),
+        'categories': ['IT', {'name': 'Software'}],
+        'meta_data': {'source': 'feed', 'score': 3},
+        'city': ['Berlin'],
+    },
+    {'slug': 'job-1', 'latitude': 'n/a', 'update_date': 'not a date', 'meta_data': 'x', 'city': []},
+]
+
+def write_jobs(output_format, path, jobs=JOBS, **kwargs):
+    writer = query.OUTPUT_FORMATS[output_format](str(path), **kwargs)
+    for job in jobs:
+        writer.write(job)
+    writer.close()
+
+@pytest.mark.parametrize('output_format', ['parquet', 'arrow'])
+def test_columnar_files_keep_typed_columns(output_format, tmp_path):
+    pa = pytest.importorskip('pyarrow')
+    path = tmp_path / f'jobs{query.OUTPUT_FORMATS[output_format].extension}'
+
+    write_jobs(output_format, path, row_group_size=1)
+
+    if output_format == 'parquet':
+        table = pytest.importorskip('pyarrow.parquet').read_table(path)
+    else:
+        table = pa.ipc.open_file(pa.memory_map(str(path))).read_all()
+    assert table.schema == query.arrow_schema(pa)
+    first, second = table.to_pylist()
+    assert first['languages'] == ['en', 'de']
+    assert first['tags'] == ['remote']
+    assert first['latitude'] == 52.52
+    assert first['update_date'] == datetime(2024, 2, 2, 6, 6, 2, tzinfo=timezone.utc)
+    assert first['categories'] == [{'name': 'IT'}, {'name': 'Software'}]
+    assert dict(first['meta_data']) == {'source': 'feed', 'score': '3'}
+    assert first['city'] == 'Berlin'
+    assert second['latitude'] is None and second['update_date'] is None
+    assert second['meta_data'] is None and second['city'] is None
+
+def test_parquet_row_groups(tmp_path):
+    parquet = pytest.importorskip('pyarrow.parquet')
+    path = tmp_path / 'jobs.parquet'
+
+    write_jobs('parquet', path, jobs=[{'slug': f'job-{number}'} for number in range(5)], row_group_size=2)
+
+    assert parquet.ParquetFile(path).metadata.num_row_groups == 3
+
+def read_jsonl(output_format, path):
+    if output_format == 'jsonl.gz':
+        with gzip.open(path, 'rt', encoding='utf-8') as f:
+            return [json.loads(line) for line in f]
+    zstandard = pytest.importorskip('zstandard')
+    with open(path, 'rb') as f:
+        text = zstandard.ZstdDecompressor().stream_reader(f, read_across_frames=True).read().decode('utf-8')
+    return [json.loads(line) for line in io.StringIO(text)]
+
+@pytest.mark.parametrize('output_format', ['jsonl.gz', 'jsonl.zst'])
+def test_jsonl_round_trip_and_append(output_format, tmp_path):
+    if output_format == 'jsonl.zst':
+        pytest.importorskip('zstandard')
+    path = tmp_path / f'jobs{query.OUTPUT_FORMATS[output_format].extension}'
+
+    write_jobs(output_format, path, jobs=JOBS[:1])
+    write_jobs(output_format, path, jobs=JOBS[1:], append=True)
+
+    first, second = read_jsonl(output_format, path)
+    assert list(first) == query.COLUMNAR_FIELDNAMES
+    assert first['create_date'] == '2024-01-01T00:00:00+00:00'
+    assert first['meta_data'] == {'source': 'feed', 'score': 3}
+    assert second['slug'] == 'job-1'
+
+def test_missing_optional_dependency_names_the_package(monkeypatch):
+    import_module = query.importlib.import_module
+    def without_pyarrow(name):
+        if name.startswith('pyarrow'):
+            raise ImportError(name)
+        return import_module(name)
+    monkeypatch.setattr(query.importlib, 'import_module', without_pyarrow)
+
+    with pytest.raises(ImportError, match="'parquet' output format requires 'pyarrow'"):
+        query.import_optional('pyarrow.parquet', 'parquet')
@@ -0,0 +1,109 @@
+import csv
+from datetime import datetime
+
+import query
+
+def insert_jobs(mongo_db, slugs, update_date=datetime(2024, 1, 1)):
+    mongo_db[query.MONGO_COLLECTION_NAME].insert_many([{'slug': slug, 'update_date': update_date} for slug in slugs])
+
+def read_slugs(path):
+    with open(path, newline='', encoding='utf-8') as f:
+        return [row['slug'] for row in csv.DictReader(f)]
+
+'''
+Runs an incremental export into tmp_path, returns the slugs of the delta file it wrote and removes it
+'''
+def export_delta(tmp_path, **kwargs):
+    query.export_jobs_incremental(output_file=str(tmp_path / 'jobs.csv'), state_file=str(tmp_path / 'state.json'), **kwargs)
+    delta_files = list(tmp_path.glob('jobs.delta-*.csv'))
+    if not delta_files:
+        return None
+    (delta_file,) = delta_files
+    slugs = read_slugs(delta_file)
+    delta_file.unlink()
+    return slugs
+
+def test_id_watermark_exports_only_new_documents(mongo_db, tmp_path):
+    insert_jobs(mongo_db, ['a', 'b'])
+    assert export_delta(tmp_path) == ['a', 'b']
+
+    insert_jobs(mongo_db, ['c'])
+    assert export_delta(tmp_path) == ['c']
+
+    state = query.load_watermark(str(tmp_path / 'state.json'), '_id')
+    assert state['_id'] == mongo_db[query.MONGO_COLLECTION_NAME].find_one({'slug': 'c'})['_id']
+
+def test_no_new_documents_leaves_no_delta_file(mongo_db, tmp_path):
+    insert_jobs(mongo_db, ['a'])
+    export_delta(tmp_path)
+
+    assert export_delta(tmp_path) is None
+
+def test_update_date_watermark_picks_up_updates_and_breaks_ties_on_id(mongo_db, tmp_path):
+    insert_jobs(mongo_db, ['a', 'b'], update_date=datetime(2024, 1, 1))
+    assert export_delta(tmp_path, watermark_field='update_date') == ['a', 'b']
+
+    collection = mongo_db[query.MONGO_COLLECTION_NAME]
+    collection.update_one({'slug': 'a'}, {'$set': {'update_date': datetime(2024, 1, 2)}})
+    # same update_date as the watermark, but a later _id
+    insert_jobs(mongo_db, ['c'], update_date=datetime(2024, 1, 1))
+
+    assert export_delta(tmp_path, watermark_field='update_date') == ['c', 'a']
+
+def test_watermark_query():
+    assert query.watermark_query('_id', None) == ({}, [('_id', 1)])
+    assert query.watermark_query('_id', {'_id': 5}) == ({'_id': {'$gt': 5}}, [('_id', 1)])
+    watermark = {'value': datetime(2024, 1, 1), '_id': 5}
+    assert query.watermark_query('update_date', watermark) == ({'$or': [
+        {'update_date': {'$gt': datetime(2024, 1, 1)}},
+        {'update_date': datetime(2024, 1, 1), '_id': {'$gt': 5}},
+    ]}, [('update_date', 1), ('_id', 1)])
+
+def test_watermark_of_another_field_aborts_the_export(mongo_db, tmp_path):
+    insert_jobs(mongo_db, ['a'])
+    export_delta(tmp_path)
+    insert_jobs(mongo_db, ['b'])
+
+    assert export_delta(tmp_path, watermark_field='update_date') is None
+    assert query.load_watermark(str(tmp_path / 'state.json'), '_id')['field'] == '_id'
+
+def test_append_writes_the_header_once(mongo_db, tmp_path):
+    output_file = tmp_path / 'jobs.csv'
+    insert_jobs(mongo_db, ['a'])
+    export_delta(tmp_path, incremental_output='append')
+    insert_jobs(mongo_db, ['b'])
+    export_delta(tmp_path, incremental_output='append')
+
+    assert read_slugs(output_file) == ['a', 'b']
+
+def test_failed_append_truncates_the_file_and_keeps_the_watermark(mongo_db, tmp_path, monkeypatch):
+    output_file = tmp_path / 'jobs.csv'
+    state_file = tmp_path / 'state.json'
+    insert_jobs(mongo_db, ['a'])
+    export_delta(tmp_path, incremental_output='append')
+    size, state = output_file.stat().st_size, state_file.read_bytes()
+    insert_jobs(mongo_db, ['b', 'c'])
+
+    write_rows = query.write_rows
+    def failing_write_rows(cursor, writer, **kwargs):
+        writer.write(next(iter(cursor)))
+        writer.flush_lines()
+        raise IOError('disk full')
+    monkeypatch.setattr(query, 'write_rows', failing_write_rows)
+    export_delta(tmp_path, incremental_output='append')
+
+    assert output_file.stat().st_size == size
+    assert state_file.read_bytes() == state
+
+    monkeypatch.setattr(query, 'write_rows', write_rows)
+    export_delta(tmp_path, incremental_output='append')
+    assert read_slugs(output_file) == ['a', 'b', 'c']
+
+def test_failed_delta_is_removed(mongo_db, tmp_path, monkeypatch):
+    insert_jobs(mongo_db, ['a'])
+    def failing_write_rows(cursor, writer, **kwargs):
+        raise IOError('disk full')
+    monkeypatch.setattr(query, 'write_rows', failing_write_rows)
+
+    assert export_delta(tmp_path) is None
+    assert not (tmp_path / 'state.json').exists()
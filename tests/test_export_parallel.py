@@ -0,0 +1,90 @@
+import csv
+from concurrent.futures import Future
+
+import pytest
+
+import query
+
+class InProcessExecutor:
+    """
+        Runs the submitted shards right away in the test process, the spawned workers of
+        export_jobs_parallel could not reach the in memory MongoDB.
+    """
+    def __init__(self, max_workers=None, mp_context=None):
+        self.max_workers = max_workers
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def submit(self, func, *args):
+        future = Future()
+        future.set_result(func(*args))
+        return future
+
+def seed_jobs(mongo_db, count):
+    mongo_db[query.MONGO_COLLECTION_NAME].insert_many([{'slug': f'job-{number:03d}'} for number in range(count)])
+    return [document['_id'] for document in mongo_db[query.MONGO_COLLECTION_NAME].find({}, {'_id': 1}).sort('_id', 1)]
+
+def test_id_ranges_cover_the_collection_without_overlap(mongo_db):
+    ids = seed_jobs(mongo_db, 10)
+
+    ranges = query.compute_id_ranges(mongo_db, 3)
+
+    assert ranges[0][0] is None and ranges[-1][1] is None
+    assert [upper for _, upper in ranges[:-1]] == [lower for lower, _ in ranges[1:]]
+    collection = mongo_db[query.MONGO_COLLECTION_NAME]
+    shards = [[document['_id'] for document in collection.find(query.id_range_query(lower, upper)).sort('_id', 1)] for lower, upper in ranges]
+    assert sum(shards, []) == ids
+    assert [len(shard) for shard in shards] == [3, 3, 4]
+
+def test_more_shards_than_documents_does_not_repeat_a_boundary(mongo_db):
+    seed_jobs(mongo_db, 2)
+
+    ranges = query.compute_id_ranges(mongo_db, 4)
+
+    boundaries = [upper for _, upper in ranges[:-1]]
+    assert len(boundaries) == len(set(boundaries))
+
+def test_id_range_query_bounds():
+    assert query.id_range_query(None, None) == {}
+    assert query.id_range_query(1, None) == {'_id': {'$gte': 1}}
+    assert query.id_range_query(None, 5) == {'_id': {'$lt': 5}}
+    assert query.id_range_query(1, 5) == {'_id': {'$gte': 1, '$lt': 5}}
+
+@pytest.mark.parametrize('output_file, output_format, expected', [
+    ('final_jobs.csv', 'csv', 'final_jobs.part-002.csv'),
+    ('out/jobs.jsonl.gz', 'jsonl.gz', 'out/jobs.part-002.jsonl.gz'),
+    ('jobs.data', 'parquet', 'jobs.part-002.parquet'),
+])
+def test_part_file_name(output_file, output_format, expected):
+    assert query.part_file_name(output_file, output_format, 2) == expected
+
+def test_merged_export_has_one_header_and_every_row_in_id_order(mongo_db, tmp_path, monkeypatch):
+    seed_jobs(mongo_db, 7)
+    monkeypatch.setattr(query, 'ProcessPoolExecutor', InProcessExecutor)
+    output_file = tmp_path / 'jobs.csv'
+
+    query.export_jobs_parallel(output_file=str(output_file), workers=3)
+
+    with open(output_file, newline='', encoding='utf-8') as f:
+        rows = list(csv.reader(f))
+    assert rows[0] == query.CSV_FIELDNAMES
+    assert [row[1] for row in rows[1:]] == [f'job-{number:03d}' for number in range(7)]
+    assert sorted(path.name for path in tmp_path.iterdir()) == ['jobs.csv']
+
+def test_unmerged_parts_are_complete_files(mongo_db, tmp_path, monkeypatch):
+    seed_jobs(mongo_db, 4)
+    monkeypatch.setattr(query, 'ProcessPoolExecutor', InProcessExecutor)
+
+    query.export_jobs_parallel(output_file=str(tmp_path / 'jobs.csv'), workers=2, merge=False)
+
+    slugs = []
+    for shard in range(2):
+        with open(tmp_path / f'jobs.part-{shard:03d}.csv', newline='', encoding='utf-8') as f:
+            rows = list(csv.reader(f))
+        assert rows[0] == query.CSV_FIELDNAMES
+        slugs += [row[1] for row in rows[1:]]
+    assert slugs == [f'job-{number:03d}' for number in range(4)]
@@ -0,0 +1,104 @@
+import math
+
+import pytest
+
+from infra import geo_queries
+from infra.geo_queries import bounding_box_query, find_jobs_near, haversine_km, radius_query, score_by_distance
+
+BERLIN = (52.52, 13.405)
+PARIS = (48.8566, 2.3522)
+NEW_YORK = (40.7128, -74.006)
+
+class RecordingCollection:
+    """
+        Collection that records the $geoNear pipeline, mongomock does not implement the geo operators
+    """
+    def __init__(self, documents):
+        self.documents = documents
+        self.pipelines = []
+
+    def aggregate(self, pipeline):
+        self.pipelines.append(pipeline)
+        return iter(self.documents)
+
+@pytest.fixture(params=['numpy', 'math'])
+def haversine_backend(request, monkeypatch):
+    if request.param == 'math':
+        monkeypatch.setattr(geo_queries, 'np', None)
+    elif geo_queries.np is None:
+        pytest.skip('numpy is not installed')
+    return request.param
+
+def test_haversine_distances(haversine_backend):
+    distances = haversine_km(0.0, 0.0, [BERLIN[0], 0.0], [BERLIN[1], 1.0])
+    berlin_paris, = haversine_km(*BERLIN, [PARIS[0]], [PARIS[1]])
+
+    # one degree along the equator is a 360th of its circumference
+    assert distances[1] == pytest.approx(2 * math.pi * geo_queries.EARTH_RADIUS_KM / 360)
+    assert berlin_paris == pytest.approx(878, abs=2)
+    assert haversine_km(*BERLIN, [BERLIN[0]], [BERLIN[1]]) == [0.0]
+    assert haversine_km(0.0, 0.0, [0.0], [180.0])[0] == pytest.approx(math.pi * geo_queries.EARTH_RADIUS_KM)
+
+def test_numpy_and_math_give_the_same_distances(monkeypatch):
+    if geo_queries.np is None:
+        pytest.skip('numpy is not installed')
+    latitudes, longitudes = [PARIS[0], NEW_YORK[0], -33.87], [PARIS[1], NEW_YORK[1], 151.21]
+    vectorized = haversine_km(*BERLIN, latitudes, longitudes)
+
+    monkeypatch.setattr(geo_queries, 'np', None)
+
+    assert haversine_km(*BERLIN, latitudes, longitudes) == pytest.approx(vectorized)
+
+def test_candidates_are_ranked_nearest_first(haversine_backend):
+    documents = [
+        {'slug': 'new-york', 'location': {'type': 'Point', 'coordinates': [NEW_YORK[1], NEW_YORK[0]]}},
+        {'slug': 'paris', 'latitude': PARIS[0], 'longitude': PARIS[1]},
+        {'slug': 'berlin', 'location': {'type': 'Point', 'coordinates': [BERLIN[1], BERLIN[0]]}},
+        {'slug': 'nowhere', 'latitude': 'unknown', 'longitude': None},
+    ]
+
+    ranked = score_by_distance(documents, *BERLIN)
+    nearby = score_by_distance(documents, *BERLIN, max_km=1000)
+
+    assert [document['slug'] for _, document in ranked] == ['berlin', 'paris', 'new-york']
+    assert [document['slug'] for _, document in nearby] == ['berlin', 'paris']
+    assert ranked[0][0] == 0.0
+    assert score_by_distance([{'slug': 'nowhere'}], *BERLIN) == []
+
+def test_radius_and_box_queries_use_geojson_order():
+    assert radius_query(13.4, 52.5, geo_queries.EARTH_RADIUS_KM) == {'location': {'$geoWithin': {'$centerSphere': [[13.4, 52.5], 1.0]}}}
+
+    ring = bounding_box_query(13.0, 52.0, 14.0, 53.0)['location']['$geoWithin']['$geometry']['coordinates'][0]
+    assert ring[0] == ring[-1] == [13.0, 52.0]
+    assert [13.0, 53.0] in ring and [14.0, 52.0] in ring
+
+def test_near_search_runs_a_geo_near_in_km(monkeypatch):
+    collection = RecordingCollection([{'slug': 'berlin', 'distance_km': 0.5}])
+    monkeypatch.setattr(geo_queries, 'get_db', lambda: {'jobs': collection})
+
+    documents = find_jobs_near(13.4, 52.5, 25, 'jobs', query={'brand': 'A'}, projection={'slug': 1, '_id': 0}, limit=10)
+
+    assert documents == [{'slug': 'berlin', 'distance_km': 0.5}]
+    geo_near, limit, project = collection.pipelines[0]
+    assert geo_near['$geoNear']['near'] == {'type': 'Point', 'coordinates': [13.4, 52.5]}
+    assert geo_near['$geoNear']['maxDistance'] == 25000
+    assert geo_near['$geoNear']['distanceMultiplier'] == 0.001
+    assert geo_near['$geoNear']['query'] == {'brand': 'A'}
+    assert limit == {'$limit': 10}
+    assert project == {'$project': {'slug': 1, '_id': 0, 'distance_km': 1}}
+
+def test_failed_geo_queries_return_no_jobs(mongo_db):
+    # mongomock rejects $geoWithin, which goes down the same path as a server error
+    assert geo_queries.find_jobs_within(13.4, 52.5, 25, 'jobs') == []
+    assert geo_queries.find_jobs_in_box(13.0, 52.0, 14.0, 53.0, 'jobs') == []
+
+def test_backfill_picks_the_documents_with_valid_numeric_coordinates(mongo_db):
+    mongo_db.jobs.insert_many([
+        {'slug': 'valid', 'latitude': 52.5, 'longitude': 13.4},
+        {'slug': 'text', 'latitude': '52.5', 'longitude': 13.4},
+        {'slug': 'out-of-range', 'latitude': 100, 'longitude': 13.4},
+        {'slug': 'located', 'latitude': 1, 'longitude': 1, 'location': {'type': 'Point', 'coordinates': [1, 1]}},
+    ])
+
+    assert geo_queries.backfill_locations('jobs') == 1
+    assert [document['slug'] for document in mongo_db.jobs.find({'location': {'$exists': True}})] == ['valid', 'located']
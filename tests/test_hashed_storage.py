@@ -0,0 +1,73 @@
+import asyncio
+import types
+
+import pytest
+from scrapy.exceptions import DropItem
+
+from infra import redis_connector
+from jobs_project.pipelines import RedisDeduplicationPipeline
+
+def freeze_time(monkeypatch, now):
+    clock = types.SimpleNamespace(time=lambda: clock.now, now=now)
+    monkeypatch.setattr(redis_connector, 'time', clock)
+    return clock
+
+def test_ids_are_stored_as_integers_in_buckets(redis_server):
+    assert redis_connector.add_many_to_hashed_set('seen', ['a', 'b', 'a'], buckets=4) == [True, True, False]
+
+    for value in ('a', 'b'):
+        member = redis_connector.hashed_member(value)
+        assert redis_server.sismember(f'seen:h:{member % 4}', member)
+    assert redis_connector.hashed_set_size('seen') == 2
+    assert sorted(map(int, redis_connector.scan_hashed_set('seen'))) == sorted(redis_connector.hashed_member(value) for value in ('a', 'b'))
+    assert redis_connector.is_hashed_member('seen', 'a', buckets=4)
+    assert not redis_connector.is_hashed_member('seen', 'c', buckets=4)
+
+def test_hashed_member_is_a_signed_64_bit_integer():
+    member = redis_connector.hashed_member('job-1')
+
+    assert member == redis_connector.hashed_member('job-1')
+    assert -2**63 <= member < 2**63
+
+def test_window_keys_cover_the_current_and_older_windows():
+    keys = redis_connector.hashed_set_keys('seen', 5, buckets=4, expire_seconds=100, expire_windows=4, now=1000)
+
+    assert keys == ['seen:h:40:1', 'seen:h:39:1', 'seen:h:38:1', 'seen:h:37:1', 'seen:h:36:1']
+
+def test_id_is_forgotten_once_its_window_is_out_of_range(redis_server, monkeypatch):
+    clock = freeze_time(monkeypatch, 1000)
+    options = {'buckets': 4, 'expire_seconds': 100, 'expire_windows': 4}
+
+    assert redis_connector.add_to_hashed_set('seen', 'a', **options)
+    key = redis_connector.hashed_set_keys('seen', redis_connector.hashed_member('a'), now=1000, **options)[0]
+    assert 0 < redis_server.ttl(key) <= 125
+
+    # seen for expire_seconds, and not added again to the newer windows
+    clock.now = 1000 + 100
+    assert redis_connector.add_to_hashed_set('seen', 'a', **options) is False
+    assert redis_connector.is_hashed_member('seen', 'a', **options)
+
+    # one window later the first window is not checked anymore
+    clock.now = 1000 + 125
+    assert not redis_connector.is_hashed_member('seen', 'a', **options)
+    assert redis_connector.add_to_hashed_set('seen', 'a', **options) is True
+
+def test_pipeline_deduplicates_on_the_hashed_storage(redis_server, make_crawler):
+    crawler = make_crawler({'DUPEFILTER_KEY_FIELD': 'slug', 'REDIS_DEDUP_STORAGE': 'hashed', 'BLOOM_FILTER_ENABLED': False})
+    pipeline = RedisDeduplicationPipeline.from_crawler(crawler)
+    pipeline.open_spider()
+
+    item = {'slug': 'a'}
+    assert asyncio.run(pipeline.process_item(item)) is item
+    with pytest.raises(DropItem):
+        asyncio.run(pipeline.process_item({'slug': 'a'}))
+
+    assert not redis_server.exists('JobProjectSpider:seen_ids')
+    assert redis_connector.hashed_set_size('JobProjectSpider:seen_ids') == 1
+
+def test_unknown_storage_is_not_configured(redis_server, make_crawler):
+    from scrapy.exceptions import NotConfigured
+    crawler = make_crawler({'DUPEFILTER_KEY_FIELD': 'slug', 'REDIS_DEDUP_STORAGE': 'bitmap'})
+
+    with pytest.raises(NotConfigured):
+        RedisDeduplicationPipeline.from_crawler(crawler)
@@ -0,0 +1,80 @@
+import gzip
+import json
+import multiprocessing
+import queue
+
+from jobs_project.inputs import PARSE_PENDING, discover_input_files, iter_parallel_results, open_data_file, parse_files_worker
+from jobs_project.spiders.json_spider import JobProjectSpider
+
+def write_feed(path, slugs, compress=False):
+    document = json.dumps({'jobs': [{'data': {'slug': slug, 'title': f'Title {slug}'}} for slug in slugs] + ['not a record']})
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if compress:
+        with gzip.open(path, 'wt', encoding='utf-8') as f:
+            f.write(document)
+    else:
+        path.write_text(document, encoding='utf-8')
+    return str(path)
+
+def test_directory_picks_up_json_and_gzip_files(tmp_path):
+    first = write_feed(tmp_path / 'b.json', ['b'])
+    second = write_feed(tmp_path / 'a.json.gz', ['a'], compress=True)
+    (tmp_path / 'notes.txt').write_text('not a feed')
+    write_feed(tmp_path / 'nested' / 'c.json', ['c'])
+
+    assert discover_input_files([str(tmp_path)]) == sorted([first, second])
+
+def test_globs_match_nested_directories_and_are_deduplicated(tmp_path, caplog):
+    top = write_feed(tmp_path / 'a.json', ['a'])
+    nested = write_feed(tmp_path / 'x' / 'y' / 'b.json', ['b'])
+
+    found = discover_input_files([str(tmp_path / '**' / '*.json'), top, str(tmp_path / 'missing-*.json')])
+
+    assert found == sorted([top, nested])
+    assert 'No data files match' in caplog.text
+
+def test_gzip_files_are_read_as_text(tmp_path):
+    path = write_feed(tmp_path / 'a.json.gz', ['a'], compress=True)
+
+    with open_data_file(path) as f:
+        assert json.load(f)['jobs'][0]['data']['slug'] == 'a'
+
+def test_worker_sends_batches_from_the_start_offset(tmp_path):
+    path = write_feed(tmp_path / 'a.json', ['a', 'b', 'c'])
+    tasks, results = queue.Queue(), queue.Queue()
+    for task in ((path, 1), (str(tmp_path / 'missing.json'), 0), None):
+        tasks.put(task)
+
+    parse_files_worker(tasks, results, streaming=True, chunk_size=16, batch_size=2)
+
+    messages = [results.get_nowait() for _ in range(results.qsize())]
+    assert [(kind, file_path) for kind, file_path, _ in messages] == [('batch', path), ('batch', path), ('done', path), ('error', str(tmp_path / 'missing.json'))]
+    records = messages[0][2] + messages[1][2]
+    assert [(index, fields and fields['slug']) for index, fields, _ in records] == [(1, 'b'), (2, 'c'), (3, None)]
+    assert 'non-dictionary' in records[2][2]
+    assert messages[2][2] == 4
+
+def test_parallel_results_cover_every_file(tmp_path):
+    paths = [write_feed(tmp_path / f'{name}.json', [f'{name}-{number}' for number in range(3)]) for name in ('a', 'b', 'c')]
+    context = multiprocessing.get_context('spawn')
+
+    messages = [message for message in iter_parallel_results(context, [(path, 0) for path in paths], 2, True, 64, 2, 4) if message is not PARSE_PENDING]
+
+    assert sorted(file_path for kind, file_path, _ in messages if kind == 'done') == paths
+    slugs = sorted(fields['slug'] for kind, _, batch in messages if kind == 'batch' for _, fields, _ in batch if fields)
+    assert slugs == sorted(f'{name}-{number}' for name in ('a', 'b', 'c') for number in range(3))
+
+def test_parallel_parse_yields_the_items_of_the_sequential_one(tmp_path):
+    from scrapy.utils.test import get_crawler
+    for name in ('a', 'b'):
+        write_feed(tmp_path / f'{name}.json', [f'{name}-{number}' for number in range(3)])
+    def parsed_items(workers):
+        settings = {'INPUT_PATHS': [str(tmp_path)], 'INGEST_MANIFEST_ENABLED': False, 'PARSE_WORKERS': workers, 'PARSE_BATCH_SIZE': 2}
+        crawler = get_crawler(JobProjectSpider, settings)
+        crawler.spider = JobProjectSpider.from_crawler(crawler)
+        return [dict(item) for item in crawler.spider.start_requests() if item is not PARSE_PENDING]
+
+    sequential = parsed_items(0)
+
+    assert [item['slug'] for item in sequential] == ['a-0', 'a-1', 'a-2', 'b-0', 'b-1', 'b-2']
+    assert sorted(parsed_items(2), key=lambda item: item['slug']) == sequential
@@ -0,0 +1,64 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from jobs_project.inputs import normalize_job_entry
+from jobs_project.item_mapper import JobFieldMapper, to_datetime, to_float, to_geo_point
+from jobs_project.items import JobsProjectItem
+
+def test_declared_fields_are_mapped_with_their_coercions():
+    fields = JobFieldMapper(JobsProjectItem).map({
+        'slug': 'job-1',
+        'title': 'Engineer',
+        'latitude': '52.5',
+        'longitude': 13.4,
+        'update_date': '2024-02-02T06:06:02+0000',
+        'tags': ['a', 'b'],
+        'not_declared': 'ignored',
+        'brand': None,
+    })
+
+    assert fields == {
+        'slug': 'job-1',
+        'title': 'Engineer',
+        'latitude': 52.5,
+        'longitude': 13.4,
+        'location': {'type': 'Point', 'coordinates': [13.4, 52.5]},
+        'update_date': datetime(2024, 2, 2, 6, 6, 2, tzinfo=timezone.utc),
+        'tags': ['a', 'b'],
+    }
+    JobsProjectItem(fields)
+
+def test_values_that_do_not_coerce_are_left_out():
+    fields = JobFieldMapper(JobsProjectItem).map({'slug': 'job-1', 'latitude': 'n/a', 'longitude': 1.0, 'create_date': 'yesterday'})
+
+    assert fields == {'slug': 'job-1', 'longitude': 1.0}
+
+@pytest.mark.parametrize('value, expected', [('1.5', 1.5), (2, 2.0), ('x', None), (None, None), ([1], None)])
+def test_to_float(value, expected):
+    assert to_float(value) == expected
+
+@pytest.mark.parametrize('value, expected', [
+    ('2024-02-02T06:06:02+0000', datetime(2024, 2, 2, 6, 6, 2, tzinfo=timezone.utc)),
+    ('2024-02-02T06:06:02+02:00', datetime(2024, 2, 2, 6, 6, 2, tzinfo=timezone(timedelta(hours=2)))),
+    ('2024-02-02', datetime(2024, 2, 2)),
+    (datetime(2024, 1, 1), datetime(2024, 1, 1)),
+    ('not a date', None),
+])
+def test_to_datetime(value, expected):
+    assert to_datetime(value) == expected
+
+@pytest.mark.parametrize('fields', [{'latitude': 1.0}, {'latitude': 91.0, 'longitude': 0.0}, {'latitude': float('nan'), 'longitude': 0.0}])
+def test_no_geo_point_without_valid_coordinates(fields):
+    assert to_geo_point(fields) is None
+
+@pytest.mark.parametrize('job_entry, reason', [
+    ('text', 'non-dictionary'),
+    ({'id': 1}, "without 'data'"),
+    ({'data': ['x']}, "without 'data'"),
+])
+def test_invalid_entries_are_skipped_with_a_reason(job_entry, reason):
+    fields, skip_reason = normalize_job_entry(job_entry)
+
+    assert fields is None
+    assert reason in skip_reason
@@ -0,0 +1,85 @@
+from datetime import datetime
+
+import pytest
+from pymongo import ASCENDING, DESCENDING
+
+from infra import job_queries
+from infra.job_queries import covered_projection, find_jobs_page, iter_jobs, job_filter, with_sort_fields
+
+'''
+Jobs sharing a few update dates, some without one, so the pages break ties on _id and cross the nulls
+'''
+def insert_jobs(mongo_db, count=23):
+    dates = [datetime(2024, 1, day) for day in (1, 2, 3)] + [None]
+    jobs = []
+    for number in range(count):
+        job = {'_id': number, 'slug': f'job-{number}', 'brand': 'A' if number % 2 else 'B'}
+        if dates[number % 4] is not None:
+            job['update_date'] = dates[number % 4]
+        jobs.append(job)
+    mongo_db.jobs.insert_many(jobs)
+
+def sorted_ids(mongo_db, query, sort):
+    return [document['_id'] for document in mongo_db.jobs.find(query).sort(sort)]
+
+def page_ids(query, sort, limit):
+    ids, after, pages = [], None, 0
+    while True:
+        documents, after = find_jobs_page(query, 'jobs', sort=sort, limit=limit, after=after)
+        ids += [document['_id'] for document in documents]
+        pages += 1
+        if after is None:
+            return ids, pages
+
+@pytest.mark.parametrize('sort', [
+    None,
+    [('update_date', ASCENDING), ('_id', ASCENDING)],
+    [('update_date', DESCENDING), ('_id', ASCENDING)],
+])
+@pytest.mark.parametrize('limit', [1, 4, 5, 100])
+def test_pages_follow_the_sort_order_without_gaps_or_repeats(mongo_db, sort, limit):
+    insert_jobs(mongo_db)
+
+    ids, pages = page_ids({}, sort, limit)
+
+    assert ids == sorted_ids(mongo_db, {}, sort or job_queries.DEFAULT_SORT)
+    assert pages == 23 // limit + 1
+
+def test_pages_of_a_filter(mongo_db):
+    insert_jobs(mongo_db)
+
+    ids, _ = page_ids(job_filter(brand='A'), None, 3)
+
+    assert ids == sorted_ids(mongo_db, {'brand': 'A'}, job_queries.DEFAULT_SORT)
+
+def test_sort_fields_are_added_to_an_inclusion_projection(mongo_db):
+    insert_jobs(mongo_db, 3)
+
+    documents, after = find_jobs_page({}, 'jobs', projection={'slug': 1, '_id': 0}, limit=2)
+
+    assert set(documents[0]) == {'slug', 'update_date', '_id'}
+    assert after == (documents[1]['update_date'], documents[1]['_id'])
+    assert with_sort_fields({'description': 0}, job_queries.DEFAULT_SORT) == {'description': 0}
+
+def test_iter_jobs_stops_at_the_limit(mongo_db):
+    insert_jobs(mongo_db)
+
+    assert len(list(iter_jobs({}, 'jobs', page_size=4))) == 23
+    assert [document['_id'] for document in iter_jobs({}, 'jobs', page_size=4, limit=6)] == sorted_ids(mongo_db, {}, job_queries.DEFAULT_SORT)[:6]
+
+def test_unreachable_mongodb_gives_an_empty_last_page(monkeypatch):
+    monkeypatch.setattr(job_queries, 'get_db', lambda: None)
+
+    assert find_jobs_page({}, 'jobs') == ([], None)
+    assert list(iter_jobs({}, 'jobs')) == []
+
+def test_job_filter_leaves_out_none_values():
+    since = datetime(2024, 1, 1)
+
+    assert job_filter() == {}
+    assert job_filter(country_code='US', city='Dallas', updated_since=since) == {'country_code': 'US', 'city': 'Dallas', 'update_date': {'$gte': since}}
+    assert job_filter(updated_before=since) == {'update_date': {'$lt': since}}
+
+def test_covered_projection_drops_the_id():
+    assert covered_projection(['brand', 'update_date']) == {'brand': 1, 'update_date': 1, '_id': 0}
+    assert covered_projection(['_id', 'brand']) == {'_id': 1, 'brand': 1}
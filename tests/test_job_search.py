@@ -0,0 +1,75 @@
+from pymongo import TEXT
+
+from infra import job_search
+from infra.job_queries import JOB_TEXT_INDEX_NAME, JOB_TEXT_LANGUAGE_OVERRIDE, job_index_models
+from infra.job_search import SCORE_FIELD, search_jobs, search_query, search_string
+
+class RecordingCursor:
+    """
+        Collection and cursor in one, records the find, sort, skip and limit of a search (mongomock does not implement $text)
+    """
+    def __init__(self, documents):
+        self.documents = documents
+        self.calls = []
+
+    def find(self, query, projection):
+        self.calls.append(('find', query, projection))
+        return self
+
+    def sort(self, sort):
+        self.calls.append(('sort', sort))
+        return self
+
+    def skip(self, skip):
+        self.calls.append(('skip', skip))
+        return self
+
+    def limit(self, limit):
+        self.calls.append(('limit', limit))
+        return iter(self.documents)
+
+def test_search_string_of_keywords_phrases_and_excluded_terms():
+    assert search_string('parts driver') == 'parts driver'
+    assert search_string(['parts', 'driver'], phrases=['store manager'], exclude=['part-time']) == 'parts driver "store manager" -part-time'
+    # a quote inside a phrase would end it early
+    assert search_string(phrases=['say "hi"']) == '"say  hi "'
+    assert search_string() == ''
+
+def test_search_query_combines_the_text_search_with_the_filters():
+    assert search_query('driver') == {'$text': {'$search': 'driver'}}
+    assert search_query('driver', country_code=['US', 'CA'], employment_type='FULL_TIME') == {'$and': [
+        {'country_code': {'$in': ['US', 'CA']}, 'employment_type': 'FULL_TIME'},
+        {'$text': {'$search': 'driver'}},
+    ]}
+
+def test_results_are_sorted_by_text_score(monkeypatch):
+    cursor = RecordingCursor([{'title': 'Driver', SCORE_FIELD: 1.5}])
+    monkeypatch.setattr(job_search, 'get_db', lambda: {'jobs': cursor})
+
+    documents = search_jobs('driver', 'jobs', projection={'title': 1}, limit=5, skip=10)
+
+    assert documents == [{'title': 'Driver', SCORE_FIELD: 1.5}]
+    assert cursor.calls == [
+        ('find', {'$text': {'$search': 'driver'}}, {'title': 1, SCORE_FIELD: {'$meta': 'textScore'}}),
+        ('sort', [(SCORE_FIELD, {'$meta': 'textScore'})]),
+        ('skip', 10),
+        ('limit', 5),
+    ]
+
+def test_nothing_to_search_for_returns_no_jobs(monkeypatch):
+    monkeypatch.setattr(job_search, 'get_db', lambda: None)
+
+    assert search_jobs('', 'jobs') == []
+    assert search_jobs(None, 'jobs', exclude=['driver']) == []
+    assert search_jobs('driver', 'jobs') == []
+
+def test_failed_search_returns_no_jobs(mongo_db):
+    # mongomock rejects $text, which goes down the same path as a missing text index
+    assert search_jobs('driver', 'jobs') == []
+
+def test_text_index_weighs_the_title_above_the_description():
+    text_index, = [model.document for model in job_index_models() if model.document['name'] == JOB_TEXT_INDEX_NAME]
+
+    assert list(text_index['key'].items()) == [('title', TEXT), ('description', TEXT)]
+    assert text_index['weights']['title'] > text_index['weights']['description']
+    assert text_index['language_override'] == JOB_TEXT_LANGUAGE_OVERRIDE != 'language'
@@ -0,0 +1,42 @@
+import io
+import json
+import os
+
+import pytest
+
+from jobs_project.json_stream import iter_array_items
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'jobs_project', 'jobs_project', 'data')
+
+@pytest.mark.parametrize('chunk_size', [1000, 65536])
+def test_streamed_jobs_match_json_load(chunk_size):
+    path = os.path.join(DATA_DIR, 's01.json')
+    with open(path, encoding='utf-8') as f:
+        expected = json.load(f)['jobs']
+    with open(path, encoding='utf-8') as f:
+        assert list(iter_array_items(f, 'jobs', chunk_size=chunk_size)) == expected
+
+def test_other_top_level_values_are_skipped():
+    document = '{"meta": {"jobs": [0]}, "count": 12.5, "jobs": [{"a": 1}, [2, 3], "x", 4.25, true, null], "tail": "y"}'
+    assert list(iter_array_items(io.StringIO(document), 'jobs', chunk_size=3)) == [{'a': 1}, [2, 3], 'x', 4.25, True, None]
+
+def test_number_split_by_a_chunk_is_not_truncated():
+    assert list(iter_array_items(io.StringIO('{"jobs": [12345.678, 9]}'), 'jobs', chunk_size=13)) == [12345.678, 9]
+
+@pytest.mark.parametrize('document', ['{}', '{"count": 1}', '{"jobs": []}'])
+def test_no_jobs(document):
+    assert list(iter_array_items(io.StringIO(document), 'jobs')) == []
+
+def test_items_before_a_malformed_element_are_yielded():
+    items = iter_array_items(io.StringIO('{"jobs": [{"a": 1}, {"b": ]}'), 'jobs', chunk_size=4)
+    assert next(items) == {'a': 1}
+    with pytest.raises(json.JSONDecodeError):
+        next(items)
+
+def test_jobs_must_be_a_list():
+    with pytest.raises(json.JSONDecodeError):
+        list(iter_array_items(io.StringIO('{"jobs": {"a": 1}}'), 'jobs'))
+
+def test_oversized_element_is_rejected():
+    with pytest.raises(json.JSONDecodeError):
+        list(iter_array_items(io.StringIO('{"jobs": ["' + 'x' * 100 + '"]}'), 'jobs', chunk_size=8, max_item_size=32))
@@ -0,0 +1,99 @@
+import io
+import logging
+
+import pytest
+from scrapy.exceptions import NotConfigured
+
+from infra import logging_utils
+from infra.logging_utils import AggregatedLog, SampledLog
+from jobs_project.extensions import QueueLogging
+
+class RecordingHandler(logging.Handler):
+    def __init__(self):
+        super().__init__()
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+@pytest.fixture
+def logger():
+    logger = logging.getLogger('tests.logging_utils')
+    handler = RecordingHandler()
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.messages = handler.messages
+    yield logger
+    logger.removeHandler(handler)
+
+def test_sampled_log_keeps_the_first_messages_then_every_nth(logger):
+    sampled = SampledLog(logger, logging.WARNING, first=2, every=3)
+
+    for number in range(1, 8):
+        sampled.log("Duplicate key %s", number)
+    sampled.log("Other message")
+
+    assert logger.messages == [
+        "Duplicate key 1",
+        "Duplicate key 2",
+        "Duplicate key 3 (3 occurrences so far, logging every 3-th)",
+        "Duplicate key 6 (6 occurrences so far, logging every 3-th)",
+        "Other message",
+    ]
+
+def test_aggregated_log_sums_the_counts_per_arguments(logger):
+    aggregated = AggregatedLog(logger, "Inserted %d items into %s", interval=3600)
+
+    aggregated.add(10, 'jobs')
+    aggregated.add(5, 'jobs')
+    aggregated.add(1, 'other')
+    assert logger.messages == []
+
+    aggregated.flush()
+    assert len(logger.messages) == 2
+    assert logger.messages[0].startswith("Inserted 15 items into jobs in the last ")
+    assert logger.messages[0].endswith("s (2 calls)")
+    assert logger.messages[1].startswith("Inserted 1 items into other")
+
+    aggregated.flush()
+    assert len(logger.messages) == 2
+
+def test_aggregated_log_emits_once_the_interval_passed(logger):
+    aggregated = AggregatedLog(logger, "Added %d new ids to %s", interval=0)
+
+    aggregated.add(3, 'seen')
+
+    assert logger.messages[0].startswith("Added 3 new ids to seen")
+
+def test_nothing_is_counted_below_the_logger_level(logger):
+    logger.setLevel(logging.WARNING)
+    aggregated = AggregatedLog(logger, "Inserted %d items into %s", interval=0)
+
+    aggregated.add(3, 'jobs')
+    aggregated.flush()
+
+    assert logger.messages == []
+    assert aggregated.totals == {}
+
+def test_queue_logging_writes_from_a_listener_thread_and_restores_the_handlers(monkeypatch):
+    root = logging.getLogger()
+    stream = io.StringIO()
+    handler = logging.StreamHandler(stream)
+    counter = RecordingHandler()
+    monkeypatch.setattr(root, 'handlers', [handler, counter])
+    monkeypatch.setattr(root, 'level', logging.INFO)
+
+    listener = logging_utils.start_queue_logging()
+    assert logging_utils.start_queue_logging() is listener
+    assert handler not in root.handlers and counter in root.handlers
+    logging.info("queued message")
+    logging_utils.stop_queue_logging()
+
+    assert stream.getvalue() == "queued message\n"
+    assert counter.messages == ["queued message"]
+    assert root.handlers == [counter, handler]
+
+def test_queue_logging_is_off_by_default(make_crawler):
+    with pytest.raises(NotConfigured):
+        QueueLogging.from_crawler(make_crawler())
+    assert QueueLogging.from_crawler(make_crawler({'LOG_QUEUE_ENABLED': True}))
@@ -0,0 +1,88 @@
+import os
+
+from jobs_project.manifest import STATUS_COMPLETE, STATUS_IN_PROGRESS, IngestionManifest
+
+def data_file(tmp_path, content='{"jobs": []}'):
+    path = tmp_path / 's01.json'
+    path.write_text(content, encoding='utf-8')
+    return str(path)
+
+def ingest(manifest, file_path, records):
+    manifest.begin(file_path, manifest.check(file_path))
+    items = [{'record': index} for index in range(records)]
+    for index, item in enumerate(items):
+        manifest.record_consumed(file_path, index, item)
+    manifest.file_parsed(file_path)
+    return items
+
+def test_new_file_starts_at_the_first_record(tmp_path):
+    manifest = IngestionManifest(str(tmp_path / 'manifest.json')).load()
+
+    assert manifest.check(data_file(tmp_path)) == 0
+
+def test_completed_file_is_skipped_by_a_later_crawl(tmp_path):
+    manifest_path = str(tmp_path / 'manifest.json')
+    file_path = data_file(tmp_path)
+    manifest = IngestionManifest(manifest_path).load()
+    for item in ingest(manifest, file_path, 3):
+        manifest.item_finished(item)
+
+    reloaded = IngestionManifest(manifest_path).load()
+    assert reloaded.files[file_path]['status'] == STATUS_COMPLETE
+    assert reloaded.files[file_path]['offset'] == 3
+    assert reloaded.check(file_path) is None
+
+def test_touched_but_identical_file_is_still_skipped(tmp_path):
+    manifest_path = str(tmp_path / 'manifest.json')
+    file_path = data_file(tmp_path)
+    manifest = IngestionManifest(manifest_path).load()
+    for item in ingest(manifest, file_path, 1):
+        manifest.item_finished(item)
+    stat = os.stat(file_path)
+    os.utime(file_path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+    manifest = IngestionManifest(manifest_path).load()
+    assert manifest.check(file_path) is None
+    assert manifest.files[file_path]['mtime_ns'] == stat.st_mtime_ns + 10**9
+
+def test_changed_file_is_parsed_again(tmp_path):
+    manifest_path = str(tmp_path / 'manifest.json')
+    file_path = data_file(tmp_path)
+    manifest = IngestionManifest(manifest_path).load()
+    for item in ingest(manifest, file_path, 1):
+        manifest.item_finished(item)
+    data_file(tmp_path, '{"jobs": [{"slug": "new"}]}')
+
+    manifest = IngestionManifest(manifest_path).load()
+    assert manifest.check(file_path) == 0
+    assert manifest.files[file_path]['status'] == STATUS_IN_PROGRESS
+
+def test_interrupted_file_resumes_before_its_first_item_in_flight(tmp_path):
+    manifest_path = str(tmp_path / 'manifest.json')
+    file_path = data_file(tmp_path)
+    manifest = IngestionManifest(manifest_path, checkpoint_interval=2).load()
+    items = ingest(manifest, file_path, 5)
+    # items 0, 1 and 3 went through the pipelines, 2 and 4 were in flight when the crawl died
+    for index in (0, 1, 3):
+        manifest.item_finished(items[index])
+    manifest.save()
+
+    reloaded = IngestionManifest(manifest_path).load()
+    assert reloaded.files[file_path]['status'] == STATUS_IN_PROGRESS
+    assert reloaded.check(file_path) == 2
+
+def test_skipped_records_move_the_checkpoint(tmp_path):
+    manifest = IngestionManifest(str(tmp_path / 'manifest.json')).load()
+    file_path = data_file(tmp_path)
+    manifest.begin(file_path, manifest.check(file_path))
+
+    manifest.record_consumed(file_path, 0)
+    manifest.record_consumed(file_path, 1)
+
+    assert manifest.safe_offset(file_path) == 2
+
+def test_unreadable_manifest_starts_empty(tmp_path):
+    manifest_path = tmp_path / 'manifest.json'
+    manifest_path.write_text('{not json', encoding='utf-8')
+
+    assert IngestionManifest(str(manifest_path)).load().files == {}
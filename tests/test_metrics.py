@@ -0,0 +1,104 @@
+import asyncio
+import urllib.request
+
+import pytest
+from twisted.internet import defer
+
+from infra import metrics
+from jobs_project.extensions import MetricsExporter
+
+@pytest.fixture(autouse=True)
+def empty_histograms(monkeypatch):
+    monkeypatch.setattr(metrics, 'histograms', {})
+
+def test_quantiles_interpolate_inside_the_bucket():
+    hist = metrics.Histogram(buckets=(1.0, 2.0, 4.0))
+    for seconds in (0.5, 1.5, 1.5, 3.0):
+        hist.observe(seconds)
+
+    assert hist.snapshot() == ([1, 2, 1, 0], 4, 6.5)
+    assert hist.quantile(0.5) == pytest.approx(1.5)
+    assert hist.quantile(1.0) == 3.0
+    assert metrics.Histogram().quantile(0.5) is None
+
+def test_timed_records_plain_async_and_failing_calls():
+    @metrics.timed('plain')
+    def plain(value):
+        return value
+
+    @metrics.timed('plain')
+    def failing():
+        raise ValueError('failed')
+
+    @metrics.timed('coroutine')
+    async def coroutine(value):
+        return value
+
+    assert plain(1) == 1
+    with pytest.raises(ValueError):
+        failing()
+    assert asyncio.run(coroutine(2)) == 2
+
+    assert metrics.histogram('plain').count == 2
+    assert metrics.histogram('coroutine').count == 1
+
+def test_deferreds_are_timed_once_they_fire():
+    deferred = defer.Deferred()
+
+    @metrics.timed('deferred')
+    def returns_deferred():
+        return deferred
+
+    results = []
+    returns_deferred().addCallback(results.append)
+    assert metrics.histogram('deferred').count == 0
+
+    deferred.callback('done')
+    assert results == ['done']
+    assert metrics.histogram('deferred').count == 1
+
+def test_timed_iter_times_every_value():
+    assert list(metrics.timed_iter(iter('abc'), 'spider/parse')) == ['a', 'b', 'c']
+    assert metrics.histogram('spider/parse').count == 3
+
+def test_summary_skips_unused_histograms():
+    metrics.observe('used', 0.002)
+    metrics.histogram('unused')
+
+    assert metrics.summary() == {'used': {'count': 1, 'mean_ms': 2.0, 'p50_ms': 2.0, 'p99_ms': 2.0}}
+
+def test_prometheus_text_has_cumulative_buckets_and_numeric_gauges():
+    metrics.observe('mongodb/insert_items', 0.0003)
+    metrics.observe('mongodb/insert_items', 20.0)
+
+    text = metrics.render_prometheus({'item_scraped_count': 2, 'finish_reason': 'finished', 'flag': True})
+
+    metric = f'{metrics.METRICS_NAMESPACE}_operation_duration_seconds'
+    assert f'{metric}_bucket{{operation="mongodb/insert_items",le="0.0005"}} 1' in text
+    assert f'{metric}_bucket{{operation="mongodb/insert_items",le="10.0"}} 1' in text
+    assert f'{metric}_bucket{{operation="mongodb/insert_items",le="+Inf"}} 2' in text
+    assert f'{metric}_count{{operation="mongodb/insert_items"}} 2' in text
+    assert f'{metrics.METRICS_NAMESPACE}_stat{{name="item_scraped_count"}} 2' in text
+    assert 'finish_reason' not in text and 'flag' not in text
+
+def test_http_endpoint_serves_the_metrics():
+    server = metrics.start_http_server(0, render=lambda: 'metric 1\n')
+    try:
+        url = f'http://127.0.0.1:{server.server_port}/metrics'
+        with urllib.request.urlopen(url) as response:
+            assert response.read() == b'metric 1\n'
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def test_exporter_publishes_the_latencies_to_the_stats_and_textfile(make_crawler, tmp_path):
+    textfile = tmp_path / 'jobs.prom'
+    crawler = make_crawler({'METRICS_INTERVAL': 0, 'METRICS_TEXTFILE_PATH': str(textfile)})
+    exporter = MetricsExporter.from_crawler(crawler)
+    metrics.observe('pipeline/mongodb', 0.001)
+
+    exporter.publish()
+
+    assert crawler.stats.get_value('latency/pipeline/mongodb/count') == 1
+    assert 'operation="pipeline/mongodb"' in textfile.read_text(encoding='utf-8')
+    assert f'{metrics.METRICS_NAMESPACE}_stat{{name="latency/pipeline/mongodb/count"}} 1' in textfile.read_text(encoding='utf-8')
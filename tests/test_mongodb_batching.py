@@ -0,0 +1,72 @@
+import pytest
+
+from jobs_project import pipelines
+from jobs_project.pipelines import MongoDBPipeline
+
+# close_spider bumps the query cache generation in Redis after a write
+pytestmark = pytest.mark.usefixtures('redis_server')
+
+MONGO_SETTINGS = {
+    'MONGO_COLLECTION': 'jobs',
+    'DUPEFILTER_KEY_FIELD': 'slug',
+    'MONGO_BATCH_FLUSH_INTERVAL': 0,
+    'MONGO_QUERY_INDEXES': False,
+}
+
+def open_pipeline(make_crawler, **settings):
+    crawler = make_crawler({**MONGO_SETTINGS, **settings})
+    pipeline = MongoDBPipeline.from_crawler(crawler)
+    pipeline.open_spider()
+    return pipeline, crawler.stats
+
+def test_items_are_buffered_until_the_batch_is_full(mongo_db, make_crawler, monkeypatch):
+    calls = []
+    insert_items = pipelines.insert_items
+    def counting_insert_items(items, collection_name, ordered=False):
+        calls.append(len(items))
+        return insert_items(items, collection_name, ordered=ordered)
+    monkeypatch.setattr(pipelines, 'insert_items', counting_insert_items)
+    pipeline, stats = open_pipeline(make_crawler, MONGO_BATCH_SIZE=3)
+
+    for number in range(5):
+        pipeline.process_item({'slug': f'job-{number}'})
+    assert calls == [3]
+    assert mongo_db.jobs.count_documents({}) == 3
+
+    pipeline.close_spider()
+    assert calls == [3, 2]
+    assert mongo_db.jobs.count_documents({}) == 5
+    assert stats.get_value('mongodb/inserted_items') == 5
+
+def test_duplicate_key_does_not_reject_the_rest_of_the_batch(mongo_db, make_crawler):
+    pipeline, stats = open_pipeline(make_crawler, MONGO_BATCH_SIZE=3)
+
+    for slug in ('a', 'a', 'b'):
+        pipeline.process_item({'slug': slug})
+
+    assert sorted(document['slug'] for document in mongo_db.jobs.find()) == ['a', 'b']
+    assert stats.get_value('mongodb/inserted_items') == 2
+    assert stats.get_value('mongodb/duplicate_key_error') == 1
+    pipeline.close_spider()
+
+def test_failed_batch_counts_every_item(mongo_db, make_crawler, monkeypatch):
+    monkeypatch.setattr(pipelines, 'insert_items', lambda items, collection_name, ordered=False: None)
+    pipeline, stats = open_pipeline(make_crawler, MONGO_BATCH_SIZE=2)
+
+    pipeline.process_item({'slug': 'a'})
+    pipeline.process_item({'slug': 'b'})
+
+    assert stats.get_value('mongodb/failed_inserts') == 2
+    pipeline.close_spider()
+
+def test_batch_size_one_inserts_item_by_item(mongo_db, make_crawler):
+    pipeline, stats = open_pipeline(make_crawler, MONGO_BATCH_SIZE=1)
+
+    pipeline.process_item({'slug': 'a'})
+    pipeline.process_item({'slug': 'a'})
+
+    assert mongo_db.jobs.count_documents({}) == 1
+    assert stats.get_value('mongodb/inserted_items') == 1
+    # insert_item logs the duplicate key error and returns None
+    assert stats.get_value('mongodb/failed_inserts') == 1
+    pipeline.close_spider()
@@ -0,0 +1,92 @@
+from datetime import datetime
+
+from bson import ObjectId
+
+from infra import query_cache
+from infra.query_cache import bump_generation, cache_key, cached_find_item, cached_find_jobs_page, read_through
+from jobs_project.pipelines import MongoDBPipeline
+
+class CountingLoader:
+    def __init__(self, value):
+        self.value = value
+        self.calls = 0
+
+    def __call__(self):
+        self.calls += 1
+        return self.value
+
+def test_equal_queries_share_a_key():
+    first = cache_key('jobs', 'find_item', {'brand': 'A', 'city': 'Dallas'}, {'slug': 1})
+
+    assert cache_key('jobs', 'find_item', {'city': 'Dallas', 'brand': 'A'}, {'slug': 1}) == first
+    assert cache_key('jobs', 'find_item', {'brand': 'B', 'city': 'Dallas'}, {'slug': 1}) != first
+    assert cache_key('jobs', 'find_jobs_page', {'brand': 'A', 'city': 'Dallas'}, {'slug': 1}) != first
+    assert cache_key('other', 'find_item', {'brand': 'A', 'city': 'Dallas'}, {'slug': 1}).startswith(f'{query_cache.QUERY_CACHE_PREFIX}:other:')
+
+def test_second_read_is_served_from_redis(redis_server):
+    value = [{'_id': ObjectId(), 'update_date': datetime(2024, 1, 2, 3, 4, 5)}]
+    loader = CountingLoader(value)
+
+    assert read_through('jobs', 'key', loader) == value
+    assert read_through('jobs', 'key', loader) == value
+
+    assert loader.calls == 1
+    assert 0 < redis_server.ttl('key') <= query_cache.QUERY_CACHE_TTL
+
+def test_bumped_generation_invalidates_the_entries(redis_server):
+    loader = CountingLoader(['result'])
+    read_through('jobs', 'key', loader)
+    read_through('other', 'other-key', loader)
+
+    assert bump_generation('jobs') == 1
+    read_through('jobs', 'key', loader)
+    read_through('jobs', 'key', loader)
+    read_through('other', 'other-key', loader)
+
+    assert loader.calls == 3
+
+def test_none_and_oversized_results_are_not_cached(redis_server, monkeypatch):
+    missing = CountingLoader(None)
+    read_through('jobs', 'missing', missing)
+    read_through('jobs', 'missing', missing)
+    assert missing.calls == 2
+
+    monkeypatch.setattr(query_cache, 'QUERY_CACHE_MAX_BYTES', 16)
+    large = CountingLoader(['x' * 1000])
+    read_through('jobs', 'large', large)
+    read_through('jobs', 'large', large)
+    assert large.calls == 2
+    assert not redis_server.exists('large')
+
+def test_queries_go_to_mongodb_while_redis_is_down(monkeypatch):
+    monkeypatch.setattr(query_cache, 'get_redis_binary_connection', lambda: None)
+    loader = CountingLoader(['result'])
+
+    assert read_through('jobs', 'key', loader) == ['result']
+    assert read_through('jobs', 'key', loader) == ['result']
+    assert loader.calls == 2
+    assert bump_generation('jobs') is None
+
+def test_cached_pages_keep_their_next_key(redis_server, mongo_db):
+    mongo_db.jobs.insert_many([{'slug': f'job-{number}', 'update_date': datetime(2024, 1, number + 1)} for number in range(3)])
+
+    documents, after = cached_find_jobs_page({}, 'jobs', limit=2)
+    mongo_db.jobs.delete_many({})
+
+    assert cached_find_jobs_page({}, 'jobs', limit=2) == (documents, after)
+    assert isinstance(after, tuple) and after[0] == datetime(2024, 1, 2)
+    assert cached_find_item({}, 'jobs') == []
+    bump_generation('jobs')
+    assert cached_find_jobs_page({}, 'jobs', limit=2) == ([], None)
+
+def test_a_crawl_that_wrote_bumps_the_generation(redis_server, mongo_db, make_crawler):
+    settings = {'MONGO_COLLECTION': 'jobs', 'DUPEFILTER_KEY_FIELD': 'slug', 'MONGO_QUERY_INDEXES': False}
+    for items in ([], [{'slug': 'a'}], [{'slug': 'a'}]):
+        pipeline = MongoDBPipeline.from_crawler(make_crawler(settings))
+        pipeline.open_spider()
+        for item in items:
+            pipeline.process_item(item)
+        pipeline.close_spider()
+
+    # the second copy of a is a duplicate key, that crawl did not write
+    assert redis_server.get(query_cache.generation_key('jobs')) == '1'
@@ -0,0 +1,87 @@
+import asyncio
+
+import pytest
+from scrapy.exceptions import DropItem
+
+from jobs_project import pipelines
+from jobs_project.pipelines import RedisDeduplicationPipeline
+
+DEDUP_SETTINGS = {
+    'DUPEFILTER_KEY_FIELD': 'slug',
+    'REDIS_DEDUP_BATCH_SIZE': 1,
+    'REDIS_DEDUP_FLUSH_INTERVAL': 0,
+    'BLOOM_FILTER_ENABLED': False,
+}
+
+def open_pipeline(make_crawler, **settings):
+    crawler = make_crawler({**DEDUP_SETTINGS, **settings})
+    pipeline = RedisDeduplicationPipeline.from_crawler(crawler)
+    pipeline.open_spider()
+    return pipeline, crawler.stats
+
+'''
+Runs process_item for every item concurrently, returns the item or the DropItem of each
+'''
+async def process_all(pipeline, items, close=False):
+    tasks = [asyncio.ensure_future(pipeline.process_item(item)) for item in items]
+    await asyncio.sleep(0)
+    if close:
+        pipeline.close_spider()
+    return await asyncio.gather(*tasks, return_exceptions=True)
+
+def test_new_item_passes_and_duplicate_is_dropped(redis_server, make_crawler):
+    pipeline, stats = open_pipeline(make_crawler)
+    item = {'slug': 'job-1', 'title': 'Engineer'}
+
+    assert asyncio.run(pipeline.process_item(item)) is item
+    with pytest.raises(DropItem) as dropped:
+        asyncio.run(pipeline.process_item({'slug': 'job-1', 'title': 'Engineer'}))
+
+    assert dropped.value.log_level == 'DEBUG'
+    assert redis_server.smembers('JobProjectSpider:seen_ids') == {'job-1'}
+    assert stats.get_value('redis/new_items') == 1
+    assert stats.get_value('redis/duplicate_items') == 1
+
+def test_batch_is_checked_in_one_round_trip(redis_server, make_crawler, monkeypatch):
+    calls = []
+    add_many_to_set = pipelines.add_many_to_set
+    def counting_add_many_to_set(set_name, values):
+        calls.append(list(values))
+        return add_many_to_set(set_name, values)
+    monkeypatch.setattr(pipelines, 'add_many_to_set', counting_add_many_to_set)
+    pipeline, stats = open_pipeline(make_crawler, REDIS_DEDUP_BATCH_SIZE=3)
+    items = [{'slug': 'a'}, {'slug': 'b'}, {'slug': 'a'}]
+
+    results = asyncio.run(process_all(pipeline, items))
+
+    assert calls == [['a', 'b', 'a']]
+    assert results[0] is items[0] and results[1] is items[1]
+    # the later copy of an id in the same batch is the duplicate
+    assert isinstance(results[2], DropItem)
+    assert stats.get_value('redis/new_items') == 2
+    assert stats.get_value('redis/duplicate_items') == 1
+
+def test_partial_batch_is_answered_when_the_spider_closes(redis_server, make_crawler):
+    pipeline, _ = open_pipeline(make_crawler, REDIS_DEDUP_BATCH_SIZE=10)
+    items = [{'slug': 'a'}, {'slug': 'b'}]
+
+    results = asyncio.run(process_all(pipeline, items, close=True))
+
+    assert results == items
+    assert redis_server.smembers('JobProjectSpider:seen_ids') == {'a', 'b'}
+
+def test_item_is_kept_when_redis_fails(redis_server, make_crawler, monkeypatch):
+    monkeypatch.setattr(pipelines, 'add_many_to_set', lambda set_name, values: None)
+    pipeline, stats = open_pipeline(make_crawler, REDIS_DEDUP_BATCH_SIZE=2)
+    items = [{'slug': 'a'}, {'slug': 'a'}]
+
+    assert asyncio.run(process_all(pipeline, items)) == items
+    assert stats.get_value('redis/errors') == 2
+
+def test_item_without_key_is_passed_unchecked(redis_server, make_crawler):
+    pipeline, stats = open_pipeline(make_crawler)
+    item = {'title': 'No slug'}
+
+    assert asyncio.run(pipeline.process_item(item)) is item
+    assert stats.get_value('redis/skipped_no_id') == 1
+    assert not redis_server.exists('JobProjectSpider:seen_ids')
@@ -0,0 +1,120 @@
+import random
+import threading
+
+import pytest
+from bson.binary import Binary
+
+from infra import text_codec
+from infra.job_queries import find_jobs_page
+from jobs_project.pipelines import MongoDBPipeline
+
+pytest.importorskip('zstandard')
+
+BOILERPLATE = (
+    "We are an equal opportunity employer and value diversity at our company. We do not discriminate on the "
+    "basis of race, religion, color, national origin, gender, sexual orientation, age, marital status, veteran "
+    "status, or disability status. Benefits include medical, dental and vision coverage, paid time off, a 401(k) "
+    "plan with company match, employee discounts and tuition reimbursement. "
+)
+ROLES = ['Parts Sales Manager', 'Delivery Driver', 'Store Manager', 'Commercial Specialist', 'Retail Associate']
+CITIES = ['Dallas', 'Austin', 'Memphis', 'Denver', 'Phoenix', 'Atlanta']
+
+CODEC_SETTINGS = {
+    'MONGO_COLLECTION': 'jobs',
+    'DUPEFILTER_KEY_FIELD': 'slug',
+    'MONGO_QUERY_INDEXES': False,
+    'MONGO_TEXT_CODEC': True,
+    'MONGO_TEXT_CODEC_FIELDS': ['description', 'meta_data'],
+    'MONGO_TEXT_CODEC_DICT_SIZE': 8192,
+}
+
+'''
+Descriptions sharing the boilerplate of a brand around a few varying sentences, as the postings of a feed do
+'''
+def make_descriptions(count, seed=0):
+    rng = random.Random(seed)
+    descriptions = []
+    for number in range(count):
+        role, city = rng.choice(ROLES), rng.choice(CITIES)
+        descriptions.append(f"Join our team as a {role} in {city}. Requisition {number}, {rng.randint(20, 60)} hours a week. " + BOILERPLATE)
+    return descriptions
+
+@pytest.fixture(autouse=True)
+def fresh_decompressors(monkeypatch):
+    monkeypatch.setattr(text_codec, 'decompressors', threading.local())
+
+def test_values_round_trip_through_the_stored_dictionary(mongo_db, monkeypatch):
+    codec = text_codec.train_codec(mongo_db, 'jobs', make_descriptions(200), fields=('description', 'meta_data'), dict_size=8192)
+    description = make_descriptions(1, seed=1)[0]
+    document = {'slug': 'a', 'description': description, 'meta_data': {'function': 'Sales', 'notes': BOILERPLATE}, 'title': 'kept'}
+
+    raw_bytes, stored_bytes = codec.encode_document(document)
+
+    assert isinstance(document['description'], Binary) and document['description'].subtype == text_codec.TEXT_SUBTYPE
+    assert document['meta_data'].subtype == text_codec.DOCUMENT_SUBTYPE
+    assert stored_bytes < raw_bytes / 3
+    # the dictionary is read back from MongoDB by a process that did not train it
+    monkeypatch.setattr(text_codec, 'dictionaries', {})
+    text_codec.decode_document(document, mongo_db)
+    assert document == {'slug': 'a', 'description': description, 'meta_data': {'function': 'Sales', 'notes': BOILERPLATE}, 'title': 'kept'}
+
+def test_values_that_do_not_shrink_stay_in_the_clear(mongo_db):
+    codec = text_codec.train_codec(mongo_db, 'jobs', make_descriptions(200), dict_size=8192)
+    document = {'description': 'x', 'meta_data': {'a': 1}}
+
+    assert codec.encode_document(document) == (1, 1)
+    assert document == {'description': 'x', 'meta_data': {'a': 1}}
+
+def test_retraining_keeps_the_older_versions_readable(mongo_db, monkeypatch):
+    first = text_codec.train_codec(mongo_db, 'jobs', make_descriptions(200), dict_size=8192)
+    old_document = {'description': make_descriptions(1, seed=2)[0]}
+    first.encode_document(old_document)
+
+    second = text_codec.train_codec(mongo_db, 'jobs', make_descriptions(200, seed=3), dict_size=4096)
+
+    assert (first.version, second.version) == (1, 2)
+    assert text_codec.load_codec(mongo_db, 'jobs').version == 2
+    assert text_codec.load_codec(mongo_db, 'other') is None
+    monkeypatch.setattr(text_codec, 'dictionaries', {})
+    assert text_codec.decode_document(old_document, mongo_db)['description'] == make_descriptions(1, seed=2)[0]
+
+def test_unknown_dictionary_leaves_the_value_encoded(mongo_db, monkeypatch):
+    codec = text_codec.train_codec(mongo_db, 'jobs', make_descriptions(200), dict_size=8192)
+    document = {'description': make_descriptions(1)[0]}
+    codec.encode_document(document)
+    encoded = document['description']
+    monkeypatch.setattr(text_codec, 'dictionaries', {})
+    mongo_db[text_codec.TEXT_CODEC_COLLECTION].delete_many({})
+
+    assert text_codec.decode_document(document, mongo_db)['description'] is encoded
+
+def test_too_small_sample_trains_no_codec(mongo_db):
+    assert text_codec.train_codec(mongo_db, 'jobs', ['tiny'], dict_size=8192) is None
+    assert mongo_db[text_codec.TEXT_CODEC_COLLECTION].count_documents({}) == 0
+
+def test_pipeline_trains_on_the_first_items_then_compresses(redis_server, mongo_db, make_crawler):
+    descriptions = make_descriptions(150)
+    crawler = make_crawler({**CODEC_SETTINGS, 'MONGO_TEXT_CODEC_TRAIN_SAMPLES': 100})
+    pipeline = MongoDBPipeline.from_crawler(crawler)
+    pipeline.open_spider()
+
+    for number, description in enumerate(descriptions):
+        pipeline.process_item({'slug': f'job-{number}', 'description': description})
+    pipeline.close_spider()
+
+    stored = {document['slug']: document for document in mongo_db.jobs.find()}
+    assert isinstance(stored['job-0']['description'], str)
+    assert isinstance(stored['job-149']['description'], Binary)
+    assert crawler.stats.get_value('mongodb/codec_stored_bytes') < crawler.stats.get_value('mongodb/codec_raw_bytes')
+    documents, _ = find_jobs_page({}, 'jobs', limit=200)
+    assert sorted(document['description'] for document in documents) == sorted(descriptions)
+
+def test_next_crawl_uses_the_stored_dictionary(redis_server, mongo_db, make_crawler):
+    text_codec.train_codec(mongo_db, 'jobs', make_descriptions(200), dict_size=8192)
+    pipeline = MongoDBPipeline.from_crawler(make_crawler(CODEC_SETTINGS))
+    pipeline.open_spider()
+
+    pipeline.process_item({'slug': 'a', 'description': make_descriptions(1)[0]})
+    pipeline.close_spider()
+
+    assert isinstance(mongo_db.jobs.find_one({'slug': 'a'})['description'], Binary)
@@ -0,0 +1,97 @@
+import asyncio
+
+import pytest
+from scrapy.exceptions import DropItem
+
+from infra import redis_connector
+from jobs_project.items import JobsProjectItem
+from jobs_project.pipelines import CONTENT_HASH_FIELD, MongoDBPipeline, RedisDeduplicationPipeline, content_hash
+
+UPSERT_SETTINGS = {
+    'MONGO_COLLECTION': 'jobs',
+    'MONGO_WRITE_MODE': 'upsert',
+    'DUPEFILTER_KEY_FIELD': 'slug',
+    'MONGO_BATCH_FLUSH_INTERVAL': 0,
+    'MONGO_QUERY_INDEXES': False,
+    'REDIS_DEDUP_BATCH_SIZE': 1,
+    'BLOOM_FILTER_ENABLED': False,
+}
+
+def crawl(make_crawler, items, dedup=False, **settings):
+    crawler = make_crawler({**UPSERT_SETTINGS, **settings})
+    mongo = MongoDBPipeline.from_crawler(crawler)
+    mongo.open_spider()
+    redis = None
+    if dedup:
+        redis = RedisDeduplicationPipeline.from_crawler(crawler)
+        redis.open_spider()
+    for item in items:
+        if redis is not None:
+            try:
+                item = asyncio.run(redis.process_item(item))
+            except DropItem:
+                continue
+        mongo.process_item(item)
+    mongo.close_spider()
+    if redis is not None:
+        redis.close_spider()
+    return crawler.stats
+
+def test_content_hash_does_not_depend_on_the_field_order():
+    assert content_hash({'a': 1, 'b': [1, 2]}) == content_hash({'b': [1, 2], 'a': 1})
+    assert content_hash({'a': 1}) != content_hash({'a': 2})
+
+@pytest.mark.parametrize('batch_size', [1, 10])
+def test_only_new_and_changed_items_are_written(redis_server, mongo_db, make_crawler, batch_size):
+    first = [{'slug': 'a', 'title': 'A'}, {'slug': 'b', 'title': 'B', 'brand': 'X'}]
+    crawl(make_crawler, [JobsProjectItem(fields) for fields in first], MONGO_BATCH_SIZE=batch_size)
+
+    second = [{'slug': 'a', 'title': 'A'}, {'slug': 'b', 'title': 'B2'}, {'slug': 'c', 'title': 'C'}]
+    stats = crawl(make_crawler, [JobsProjectItem(fields) for fields in second], MONGO_BATCH_SIZE=batch_size)
+
+    assert stats.get_value('mongodb/inserted_items') == 1
+    assert stats.get_value('mongodb/updated_items') == 1
+    assert stats.get_value('mongodb/unchanged_items') == 1
+    documents = {document['slug']: document for document in mongo_db.jobs.find()}
+    assert documents['b']['title'] == 'B2'
+    # a field dropped from the feed is removed from the stored document
+    assert 'brand' not in documents['b']
+    assert documents['b'][CONTENT_HASH_FIELD] == content_hash({'slug': 'b', 'title': 'B2'})
+    assert mongo_db.jobs.count_documents({}) == 3
+
+def test_last_copy_of_a_key_in_a_batch_wins(redis_server, mongo_db, make_crawler):
+    stats = crawl(make_crawler, [{'slug': 'a', 'title': 'old'}, {'slug': 'a', 'title': 'new'}], MONGO_BATCH_SIZE=10)
+
+    assert mongo_db.jobs.find_one({'slug': 'a'})['title'] == 'new'
+    assert stats.get_value('mongodb/superseded_items') == 1
+    assert stats.get_value('mongodb/inserted_items') == 1
+
+def test_items_without_a_key_are_inserted(redis_server, mongo_db, make_crawler):
+    stats = crawl(make_crawler, [{'title': 'no slug'}, {'slug': 'a'}], MONGO_BATCH_SIZE=10)
+
+    assert stats.get_value('mongodb/inserted_items') == 2
+
+def test_unchanged_postings_are_dropped_by_the_dedup_stage(redis_server, mongo_db, make_crawler):
+    crawl(make_crawler, [{'slug': 'a', 'title': 'A'}, {'slug': 'b', 'title': 'B'}], dedup=True)
+
+    stats = crawl(make_crawler, [{'slug': 'a', 'title': 'A'}, {'slug': 'b', 'title': 'B2'}], dedup=True)
+
+    assert stats.get_value('redis/duplicate_items') == 1
+    assert stats.get_value('mongodb/unchanged_items') == 1
+    assert stats.get_value('mongodb/updated_items') == 1
+    assert redis_server.hget('JobProjectSpider:seen_content', 'b') == content_hash({'slug': 'b', 'title': 'B2'})
+    assert redis_server.hlen('JobProjectSpider:seen_content') == 2
+
+def test_store_many_if_changed(redis_server):
+    assert redis_connector.store_many_if_changed('content', [('a', '1'), ('b', '1')]) == [True, True]
+    assert redis_connector.store_many_if_changed('content', [('a', '1'), ('b', '2'), ('b', '2')]) == [False, True, False]
+    assert dict(redis_connector.scan_content_hashes('content')) == {'a': '1', 'b': '2'}
+    assert redis_connector.content_hashes_size('content') == 2
+
+def test_hashed_content_storage(redis_server):
+    options = {'hashed': True, 'buckets': 4}
+
+    assert redis_connector.store_many_if_changed('content', [('a', '1')], **options) == [True]
+    assert redis_connector.store_many_if_changed('content', [('a', '1')], **options) == [False]
+    assert redis_connector.store_many_if_changed('content', [('a', '2')], **options) == [True]
+    assert redis_connector.content_hashes_size('content', hashed=True) == 1
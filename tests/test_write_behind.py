@@ -0,0 +1,154 @@
+import threading
+from types import SimpleNamespace
+
+from bson import ObjectId, json_util
+
+from jobs_project.pipelines import MongoDBPipeline
+from jobs_project.write_behind import WriteBehindWriter, WriteJournal
+
+WRITE_BEHIND_SETTINGS = {
+    'MONGO_COLLECTION': 'jobs',
+    'DUPEFILTER_KEY_FIELD': 'slug',
+    'MONGO_BATCH_FLUSH_INTERVAL': 0,
+    'MONGO_QUERY_INDEXES': False,
+    'MONGO_WRITE_BEHIND': True,
+}
+
+class FlakyMongo:
+    """
+        write_batch and is_available of a MongoDB that takes writes only while up is set
+    """
+    def __init__(self, up=True):
+        self.up = up
+        self.written = []
+
+    def write_batch(self, batch):
+        if not self.up:
+            return False
+        self.written.extend(batch)
+        return True
+
+    def is_available(self):
+        return self.up
+
+def make_writer(mongo, journal_path, events=None, **kwargs):
+    on_event = None if events is None else lambda name, count: events.append((name, count))
+    return WriteBehindWriter(mongo.write_batch, mongo.is_available, str(journal_path), retry_interval=3600, on_event=on_event, **kwargs)
+
+def test_batches_are_written_in_order(tmp_path):
+    mongo = FlakyMongo()
+    writer = make_writer(mongo, tmp_path / 'journal.jsonl').start()
+
+    writer.submit([{'n': 1}, {'n': 2}])
+    writer.close([[{'n': 3}]])
+
+    assert mongo.written == [{'n': 1}, {'n': 2}, {'n': 3}]
+    assert not (tmp_path / 'journal.jsonl').exists()
+
+def test_batches_mongodb_did_not_take_are_journaled_and_replayed_on_close(tmp_path):
+    mongo = FlakyMongo(up=False)
+    events = []
+    writer = make_writer(mongo, tmp_path / 'journal.jsonl', events).start()
+    drained = threading.Event()
+    writer.on_drained = drained.set
+
+    writer.submit([{'n': 1}])
+    assert drained.wait(5)
+    assert (tmp_path / 'journal.jsonl').exists()
+    mongo.up = True
+    # journaled behind the first batch although MongoDB is back, to keep the order
+    writer.close([[{'n': 2}]])
+
+    assert mongo.written == [{'n': 1}, {'n': 2}]
+    assert events == [('journaled_items', 1), ('journaled_items', 1), ('replayed_items', 2)]
+    assert not (tmp_path / 'journal.jsonl').exists()
+
+def test_journal_of_an_earlier_crawl_is_replayed_on_start(tmp_path):
+    journal_path = tmp_path / 'journal.jsonl'
+    object_id = ObjectId()
+    WriteJournal(str(journal_path)).append([{'_id': object_id, 'n': 1}])
+    mongo = FlakyMongo()
+
+    writer = make_writer(mongo, journal_path).start()
+    writer.close([[{'n': 2}]])
+
+    assert mongo.written == [{'_id': object_id, 'n': 1}, {'n': 2}]
+
+def test_replay_keeps_the_failed_batch_and_the_rest(tmp_path):
+    journal_path = tmp_path / 'journal.jsonl'
+    WriteJournal(str(journal_path)).append([{'n': n} for n in range(5)])
+    writes = []
+    def write_batch(batch):
+        writes.append(batch)
+        return len(writes) == 1
+    writer = WriteBehindWriter(write_batch, lambda: True, str(journal_path), batch_size=2)
+
+    assert writer.replay() is False
+
+    assert writes == [[{'n': 0}, {'n': 1}], [{'n': 2}, {'n': 3}]]
+    lines = journal_path.read_text(encoding='utf-8').splitlines()
+    assert [json_util.loads(line) for line in lines] == [{'n': 2}, {'n': 3}, {'n': 4}]
+    assert writer.journal.pending
+
+def test_replay_waits_for_mongodb(tmp_path):
+    journal_path = tmp_path / 'journal.jsonl'
+    WriteJournal(str(journal_path)).append([{'n': 1}])
+    mongo = FlakyMongo(up=False)
+
+    assert make_writer(mongo, journal_path).replay() is False
+    assert journal_path.exists()
+
+def test_unreadable_journal_lines_are_skipped(tmp_path):
+    journal_path = tmp_path / 'journal.jsonl'
+    journal_path.write_text('{"n": 1}\n\n{"n": 2\n{"n": 3}\n', encoding='utf-8')
+    journal = WriteJournal(str(journal_path))
+
+    with open(journal_path, encoding='utf-8') as f:
+        batches = list(journal.iter_batches(f, 10))
+
+    assert journal.pending
+    assert [documents for _, documents in batches] == [[{'n': 1}, {'n': 3}]]
+
+def test_submit_does_not_block_on_a_full_queue(tmp_path):
+    writer = make_writer(FlakyMongo(), tmp_path / 'journal.jsonl', max_batches=1)
+
+    assert writer.submit([{'n': 1}]) is True
+    assert writer.submit([{'n': 2}]) is False
+    assert writer.pending_batches() == 1
+
+def test_full_queue_pauses_the_crawl_until_the_writer_caught_up(redis_server, mongo_db, make_crawler, tmp_path):
+    crawler = make_crawler({**WRITE_BEHIND_SETTINGS, 'MONGO_WRITE_QUEUE_SIZE': 2, 'MONGO_WRITE_JOURNAL_PATH': str(tmp_path / 'journal.jsonl')})
+    engine_calls = []
+    crawler.engine = SimpleNamespace(pause=lambda: engine_calls.append('pause'), unpause=lambda: engine_calls.append('unpause'))
+    pipeline = MongoDBPipeline.from_crawler(crawler)
+    pipeline.configure(crawler.spider)
+    # a writer that is not started, so the queue only drains when the test says so
+    pipeline.writer = WriteBehindWriter(lambda batch: pipeline.write_batch(batch, None), lambda: True, pipeline.journal_path, max_batches=2)
+
+    for number in range(4):
+        pipeline.submit_batch([{'slug': f'job-{number}'}])
+    assert engine_calls == ['pause']
+    assert len(pipeline.blocked_batches) == 2
+    assert crawler.stats.get_value('mongodb/backpressure_pauses') == 1
+
+    pipeline.writer.batches.get_nowait()
+    pipeline.writer_drained()
+    assert engine_calls == ['pause']
+    pipeline.writer.batches.get_nowait()
+    pipeline.writer.batches.get_nowait()
+    pipeline.writer_drained()
+    assert engine_calls == ['pause', 'unpause']
+    assert pipeline.blocked_batches == []
+
+def test_pipeline_writes_behind_and_counts_on_close(redis_server, mongo_db, make_crawler, tmp_path):
+    crawler = make_crawler({**WRITE_BEHIND_SETTINGS, 'MONGO_BATCH_SIZE': 2, 'MONGO_WRITE_JOURNAL_PATH': str(tmp_path / 'journal.jsonl')})
+    pipeline = MongoDBPipeline.from_crawler(crawler)
+    pipeline.open_spider()
+
+    for number in range(5):
+        pipeline.process_item({'slug': f'job-{number}'})
+    pipeline.close_spider()
+
+    assert mongo_db.jobs.count_documents({}) == 5
+    assert crawler.stats.get_value('mongodb/inserted_items') == 5
+    assert not (tmp_path / 'journal.jsonl').exists()